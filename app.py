@@ -1,36 +1,64 @@
-from fastapi import FastAPI, Request
+import os
+import time
+import uuid
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, FastAPI, Request
 from typing import Optional
 from uvicorn import run as app_run
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from shipment.utils.main_utils import MainUtils
-from shipment.logger import logging
-from shipment.pipeline.training_pipeline import TrainPipeline
+from shipment.logger import configure_logging, logging
 from shipment.components.model_predictor import CostPredictor, ShippingData
-from shipment.constant import APP_HOST, APP_PORT
-
-# Create FastAPI app instance
-app = FastAPI()
-
-# Mount the static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+from shipment.monitoring.metrics import REGISTRY, ERRORS, PREDICT_LATENCY
+from shipment.monitoring.prediction_log import PredictionLogger
+from shipment.monitoring.profiler import profile_request, should_profile_request
+from shipment.constant import (
+    APP_HOST,
+    APP_PORT,
+    SHIPPING_DATA_FIELDS,
+    PROFILE_REQUEST_HEADER,
+    PROFILE_REQUEST_INTERVAL,
+    PROFILE_REQUEST_SAMPLE_RATE_ENV_KEY,
+    PROFILE_REQUEST_TOKEN_ENV_KEY,
+    REQUEST_PROFILES_DIR,
+    BATCH_PREDICT_MAX_ROWS,
+    EXPLAIN_MAX_ROWS,
+    SWEEP_MAX_FIELDS,
+    SWEEP_MAX_POINTS,
+    SERVING_PREPROCESSING_ENV_KEY,
+    SERVING_PREPROCESSING_COLUMN_TRANSFORMER,
+    SERVING_BACKEND_ENV_KEY,
+    SERVING_BACKEND_PYTHON,
+    ONNX_INTRA_OP_THREADS_ENV_KEY,
+    ONNX_INTRA_OP_THREADS,
+    EXPLAIN_CACHE_SIZE_ENV_KEY,
+    EXPLAIN_CACHE_SIZE,
+    PREDICTION_LOG_ENABLED_ENV_KEY,
+)
+from shipment.utils.columnar_codec import COLUMNAR_MEDIA_TYPES, read_columns, write_predictions
 
 # Initialize Jinja2 templates
 templates = Jinja2Templates(directory='templates')
 
+# Shared predictor, the model is loaded once and reused across requests, and the
+# predictions written to MongoDB in the background, both created by create_app
+cost_predictor: CostPredictor = None
+prediction_logger: Optional[PredictionLogger] = None
+# Token and sampled share of the profiled /predict requests, read by create_app
+profile_request_token: str = ""
+profile_request_sample_rate: float = 0.0
+
 # Define allowed origins for CORS
 origins = ["*"]
 
-# Add CORS middleware to the FastAPI app
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Routes of the prediction service, and the training route left out by the serving-only entry point
+serving_router = APIRouter()
+training_router = APIRouter()
 
 # Class to handle form data
 class DataForm:
@@ -71,20 +99,26 @@ class DataForm:
 
 
 # Route to trigger the training pipeline
-@app.get("/train")
-async def trainRouteClient():
+@training_router.get("/train")
+async def trainRouteClient(profile: Optional[bool] = None, warm_start: bool = False, if_drifted: bool = False):
     try:
-        train_pipeline = TrainPipeline()
+        # The training dependencies are imported with the first training run, not with the app
+        from shipment.pipeline.training_pipeline import TrainPipeline
+
+        train_pipeline = TrainPipeline(profile=profile, warm_start=warm_start, if_drifted=if_drifted)
         train_pipeline.run_pipeline()
+        # Serving the pushed model from the next request rather than after the refresh interval
+        CostPredictor.invalidate_model()
 
         return Response(status_code=200)
     except Exception as e:
+        ERRORS.labels(route="/train", reason="exception").inc()
         logging.error(e)
         return Response(f"status_code=500: Error occurred {e}")
 
 
 # Route to render the prediction form
-@app.get("/predict")
+@serving_router.get("/predict")
 async def predictGetRouteClient(request: Request):
     try:
         #css_url = request.url_for('static', path='css/style.css')
@@ -96,46 +130,289 @@ async def predictGetRouteClient(request: Request):
         logging.error(e)
         return Response(f"status_code=500: Error occurred -> {e}") 
 
-@app.post("/predict")
+@serving_router.post("/predict")
 async def predictRouteClient(request: Request):
     try:
-        form = DataForm(request)
-        await form.get_shipping_data()
-
-        shipping_data = ShippingData(
-            artist=form.artist,
-            height=form.height,
-            width=form.width,
-            weight=form.weight,
-            material=form.material,
-            priceOfSculpture=form.priceOfSculpture,
-            baseShippingPrice=form.baseShippingPrice,
-            international=form.international,
-            expressShipment=form.expressShipment,
-            installationIncluded=form.installationIncluded,
-            transport=form.transport,
-            fragile=form.fragile,
-            customerInformation=form.customerInformation,
-            remoteLocation=form.remoteLocation,
-        )
+        start_time = time.perf_counter()
+        # Profiling a single request on demand, or a sample of the traffic
+        profile_id = None
+        if should_profile_request(
+                request.headers.get(PROFILE_REQUEST_HEADER), profile_request_token, profile_request_sample_rate
+        ):
+            profile_id = f"predict_{uuid.uuid4().hex[:12]}"
 
-        cost_df = shipping_data.get_input_data_frame()
-        cost_predictor = CostPredictor()
-        cost_value = round(cost_predictor.predict(X=cost_df)[0], 2)
+        with profile_request(
+            profile_id, REQUEST_PROFILES_DIR, interval=PROFILE_REQUEST_INTERVAL
+        ) if profile_id else nullcontext() as profile:
+            with PREDICT_LATENCY.labels(phase="total").time():
+                with PREDICT_LATENCY.labels(phase="parse").time():
+                    form = DataForm(request)
+                    await form.get_shipping_data()
 
-        return templates.TemplateResponse(
-            "index.html",
-            {"request": request, "context": cost_value}
-        )
+                # Rejecting malformed submissions before they reach the model
+                with PREDICT_LATENCY.labels(phase="validation").time():
+                    input_data, errors = cost_predictor.validate_request(
+                        {field: getattr(form, field) for field in SHIPPING_DATA_FIELDS}
+                    )
+                if errors:
+                    ERRORS.labels(route="/predict", reason="validation").inc()
+                    response = JSONResponse({"status": False, "errors": errors}, status_code=422)
+                else:
+                    shipping_data = ShippingData(**input_data)
+
+                    cost_df = shipping_data.get_input_data_frame()
+                    cost_value = round(cost_predictor.predict(X=cost_df)[0], 2)
+                    input_data = shipping_data.get_data()
+                    cost_predictor.update_drift_monitor(input_data)
+                    if prediction_logger is not None:
+                        prediction_logger.log(
+                            "/predict",
+                            {column: values[0] for column, values in input_data.items()},
+                            cost_value,
+                            cost_predictor.model_version,
+                            time.perf_counter() - start_time,
+                        )
+
+                    response = templates.TemplateResponse(
+                        "index.html",
+                        {"request": request, "context": cost_value}
+                    )
+
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile_id
+        return response
         
     except Exception as e:
+        ERRORS.labels(route="/predict", reason="exception").inc()
         logging.error(e)
         return {"status": False, "error": f"{e}"}
-    
 
 
+# Route scoring a batch of rows sent by another service as an Arrow IPC stream or MessagePack columns
+@serving_router.post("/predict/batch")
+async def batchPredictRouteClient(request: Request):
+    try:
+        media_type = request.headers.get("content-type", "").split(";")[0].strip()
+        if media_type not in COLUMNAR_MEDIA_TYPES:
+            ERRORS.labels(route="/predict/batch", reason="media_type").inc()
+            return JSONResponse(
+                {"status": False, "error": f"Content-Type must be one of {list(COLUMNAR_MEDIA_TYPES)}"},
+                status_code=415,
+            )
+
+        with PREDICT_LATENCY.labels(phase="total").time():
+            with PREDICT_LATENCY.labels(phase="parse").time():
+                try:
+                    columns = read_columns(await request.body(), media_type)
+                except Exception as e:
+                    ERRORS.labels(route="/predict/batch", reason="decode").inc()
+                    return JSONResponse({"status": False, "error": f"Could not decode the body: {e}"}, status_code=400)
+
+            n_rows = len(next(iter(columns.values()), ()))
+            if n_rows > BATCH_PREDICT_MAX_ROWS:
+                ERRORS.labels(route="/predict/batch", reason="too_large").inc()
+                return JSONResponse(
+                    {"status": False, "error": f"At most {BATCH_PREDICT_MAX_ROWS} rows per batch"}, status_code=413
+                )
+
+            # Rejecting the whole batch when a row is malformed, the errors give the offending rows
+            with PREDICT_LATENCY.labels(phase="validation").time():
+                cost_df, errors = cost_predictor.validate_columns(columns)
+            if errors:
+                ERRORS.labels(route="/predict/batch", reason="validation").inc()
+                return JSONResponse({"status": False, "errors": errors}, status_code=422)
+
+            predictions = cost_predictor.predict(X=cost_df)
+            cost_predictor.update_drift_monitor_columns(cost_df)
+            return Response(write_predictions(predictions, media_type), media_type=media_type)
+
+    except Exception as e:
+        ERRORS.labels(route="/predict/batch", reason="exception").inc()
+        logging.error(e)
+        return JSONResponse({"status": False, "error": f"{e}"}, status_code=500)
+
+
+# Route explaining predictions by the contribution of every field, for a form
+# submission like /predict or up to EXPLAIN_MAX_ROWS rows in a /predict/batch body
+@serving_router.post("/predict/explain")
+async def explainRouteClient(request: Request):
+    try:
+        media_type = request.headers.get("content-type", "").split(";")[0].strip()
+        with PREDICT_LATENCY.labels(phase="total").time():
+            with PREDICT_LATENCY.labels(phase="parse").time():
+                if media_type in COLUMNAR_MEDIA_TYPES:
+                    try:
+                        columns = read_columns(await request.body(), media_type)
+                    except Exception as e:
+                        ERRORS.labels(route="/predict/explain", reason="decode").inc()
+                        return JSONResponse(
+                            {"status": False, "error": f"Could not decode the body: {e}"}, status_code=400
+                        )
+                else:
+                    form = DataForm(request)
+                    await form.get_shipping_data()
+
+            if media_type in COLUMNAR_MEDIA_TYPES:
+                n_rows = len(next(iter(columns.values()), ()))
+                if n_rows > EXPLAIN_MAX_ROWS:
+                    ERRORS.labels(route="/predict/explain", reason="too_large").inc()
+                    return JSONResponse(
+                        {"status": False, "error": f"At most {EXPLAIN_MAX_ROWS} rows per explanation"},
+                        status_code=413,
+                    )
+                with PREDICT_LATENCY.labels(phase="validation").time():
+                    cost_df, errors = cost_predictor.validate_columns(columns)
+            else:
+                with PREDICT_LATENCY.labels(phase="validation").time():
+                    input_data, errors = cost_predictor.validate_request(
+                        {field: getattr(form, field) for field in SHIPPING_DATA_FIELDS}
+                    )
+                if not errors:
+                    cost_df = ShippingData(**input_data).get_input_data_frame()
+            if errors:
+                ERRORS.labels(route="/predict/explain", reason="validation").inc()
+                return JSONResponse({"status": False, "errors": errors}, status_code=422)
+
+            explanations = cost_predictor.explain(X=cost_df)
+            if media_type in COLUMNAR_MEDIA_TYPES:
+                return JSONResponse(
+                    {"status": True, "model_version": cost_predictor.model_version, "explanations": explanations}
+                )
+            return JSONResponse({"status": True, "model_version": cost_predictor.model_version, **explanations[0]})
+
+    except Exception as e:
+        ERRORS.labels(route="/predict/explain", reason="exception").inc()
+        logging.error(e)
+        return JSONResponse({"status": False, "error": f"{e}"}, status_code=500)
+
+
+# Route predicting the cost over a grid of values of one or two fields around a quote,
+# from a JSON body {"base": {field: value}, "sweep": {field: [values]}}
+@serving_router.post("/predict/sweep")
+async def sweepRouteClient(request: Request):
+    try:
+        with PREDICT_LATENCY.labels(phase="total").time():
+            with PREDICT_LATENCY.labels(phase="parse").time():
+                try:
+                    body = await request.json()
+                    base, sweep = body["base"], body["sweep"]
+                    if not isinstance(base, dict) or not isinstance(sweep, dict):
+                        raise ValueError("base and sweep must be objects")
+                except Exception as e:
+                    ERRORS.labels(route="/predict/sweep", reason="decode").inc()
+                    return JSONResponse({"status": False, "error": f"Could not decode the body: {e}"}, status_code=400)
+
+            n_points = int(np.prod([len(values) if isinstance(values, list) else 1 for values in sweep.values()]))
+            if not 1 <= len(sweep) <= SWEEP_MAX_FIELDS or n_points > SWEEP_MAX_POINTS:
+                ERRORS.labels(route="/predict/sweep", reason="too_large").inc()
+                return JSONResponse(
+                    {
+                        "status": False,
+                        "error": f"Sweep 1 to {SWEEP_MAX_FIELDS} fields over at most {SWEEP_MAX_POINTS} points",
+                    },
+                    status_code=413,
+                )
+
+            with PREDICT_LATENCY.labels(phase="validation").time():
+                input_data, errors = cost_predictor.validate_request(
+                    {field: base.get(field) for field in SHIPPING_DATA_FIELDS}
+                )
+                if not errors:
+                    axes, errors = cost_predictor.validate_sweep(input_data, sweep)
+            if errors:
+                ERRORS.labels(route="/predict/sweep", reason="validation").inc()
+                return JSONResponse({"status": False, "errors": errors}, status_code=422)
+
+            predictions = cost_predictor.sweep(ShippingData(**input_data).get_input_data_frame(), axes)
+            return JSONResponse({
+                "status": True,
+                "model_version": cost_predictor.model_version,
+                "fields": list(sweep),
+                "values": {
+                    field: [None if pd.isna(value) else value for value in axis[SHIPPING_DATA_FIELDS[field]].tolist()]
+                    for field, axis in zip(sweep, axes.values())
+                },
+                "predictions": np.round(predictions, 2).tolist(),
+            })
+
+    except Exception as e:
+        ERRORS.labels(route="/predict/sweep", reason="exception").inc()
+        logging.error(e)
+        return JSONResponse({"status": False, "error": f"{e}"}, status_code=500)
+
+
+# Route exposing the service metrics in the Prometheus text format
+@serving_router.get("/metrics")
+async def metricsRouteClient():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+# Route exposing the drift status of the live prediction traffic
+@serving_router.get("/metrics/drift")
+async def driftMetricsRouteClient():
+    try:
+        drift_monitor = cost_predictor.drift_monitor
+        if drift_monitor is None:
+            return JSONResponse({"status": False, "error": "Drift monitor is not initialised"}, status_code=503)
+        return JSONResponse(drift_monitor.check())
+    except Exception as e:
+        ERRORS.labels(route="/metrics/drift", reason="exception").inc()
+        logging.error(e)
+        return JSONResponse({"status": False, "error": f"{e}"}, status_code=500)
+
+
+def create_app(include_training: bool = True) -> FastAPI:
+    """
+    Create the FastAPI app and the shared predictor, with the serving settings
+    read from the environment.
+
+    Args:
+        include_training (bool, optional): Whether to serve the /train route. Defaults to True.
+
+    Returns:
+        FastAPI: The app.
+    """
+    global cost_predictor, prediction_logger, profile_request_token, profile_request_sample_rate
+
+    configure_logging()
+    # Reading the serving settings from the environment at startup
+    cost_predictor = CostPredictor(
+        serving_preprocessing=os.environ.get(SERVING_PREPROCESSING_ENV_KEY, SERVING_PREPROCESSING_COLUMN_TRANSFORMER),
+        serving_backend=os.environ.get(SERVING_BACKEND_ENV_KEY, SERVING_BACKEND_PYTHON),
+        onnx_intra_op_threads=int(os.environ.get(ONNX_INTRA_OP_THREADS_ENV_KEY, ONNX_INTRA_OP_THREADS)),
+        explain_cache_size=int(os.environ.get(EXPLAIN_CACHE_SIZE_ENV_KEY, EXPLAIN_CACHE_SIZE)),
+    )
+    # The writer starts with the first record
+    prediction_logger = PredictionLogger() if os.environ.get(PREDICTION_LOG_ENABLED_ENV_KEY, "0") == "1" else None
+    profile_request_token = os.environ.get(PROFILE_REQUEST_TOKEN_ENV_KEY, "")
+    profile_request_sample_rate = float(os.environ.get(PROFILE_REQUEST_SAMPLE_RATE_ENV_KEY, "0"))
+
+    app = FastAPI()
+
+    # Mount the static files directory
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+
+    # Add CORS middleware to the FastAPI app
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.include_router(serving_router)
+    if prediction_logger is not None:
+        # Writing the buffered predictions before the process exits
+        app.add_event_handler("shutdown", prediction_logger.close)
+    if include_training:
+        app.include_router(training_router)
+    return app
+
+
+# The app is only created by the entry points, `python app.py` or `uvicorn app:create_app --factory`
 if __name__ == "__main__":
-    app_run(app, host=APP_HOST, port=APP_PORT)
+    app_run(create_app(), host=APP_HOST, port=APP_PORT)
     #train_pipeline = TrainPipeline()
 
     #train_pipeline.run_pipeline()
\ No newline at end of file
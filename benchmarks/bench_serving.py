@@ -0,0 +1,439 @@
+import asyncio
+import importlib.util
+import time
+from typing import Dict, List, Sequence
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.datasets import sample_rows
+from benchmarks.harness import BenchmarkResult, measure, summarise
+from benchmarks.stand_ins import LocalMongoOperation, LocalS3Operations
+from shipment.constant import (
+    ARROW_STREAM_MEDIA_TYPE,
+    BATCH_PREDICT_MAX_ROWS,
+    BUCKET_NAME,
+    EXPLAIN_MAX_ROWS,
+    MODEL_CONFIG_FILE,
+    MODEL_FILE_NAME,
+    ONNX_INTRA_OP_THREADS,
+    SCHEMA_FILE_PATH,
+    SHIPPING_DATA_FIELDS,
+)
+from shipment.components.model_predictor import CostPredictor, ShippingData
+from shipment.utils.columnar_codec import COLUMNAR_MEDIA_TYPES
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.template_encoder import TemplateEncoder
+
+# Packages exporting and running the ONNX graph of the cost model, all optional
+ONNX_PACKAGES = ("onnx", "skl2onnx", "onnxruntime")
+
+
+def get_repeats(batch_size: int) -> int:
+    # Large batches take seconds per call, a few samples are enough to get a stable median
+    return 5 if batch_size <= 1000 else 3
+
+
+def to_shipping_data(rows: pd.DataFrame) -> List[ShippingData]:
+    records = rows[list(SHIPPING_DATA_FIELDS.values())].to_dict("records")
+    return [
+        ShippingData(**{field: record[column] for field, column in SHIPPING_DATA_FIELDS.items()})
+        for record in records
+    ]
+
+
+def to_form_data(row: Dict) -> Dict[str, str]:
+    return {
+        field: "" if pd.isna(row[column]) else str(row[column])
+        for field, column in SHIPPING_DATA_FIELDS.items()
+    }
+
+
+def bench_get_input_data_frame(batch_sizes: Sequence[int]) -> List[BenchmarkResult]:
+    """
+    Time ShippingData.get_input_data_frame for every request of a batch.
+
+    Args:
+        batch_sizes (Sequence[int]): The numbers of requests.
+
+    Returns:
+        List[BenchmarkResult]: One result per batch size.
+    """
+    results = []
+    for batch_size in batch_sizes:
+        shipping_data_list = to_shipping_data(sample_rows("test", batch_size))
+        results.append(measure(
+            name=f"serving.get_input_data_frame[batch={batch_size}]",
+            group="serving",
+            func=lambda: [shipping_data.get_input_data_frame() for shipping_data in shipping_data_list],
+            n_rows=batch_size,
+            repeats=get_repeats(batch_size),
+            params={"batch_size": batch_size},
+        ))
+    return results
+
+
+def bench_cost_model_predict(cost_model: object, batch_sizes: Sequence[int]) -> List[BenchmarkResult]:
+    """
+    Time CostModel.predict, preprocessing included, on batches of the test set.
+
+    Args:
+        cost_model (object): The CostModel being served.
+        batch_sizes (Sequence[int]): The numbers of rows per batch.
+
+    Returns:
+        List[BenchmarkResult]: One result per batch size.
+    """
+    results = []
+    for batch_size in batch_sizes:
+        X = sample_rows("test", batch_size)[list(SHIPPING_DATA_FIELDS.values())]
+        results.append(measure(
+            name=f"serving.cost_model_predict[batch={batch_size}]",
+            group="serving",
+            func=lambda: cost_model.predict(X),
+            n_rows=batch_size,
+            repeats=get_repeats(batch_size),
+            params={"batch_size": batch_size},
+        ))
+    return results
+
+
+def bench_template_encoder_predict(cost_model: object, batch_sizes: Sequence[int]) -> List[BenchmarkResult]:
+    """
+    Time the template serving mode, TemplateEncoder.transform and CostModel.predict_transformed,
+    on batches of the test set.
+
+    Args:
+        cost_model (object): The CostModel being served.
+        batch_sizes (Sequence[int]): The numbers of rows per batch.
+
+    Returns:
+        List[BenchmarkResult]: One result per batch size.
+    """
+    template_encoder = TemplateEncoder(cost_model.preprocessing_object)
+    results = []
+    for batch_size in batch_sizes:
+        X = sample_rows("test", batch_size)[list(SHIPPING_DATA_FIELDS.values())].astype(object)
+        results.append(measure(
+            name=f"serving.template_encoder_predict[batch={batch_size}]",
+            group="serving",
+            func=lambda: cost_model.predict_transformed(template_encoder.transform(X)),
+            n_rows=batch_size,
+            repeats=get_repeats(batch_size),
+            params={"batch_size": batch_size},
+        ))
+    return results
+
+
+def bench_onnx_predict(cost_model: object, batch_sizes: Sequence[int]) -> List[BenchmarkResult]:
+    """
+    Time the onnx serving backend, OnnxCostModel.predict, on batches of the test set.
+    A model pushed without its ONNX graph is exported first. Skipped when onnx_export is
+    disabled in config/model.yaml or an ONNX package is missing.
+
+    Args:
+        cost_model (object): The CostModel being served.
+        batch_sizes (Sequence[int]): The numbers of rows per batch.
+
+    Returns:
+        List[BenchmarkResult]: One result per batch size, none when skipped.
+    """
+    if not MainUtils().read_yaml_file(filename=MODEL_CONFIG_FILE).get("onnx_export", {}).get("enabled"):
+        print("Skipping the onnx benchmarks, onnx_export is disabled in config/model.yaml")
+        return []
+    missing_packages = [package for package in ONNX_PACKAGES if importlib.util.find_spec(package) is None]
+    if missing_packages:
+        print(f"Skipping the onnx benchmarks, {missing_packages} are not installed")
+        return []
+
+    from shipment.utils.onnx_backend import OnnxCostModel
+    from shipment.utils.onnx_export import export_cost_model
+
+    onnx_model = getattr(cost_model, "onnx_model", None) or export_cost_model(cost_model).SerializeToString()
+    onnx_cost_model = OnnxCostModel(onnx_model, ONNX_INTRA_OP_THREADS)
+    results = []
+    for batch_size in batch_sizes:
+        X = sample_rows("test", batch_size)[list(SHIPPING_DATA_FIELDS.values())].astype(object)
+        results.append(measure(
+            name=f"serving.onnx_predict[batch={batch_size}]",
+            group="serving",
+            func=lambda: onnx_cost_model.predict(X),
+            n_rows=batch_size,
+            repeats=get_repeats(batch_size),
+            params={"batch_size": batch_size, "intra_op_threads": ONNX_INTRA_OP_THREADS},
+        ))
+    return results
+
+
+def bench_explain(cost_model: object, batch_sizes: Sequence[int]) -> List[BenchmarkResult]:
+    """
+    Time CostExplainer.explain on batches of the test set, computing every row
+    without a cache, then answering them all from a warm cache.
+
+    Args:
+        cost_model (object): The CostModel being served.
+        batch_sizes (Sequence[int]): The numbers of rows per batch, the larger than
+            EXPLAIN_MAX_ROWS are skipped.
+
+    Returns:
+        List[BenchmarkResult]: One result per cache state and batch size.
+    """
+    from shipment.utils.explainer import CostExplainer
+
+    uncached_explainer = CostExplainer(cost_model, "benchmark", cache_size=0)
+    results = []
+    for batch_size in [batch_size for batch_size in batch_sizes if batch_size <= EXPLAIN_MAX_ROWS]:
+        X = sample_rows("test", batch_size)[list(SHIPPING_DATA_FIELDS.values())].astype(object)
+        cached_explainer = CostExplainer(cost_model, "benchmark", cache_size=batch_size)
+        cached_explainer.explain(X)
+        for cache, explainer in (("miss", uncached_explainer), ("hit", cached_explainer)):
+            results.append(measure(
+                name=f"serving.explain[cache={cache},batch={batch_size}]",
+                group="serving",
+                func=lambda: explainer.explain(X),
+                n_rows=batch_size,
+                repeats=get_repeats(batch_size),
+                params={"batch_size": batch_size, "cache": cache, "estimator": type(explainer.estimator).__name__},
+            ))
+    return results
+
+
+def bench_sweep(cost_predictor: CostPredictor, grid_shapes: Sequence[tuple] = ((100, 10), (1000, 10))) -> List[BenchmarkResult]:
+    """
+    Time CostPredictor.sweep over Weight x Height grids around a test row, against a
+    single CostModel.predict call on the rows of the same grid.
+
+    Args:
+        cost_predictor (CostPredictor): The predictor serving the model.
+        grid_shapes (Sequence[tuple], optional): The numbers of Weight and Height values.
+
+    Returns:
+        List[BenchmarkResult]: Two results per grid shape.
+    """
+    from shipment.utils.sweep import get_grid_frame
+
+    numerical_columns = MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH)["numerical_columns"]
+    row = sample_rows("test", 100).dropna(subset=numerical_columns).head(1).to_dict("records")[0]
+    input_data, _ = cost_predictor.validate_request(to_form_data(row))
+    base = ShippingData(**input_data).get_input_data_frame()
+    cost_model = cost_predictor.get_model()
+    results = []
+    for n_weights, n_heights in grid_shapes:
+        axes, _ = cost_predictor.validate_sweep(input_data, {
+            "weight": np.linspace(100.0, 5000.0, n_weights).tolist(),
+            "height": np.linspace(5.0, 70.0, n_heights).tolist(),
+        })
+        grid = get_grid_frame(base, axes)
+        params = {"grid": f"{n_weights}x{n_heights}"}
+        results.append(measure(
+            name=f"serving.sweep[grid={n_weights}x{n_heights}]",
+            group="serving",
+            func=lambda: cost_predictor.sweep(base, axes),
+            n_rows=len(grid),
+            repeats=get_repeats(len(grid)),
+            params=params,
+        ))
+        results.append(measure(
+            name=f"serving.sweep_batch_predict[grid={n_weights}x{n_heights}]",
+            group="serving",
+            func=lambda: cost_model.predict(grid),
+            n_rows=len(grid),
+            repeats=get_repeats(len(grid)),
+            params=params,
+        ))
+    return results
+
+
+def bench_prediction_log(n_records: int = 10000) -> List[BenchmarkResult]:
+    """
+    Time PredictionLogger.log on the request path, and the time to write the records
+    to an in-memory stand-in of MongoDB once they are all enqueued.
+
+    Args:
+        n_records (int, optional): The number of records logged. Defaults to 10000.
+
+    Returns:
+        List[BenchmarkResult]: The enqueue and the drain results.
+    """
+    from shipment.monitoring.prediction_log import PredictionLogger
+
+    inputs = sample_rows("test", 1)[list(SHIPPING_DATA_FIELDS.values())].iloc[0].to_dict()
+    local_mongo = LocalMongoOperation()
+    prediction_logger = None
+
+    def enqueue() -> None:
+        nonlocal prediction_logger
+        prediction_logger = PredictionLogger(lambda: local_mongo, buffer_size=n_records)
+        for _ in range(n_records):
+            prediction_logger.log("/predict", inputs, 1.0, "benchmark", 0.01)
+
+    results = [measure(
+        name=f"serving.prediction_log_enqueue[records={n_records}]",
+        group="serving",
+        func=enqueue,
+        n_rows=n_records,
+        repeats=get_repeats(n_records),
+        params={"n_records": n_records},
+    )]
+    results.append(measure(
+        name=f"serving.prediction_log_drain[records={n_records}]",
+        group="serving",
+        func=lambda: prediction_logger.close(),
+        setup=enqueue,
+        n_rows=n_records,
+        repeats=get_repeats(n_records),
+        params={"n_records": n_records},
+    ))
+    return results
+
+
+def bench_predict_route(serving_app: object, n_requests: int) -> BenchmarkResult:
+    """
+    Time the POST /predict route through an in-process ASGI client, one request at a time.
+
+    Args:
+        serving_app (object): The app built by create_app.
+        n_requests (int): The number of requests sent after a warm up request.
+
+    Returns:
+        BenchmarkResult: The per request latency, with the status codes in `extra`.
+    """
+    import httpx
+
+    # Requests missing a numerical value are rejected with a 422, only complete rows are sent
+    numerical_columns = MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH)["numerical_columns"]
+    rows = sample_rows("test", 2 * n_requests).dropna(subset=numerical_columns).head(n_requests)
+    forms = [to_form_data(row) for row in rows.to_dict("records")]
+
+    async def send_requests() -> tuple:
+        transport = httpx.ASGITransport(app=serving_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await client.post("/predict", data=forms[0])
+            timings, status_codes = [], {}
+            for form in forms:
+                start = time.perf_counter()
+                response = await client.post("/predict", data=form)
+                timings.append(time.perf_counter() - start)
+                status_codes[str(response.status_code)] = status_codes.get(str(response.status_code), 0) + 1
+            return timings, status_codes
+
+    timings, status_codes = asyncio.run(send_requests())
+    return summarise(
+        name=f"serving.predict_route[requests={n_requests}]",
+        group="serving",
+        timings=timings,
+        params={"n_requests": n_requests},
+        extra={"status_codes": status_codes},
+    )
+
+
+def encode_columns(rows: pd.DataFrame, media_type: str) -> bytes:
+    """Encode rows as a /predict/batch request body, the missing values as nulls."""
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        import pyarrow as pa
+
+        # The categorical columns dictionary encoded, as the clients are advised to
+        categorical_columns = rows.select_dtypes(exclude="number").columns
+        table = pa.Table.from_pandas(rows.astype({column: "category" for column in categorical_columns}), preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    import msgpack
+
+    return msgpack.packb({
+        column: [None if pd.isna(value) else value for value in rows[column].tolist()] for column in rows.columns
+    })
+
+
+def bench_batch_route(serving_app: object, batch_sizes: Sequence[int]) -> List[BenchmarkResult]:
+    """
+    Time the POST /predict/batch route through an in-process ASGI client, for both
+    request formats, with the body sizes against the form requests of the same rows.
+
+    Args:
+        serving_app (object): The app built by create_app.
+        batch_sizes (Sequence[int]): The numbers of rows per request, the larger than
+            BATCH_PREDICT_MAX_ROWS are skipped.
+
+    Returns:
+        List[BenchmarkResult]: One result per format and batch size.
+    """
+    import httpx
+
+    numerical_columns = MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH)["numerical_columns"]
+    results = []
+    for batch_size in [batch_size for batch_size in batch_sizes if batch_size <= BATCH_PREDICT_MAX_ROWS]:
+        rows = sample_rows("test", 2 * batch_size)[list(SHIPPING_DATA_FIELDS.values())]
+        rows = rows.dropna(subset=numerical_columns).head(batch_size)
+        form_bytes = sum(len(urlencode(to_form_data(row))) for row in rows.to_dict("records"))
+        for media_type in COLUMNAR_MEDIA_TYPES:
+            body = encode_columns(rows, media_type)
+
+            async def send_request() -> httpx.Response:
+                transport = httpx.ASGITransport(app=serving_app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                    return await client.post("/predict/batch", content=body, headers={"content-type": media_type})
+
+            response = asyncio.run(send_request())
+            result = measure(
+                name=f"serving.batch_route[format={media_type.rsplit('/', 1)[-1]},batch={len(rows)}]",
+                group="serving",
+                func=lambda: asyncio.run(send_request()),
+                n_rows=len(rows),
+                repeats=get_repeats(batch_size),
+                params={"media_type": media_type, "batch_size": len(rows)},
+            )
+            result.extra.update({
+                "status_code": response.status_code,
+                "request_bytes": len(body),
+                "response_bytes": len(response.content),
+                "form_request_bytes": form_bytes,
+            })
+            results.append(result)
+    return results
+
+
+def run_serving_benchmarks(
+        local_s3: LocalS3Operations,
+        batch_sizes: Sequence[int],
+        route_requests: int = 200,
+) -> List[BenchmarkResult]:
+    """
+    Run the serving benchmarks against the model of the local bucket.
+
+    Args:
+        local_s3 (LocalS3Operations): The stand-in of the model bucket, holding a pushed model.
+        batch_sizes (Sequence[int]): The batch sizes of the frame building and predict benchmarks.
+        route_requests (int, optional): The number of requests sent to /predict. Defaults to 200.
+
+    Returns:
+        List[BenchmarkResult]: The serving results.
+    """
+    # Every CostPredictor shares the class level model cache, reset it so the local model is loaded
+    CostPredictor._served = None
+    cost_predictor = CostPredictor()
+    cost_predictor.s3 = local_s3
+    cost_model = cost_predictor.get_model()
+
+    results = bench_get_input_data_frame(batch_sizes)
+    results += bench_cost_model_predict(cost_model, batch_sizes)
+    if TemplateEncoder.supports(cost_model.preprocessing_object):
+        results += bench_template_encoder_predict(cost_model, batch_sizes)
+    results += bench_onnx_predict(cost_model, batch_sizes)
+    results += bench_explain(cost_model, batch_sizes)
+    results += bench_sweep(cost_predictor)
+    results += bench_prediction_log()
+    if route_requests:
+        import app
+
+        serving_app = app.create_app()
+        app.cost_predictor.s3 = local_s3
+        results.append(bench_predict_route(serving_app, route_requests))
+        results += bench_batch_route(serving_app, batch_sizes)
+    return results
+
+
+def has_model(local_s3: LocalS3Operations) -> bool:
+    return local_s3.is_model_present(BUCKET_NAME, MODEL_FILE_NAME)
@@ -0,0 +1,157 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List
+
+from benchmarks.harness import BenchmarkResult, summarise
+
+# Modules the serving entry point must not import, they only serve the training pipeline
+TRAINING_ONLY_MODULES = (
+    "shipment.pipeline.training_pipeline",
+    "evidently",
+    "pymongo",
+    "xgboost",
+    "category_encoders",
+    "boto3",
+)
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+# The entry points create their app with a factory, timed after the import
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+import_seconds = time.perf_counter() - start
+{module}.{factory}()
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "import_seconds": import_seconds, "modules": sorted(sys.modules)}}))
+"""
+
+# Entry point modules and their app factories
+ENTRY_POINTS = (("serve", "create_serving_app"), ("app", "create_app"))
+
+MODEL_LOAD_SCRIPT = """
+import json, pickle, sys, time
+import serve
+start = time.perf_counter()
+with open({model_file_path!r}, "rb") as model_file:
+    pickle.load(model_file)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def run_script(script: str, project_dir: str) -> dict:
+    """
+    Run a script printing its timing as json in a fresh interpreter, without the
+    MongoDB url, like a new serving pod.
+
+    Args:
+        script (str): The script.
+        project_dir (str): The directory the interpreter runs from.
+
+    Returns:
+        dict: The printed result, with the process seconds.
+    """
+    env = {key: value for key, value in os.environ.items() if key != "MONGO_DB_URL"}
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=project_dir, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    process_seconds = time.perf_counter() - start
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = process_seconds
+    return result
+
+
+def get_training_only_modules(modules: List[str]) -> List[str]:
+    """Get the TRAINING_ONLY_MODULES found among the imported module names."""
+    return [
+        name for name in TRAINING_ONLY_MODULES
+        if any(module_name == name or module_name.startswith(name + ".") for module_name in modules)
+    ]
+
+
+def measure_model_load(model_file_path: str, project_dir: str) -> dict:
+    """
+    Unpickle a model in a fresh interpreter having imported the serving entry point.
+
+    Args:
+        model_file_path (str): The pickled model.
+        project_dir (str): The directory the interpreter runs from.
+
+    Returns:
+        dict: The unpickling seconds, the process seconds and the imported module names.
+    """
+    return run_script(MODEL_LOAD_SCRIPT.format(model_file_path=model_file_path), project_dir)
+
+
+def measure_import(module: str, project_dir: str) -> dict:
+    """
+    Import a module in a fresh interpreter, without the MongoDB url, like a new serving pod.
+
+    Args:
+        module (str): The module imported.
+        project_dir (str): The directory the interpreter runs from.
+
+    Returns:
+        dict: The import seconds, the process seconds and the imported module names.
+    """
+    return run_script(IMPORT_SCRIPT.format(module=module), project_dir)
+
+
+def measure_startup(module: str, factory: str, project_dir: str) -> dict:
+    """
+    Import an entry point and create its app in a fresh interpreter, without the MongoDB url.
+
+    Args:
+        module (str): The entry point module.
+        factory (str): The app factory of the module.
+        project_dir (str): The directory the interpreter runs from.
+
+    Returns:
+        dict: The startup and import seconds, the process seconds and the imported module names.
+    """
+    return run_script(STARTUP_SCRIPT.format(module=module, factory=factory), project_dir)
+
+
+def run_startup_benchmarks(project_dir: str, repeats: int = 5) -> List[BenchmarkResult]:
+    """
+    Time the import of the entry points and the creation of their app in fresh
+    interpreters, and record the training-only modules each one pulls in.
+
+    Args:
+        project_dir (str): The project root, holding app.py and serve.py.
+        repeats (int, optional): The number of interpreters started per entry point. Defaults to 5.
+
+    Returns:
+        List[BenchmarkResult]: One result per entry point.
+    """
+    results = []
+    for module, factory in ENTRY_POINTS:
+        runs = [measure_startup(module, factory, project_dir) for _ in range(repeats)]
+        loaded = get_training_only_modules(runs[0]["modules"])
+        if loaded:
+            print(f"{module}.{factory} loads the training-only modules {loaded}")
+        results.append(summarise(
+            name=f"startup.create_app[module={module}]",
+            group="startup",
+            timings=[run["seconds"] for run in runs],
+            params={"module": module, "factory": factory},
+            extra={
+                "import_seconds": max(run["import_seconds"] for run in runs),
+                "process_seconds": max(run["process_seconds"] for run in runs),
+                "training_only_modules": loaded,
+            },
+        ))
+    return results
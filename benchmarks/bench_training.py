@@ -0,0 +1,164 @@
+import os
+from typing import Dict, List, Sequence
+
+from benchmarks.datasets import load_dataset, scale_dataset
+from benchmarks.harness import BenchmarkResult, measure, summarise
+from benchmarks.stand_ins import LocalMongoOperation, LocalS3Operations, redirect_artefacts
+from shipment.constant import BUCKET_NAME, S3_MODEL_NAME
+from shipment.monitoring.metrics import track_stage
+
+STAGES = (
+    "data_ingestion",
+    "data_validation",
+    "data_transformation",
+    "model_trainer",
+    "model_exporter",
+    "model_evaluation",
+    "model_pusher",
+)
+
+
+def run_stages(
+        scale: int,
+        workdir: str,
+        local_s3: LocalS3Operations,
+        run_model_stages: bool,
+        training_mode: str = None,
+        warm_start: bool = False,
+) -> Dict[str, Dict]:
+    """
+    Run the training pipeline stages once on the scaled train set.
+
+    Args:
+        scale (int): The scale of the train set.
+        workdir (str): The directory receiving the artefacts.
+        local_s3 (LocalS3Operations): The stand-in of the model bucket.
+        run_model_stages (bool): Whether to run the trainer, exporter, evaluation and pusher stages.
+        training_mode (str, optional): Overrides the training_mode of config/model.yaml. Defaults to None.
+        warm_start (bool, optional): Whether to continue training the model of the bucket. Defaults to False.
+
+    Returns:
+        Dict[str, Dict]: The metrics of each stage, as measured by track_stage.
+    """
+    from shipment.pipeline.training_pipeline import TrainPipeline
+
+    redirect_artefacts(os.path.join(workdir, f"artefacts_x{scale}"))
+    train_pipeline = TrainPipeline(warm_start=warm_start)
+    train_pipeline.mongo_op = LocalMongoOperation(scale_dataset("train", scale))
+    train_pipeline.s3_operations = local_s3
+    train_pipeline.model_evaluation_config.S3_OPERATIONS = local_s3
+    if training_mode is not None:
+        train_pipeline.data_transformation_config.TRAINING_MODE = training_mode
+        train_pipeline.model_trainer_config.TRAINING_MODE = training_mode
+
+    stage_metrics = {}
+    with track_stage("data_ingestion", stage_metrics):
+        data_ingestion_artefact = train_pipeline.start_data_ingestion()
+    with track_stage("data_validation", stage_metrics):
+        train_pipeline.start_data_validation(data_ingestion_artefact)
+    champion = train_pipeline.get_warm_start_champion(data_ingestion_artefact) if warm_start else None
+    with track_stage("data_transformation", stage_metrics):
+        data_transformation_artefact = train_pipeline.start_data_transformation(data_ingestion_artefact, champion)
+
+    if run_model_stages:
+        with track_stage("model_trainer", stage_metrics):
+            model_trainer_artefact = train_pipeline.start_model_trainer(data_transformation_artefact, champion)
+        with track_stage("model_exporter", stage_metrics):
+            train_pipeline.start_model_exporter(data_ingestion_artefact, model_trainer_artefact)
+        with track_stage("model_evaluation", stage_metrics):
+            train_pipeline.start_model_evaluation(data_ingestion_artefact, model_trainer_artefact)
+        # Pushed whatever the evaluation says, the serving benchmarks load the model from the bucket
+        with track_stage("model_pusher", stage_metrics):
+            train_pipeline.start_model_pusher(model_trainer_artefact, local_s3, data_transformation_artefact)
+
+    return stage_metrics
+
+
+def bench_mongo_records(scales: Sequence[int]) -> List[BenchmarkResult]:
+    """
+    Time the conversion of the train set to the documents of the bulk loader,
+    against the JSON round trip of data_frame.T.to_json it replaced.
+
+    Args:
+        scales (Sequence[int]): The scales of the train set.
+
+    Returns:
+        List[BenchmarkResult]: Two results per scale.
+    """
+    from json import loads
+    from shipment.configuration.mongo_operations import get_records
+
+    results = []
+    for scale in scales:
+        df = scale_dataset("train", scale)
+        for method, func in (
+            ("columns", lambda: get_records(df)),
+            ("json", lambda: list(loads(df.T.to_json()).values())),
+        ):
+            results.append(measure(
+                name=f"training.mongo_records[method={method},scale={scale}]",
+                group="training",
+                func=func,
+                n_rows=len(df),
+                repeats=3,
+                params={"method": method, "scale": scale},
+            ))
+    return results
+
+
+def run_training_benchmarks(
+        scales: Sequence[int],
+        workdir: str,
+        local_s3: LocalS3Operations,
+        model_trainer_max_scale: int = 1,
+        repeats: int = 1,
+        training_mode: str = None,
+        warm_start: bool = False,
+) -> List[BenchmarkResult]:
+    """
+    Time each stage of the training pipeline, with Mongo and S3 replaced by local stand-ins.
+
+    Args:
+        scales (Sequence[int]): The scales of the train set.
+        workdir (str): The directory receiving the artefacts.
+        local_s3 (LocalS3Operations): The stand-in of the model bucket.
+        model_trainer_max_scale (int, optional): The largest scale the model stages run at,
+            the grid search dominates the pipeline time. Defaults to 1.
+        repeats (int, optional): The number of runs of the pipeline per scale. Defaults to 1.
+        training_mode (str, optional): Overrides the training_mode of config/model.yaml,
+            added to the benchmark names. Defaults to None.
+        warm_start (bool, optional): Whether the runs continue training the model of the
+            bucket, one is trained first when there is none. Defaults to False.
+
+    Returns:
+        List[BenchmarkResult]: One result per stage and scale.
+    """
+    mode_label = "" if training_mode is None else f",mode={training_mode}"
+    if warm_start:
+        mode_label += ",warm_start"
+        if not local_s3.is_model_present(BUCKET_NAME, S3_MODEL_NAME):
+            run_stages(min(scales), workdir, local_s3, True, training_mode)
+    results = []
+    for scale in scales:
+        runs = [
+            run_stages(scale, workdir, local_s3, scale <= model_trainer_max_scale, training_mode, warm_start)
+            for _ in range(repeats)
+        ]
+        n_rows = len(load_dataset("train")) * scale
+        for stage in STAGES:
+            stage_runs = [run[stage] for run in runs if stage in run]
+            if not stage_runs:
+                continue
+            results.append(summarise(
+                name=f"training.{stage}[scale={scale}{mode_label}]",
+                group="training",
+                timings=[stage_run["wall_time_seconds"] for stage_run in stage_runs],
+                n_rows=n_rows,
+                params={"stage": stage, "scale": scale, "training_mode": training_mode, "warm_start": warm_start},
+                extra={
+                    "cpu_time_seconds": max(stage_run["cpu_time_seconds"] for stage_run in stage_runs),
+                    "peak_rss_bytes": max(stage_run["peak_rss_bytes"] for stage_run in stage_runs),
+                },
+            ))
+    results += bench_mongo_records(scales)
+    return results
@@ -0,0 +1,84 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DATASET_FILES = {
+    "train": os.path.join(DATA_DIR, "train.csv"),
+    "test": os.path.join(DATA_DIR, "test.csv"),
+}
+SCALES = (1, 10, 100, 1000)
+
+# Relative noise applied to the numerical columns of the synthetic copies
+NUMERIC_JITTER = 0.05
+# Bounds kept by the jittered values, as described in config/schema.yaml. The
+# jitter is multiplicative so the other columns keep their sign.
+NUMERIC_BOUNDS = {"Artist Reputation": (0.0, 1.0)}
+
+
+@lru_cache(maxsize=None)
+def load_dataset(name: str) -> pd.DataFrame:
+    """
+    Load one of the datasets shipped in data/.
+
+    Args:
+        name (str): "train" or "test".
+
+    Returns:
+        pd.DataFrame: The dataset, cached for the lifetime of the process.
+    """
+    return pd.read_csv(DATASET_FILES[name])
+
+
+def scale_dataset(name: str, scale: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Build a synthetic copy of a dataset with `scale` times more rows.
+
+    The original rows are kept and the extra ones are resampled with
+    replacement, numerical values being jittered by a few percent so the
+    copies are not exact duplicates. The same seed always gives the same
+    data, which keeps the benchmark runs comparable.
+
+    Args:
+        name (str): "train" or "test".
+        scale (int): The multiplier of the number of rows.
+        seed (int, optional): The seed of the random generator. Defaults to 42.
+
+    Returns:
+        pd.DataFrame: The scaled dataset.
+    """
+    df = load_dataset(name)
+    if scale <= 1:
+        return df.copy()
+
+    rng = np.random.default_rng(seed)
+    n_extra = len(df) * (scale - 1)
+    extra = df.iloc[rng.integers(0, len(df), size=n_extra)].reset_index(drop=True)
+
+    for column in extra.select_dtypes(include="number").columns:
+        values = extra[column].to_numpy(dtype=np.float64)
+        values = values * rng.normal(1.0, NUMERIC_JITTER, size=n_extra)
+        if column in NUMERIC_BOUNDS:
+            values = np.clip(values, *NUMERIC_BOUNDS[column])
+        extra[column] = values
+
+    return pd.concat([df, extra], ignore_index=True)
+
+
+def sample_rows(name: str, n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Get `n_rows` rows of a dataset, from the smallest scaled copy holding enough rows.
+
+    Args:
+        name (str): "train" or "test".
+        n_rows (int): The number of rows needed.
+        seed (int, optional): The seed of the random generator. Defaults to 42.
+
+    Returns:
+        pd.DataFrame: The first `n_rows` rows of the scaled dataset.
+    """
+    n_base = len(load_dataset(name))
+    scale = next((scale for scale in SCALES if scale * n_base >= n_rows), -(-n_rows // n_base))
+    return scale_dataset(name, scale, seed).head(n_rows).reset_index(drop=True)
@@ -0,0 +1,222 @@
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# A benchmark is flagged when its median time grows by more than this share of the baseline
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    group: str
+    params: Dict = field(default_factory=dict)
+    n_rows: int = 0
+    repeats: int = 0
+    median_seconds: float = 0.0
+    min_seconds: float = 0.0
+    mean_seconds: float = 0.0
+    p95_seconds: float = 0.0
+    rows_per_second: float = 0.0
+    extra: Dict = field(default_factory=dict)
+
+
+def measure(
+        name: str,
+        group: str,
+        func: Callable[[], object],
+        n_rows: int = 1,
+        repeats: int = 5,
+        min_time: float = 0.2,
+        params: Optional[Dict] = None,
+        setup: Optional[Callable[[], None]] = None,
+) -> BenchmarkResult:
+    """
+    Time `func` several times and summarise the timings.
+
+    One warm up call is made first. Calls are then repeated until both
+    `repeats` calls and `min_time` seconds are reached, so fast code gets
+    more samples than slow code. The garbage collector is disabled while
+    timing, as timeit does.
+
+    Args:
+        name (str): The name of the benchmark.
+        group (str): The group of the benchmark, e.g. "serving" or "training".
+        func (Callable[[], object]): The code being measured.
+        n_rows (int, optional): The number of rows processed by one call. Defaults to 1.
+        repeats (int, optional): The minimum number of timed calls. Defaults to 5.
+        min_time (float, optional): The minimum total time spent timing. Defaults to 0.2.
+        params (Optional[Dict], optional): The parameters of the benchmark, saved with the result.
+        setup (Optional[Callable[[], None]], optional): Code run before every call, not timed.
+
+    Returns:
+        BenchmarkResult: The summary of the timings.
+    """
+    if setup is not None:
+        setup()
+    func()
+
+    timings: List[float] = []
+    gc_enabled = gc.isenabled()
+    started = time.perf_counter()
+    try:
+        while True:
+            if setup is not None:
+                setup()
+            gc.disable()
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+            if gc_enabled:
+                gc.enable()
+
+            if len(timings) >= repeats and time.perf_counter() - started >= min_time:
+                break
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return summarise(name, group, timings, n_rows, params)
+
+
+def summarise(
+        name: str,
+        group: str,
+        timings: List[float],
+        n_rows: int = 1,
+        params: Optional[Dict] = None,
+        extra: Optional[Dict] = None,
+) -> BenchmarkResult:
+    """
+    Build the result of a benchmark from raw timings.
+
+    Args:
+        name (str): The name of the benchmark.
+        group (str): The group of the benchmark.
+        timings (List[float]): The timings in seconds.
+        n_rows (int, optional): The number of rows processed by one timed call. Defaults to 1.
+        params (Optional[Dict], optional): The parameters of the benchmark.
+        extra (Optional[Dict], optional): Other measurements saved with the result.
+
+    Returns:
+        BenchmarkResult: The summary of the timings.
+    """
+    ordered = sorted(timings)
+    median = statistics.median(ordered)
+    return BenchmarkResult(
+        name=name,
+        group=group,
+        params=params or {},
+        n_rows=n_rows,
+        repeats=len(ordered),
+        median_seconds=median,
+        min_seconds=ordered[0],
+        mean_seconds=statistics.fmean(ordered),
+        p95_seconds=ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        rows_per_second=n_rows / median if median > 0 else 0.0,
+        extra=extra or {},
+    )
+
+
+def get_environment() -> Dict:
+    """
+    Describe the machine and the versions the benchmarks ran with.
+
+    Returns:
+        Dict: The environment, saved with the results.
+    """
+    import numpy
+    import pandas
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+
+def save_results(results: List[BenchmarkResult], file_path: str, environment: Dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    with open(file_path, "w") as results_file:
+        json.dump(
+            {"environment": environment, "results": [asdict(result) for result in results]},
+            results_file,
+            indent=2,
+        )
+
+
+def load_results(file_path: str) -> Dict[str, Dict]:
+    """
+    Load saved results.
+
+    Args:
+        file_path (str): The results file.
+
+    Returns:
+        Dict[str, Dict]: The results by benchmark name.
+    """
+    with open(file_path) as results_file:
+        return {result["name"]: result for result in json.load(results_file)["results"]}
+
+
+def compare_results(
+        results: List[BenchmarkResult],
+        baseline: Dict[str, Dict],
+        threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+) -> List[Dict]:
+    """
+    Compare the median times with a baseline.
+
+    Args:
+        results (List[BenchmarkResult]): The current results.
+        baseline (Dict[str, Dict]): The baseline results by benchmark name.
+        threshold (float, optional): The relative slowdown flagged as a regression.
+
+    Returns:
+        List[Dict]: One comparison per benchmark present in both runs.
+    """
+    comparisons = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if reference is None or not reference["median_seconds"]:
+            continue
+        ratio = result.median_seconds / reference["median_seconds"]
+        comparisons.append({
+            "name": result.name,
+            "baseline_median_seconds": reference["median_seconds"],
+            "median_seconds": result.median_seconds,
+            "ratio": ratio,
+            "status": "regression" if ratio > 1 + threshold else (
+                "improvement" if ratio < 1 - threshold else "unchanged"
+            ),
+        })
+    return comparisons
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds:.3f}s"
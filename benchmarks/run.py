@@ -0,0 +1,141 @@
+"""
+Benchmark suite of the serving and training hot paths.
+
+Usage:
+    python -m benchmarks.run                      # full run, compared with benchmarks/baseline.json
+    python -m benchmarks.run --quick              # small batches and scales, for a pre-merge check
+    python -m benchmarks.run --save-baseline      # store the results as the new baseline
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+# Mongo is replaced by a local stand-in, the url is only read when TrainPipeline creates its MongoDBOperation
+os.environ.setdefault("MONGO_DB_URL", "mongodb://localhost:27017")
+
+from benchmarks.harness import (
+    DEFAULT_REGRESSION_THRESHOLD,
+    compare_results,
+    format_seconds,
+    get_environment,
+    load_results,
+    save_results,
+)
+from benchmarks.stand_ins import LocalS3Operations
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARKS_DIR)
+DEFAULT_OUTPUT_FILE = os.path.join(BENCHMARKS_DIR, "results", "latest.json")
+DEFAULT_BASELINE_FILE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+DEFAULT_BATCH_SIZES = "1,10,100,1000,10000,100000"
+DEFAULT_SCALES = "1,10,100,1000"
+QUICK_BATCH_SIZES = "1,10,100,1000"
+QUICK_SCALES = "1,10"
+
+
+def parse_ints(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default="training,serving,startup", help="Comma separated suites to run.")
+    parser.add_argument("--quick", action="store_true", help=f"Use batch sizes {QUICK_BATCH_SIZES} and scales {QUICK_SCALES}.")
+    parser.add_argument("--batch-sizes", default=None, help=f"Serving batch sizes, default {DEFAULT_BATCH_SIZES}.")
+    parser.add_argument("--scales", default=None, help=f"Training data scales, default {DEFAULT_SCALES}.")
+    parser.add_argument(
+        "--model-trainer-max-scale", type=int, default=1,
+        help="Largest scale the trainer, evaluation and pusher stages run at.",
+    )
+    parser.add_argument(
+        "--training-mode", default=None, choices=["in_memory", "out_of_core"],
+        help="Overrides the training_mode of config/model.yaml.",
+    )
+    parser.add_argument(
+        "--warm-start", action="store_true",
+        help="Continue training the model of the local bucket instead of retraining in full.",
+    )
+    parser.add_argument("--training-repeats", type=int, default=1, help="Runs of the pipeline per scale.")
+    parser.add_argument("--route-requests", type=int, default=200, help="Requests sent to /predict, 0 to skip.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_FILE, help="Results file (json).")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="Baseline results file (json).")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="Relative slowdown flagged as a regression.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline.")
+    parser.add_argument("--workdir", default=None, help="Directory of the artefacts and local bucket, a temporary one by default.")
+    args = parser.parse_args(argv)
+
+    args.suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    args.batch_sizes = parse_ints(args.batch_sizes or (QUICK_BATCH_SIZES if args.quick else DEFAULT_BATCH_SIZES))
+    args.scales = parse_ints(args.scales or (QUICK_SCALES if args.quick else DEFAULT_SCALES))
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    from shipment.logger import configure_logging
+
+    configure_logging()
+    # app.py serves static files and templates relative to the project root
+    os.chdir(PROJECT_DIR)
+
+    from benchmarks.bench_serving import has_model, run_serving_benchmarks
+    from benchmarks.bench_startup import run_startup_benchmarks
+    from benchmarks.bench_training import run_stages, run_training_benchmarks
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="shipment-benchmarks-")
+    local_s3 = LocalS3Operations(os.path.join(workdir, "bucket"))
+    results = []
+    try:
+        if "training" in args.suites:
+            results += run_training_benchmarks(
+                args.scales, workdir, local_s3, args.model_trainer_max_scale, args.training_repeats,
+                args.training_mode, args.warm_start,
+            )
+        if "serving" in args.suites:
+            if not has_model(local_s3):
+                print("Training a model on the train set for the serving benchmarks...")
+                run_stages(1, workdir, local_s3, run_model_stages=True)
+            results += run_serving_benchmarks(local_s3, args.batch_sizes, args.route_requests)
+        if "startup" in args.suites:
+            results += run_startup_benchmarks(PROJECT_DIR)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    environment = get_environment()
+    save_results(results, args.output, environment)
+    print(f"Saved {len(results)} results to {args.output}")
+
+    comparisons = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        comparisons = {
+            comparison["name"]: comparison
+            for comparison in compare_results(results, load_results(args.baseline), args.threshold)
+        }
+
+    print(f"{'benchmark':<52} {'median':>10} {'p95':>10} {'rows/s':>12} {'vs baseline':>20}")
+    for result in results:
+        comparison = comparisons.get(result.name)
+        versus = f"{comparison['ratio']:.2f}x {comparison['status']}" if comparison else "-"
+        print(
+            f"{result.name:<52} {format_seconds(result.median_seconds):>10} "
+            f"{format_seconds(result.p95_seconds):>10} {result.rows_per_second:>12,.0f} {versus:>20}"
+        )
+
+    if args.save_baseline:
+        save_results(results, args.baseline, environment)
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+
+    regressions = [name for name, comparison in comparisons.items() if comparison["status"] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import os
+import shutil
+from typing import Dict, Iterator, List
+
+import pandas as pd
+
+from shipment.constant import DATE_COLUMN_FORMATS
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.mongo_query import get_index_keys
+
+
+def match_condition(column: pd.Series, operator: str, value: object) -> pd.Series:
+    """
+    Evaluate one operator of a query of build_ingestion_query on a column.
+
+    Args:
+        column (pd.Series): The column.
+        operator (str): One of FILTER_OPERATORS but $exists.
+        value (object): The operand.
+
+    Returns:
+        pd.Series: Whether each row matches.
+    """
+    # The dates of the source files are strings, compared as the dates stored by the bulk loader
+    if column.name in DATE_COLUMN_FORMATS and not pd.api.types.is_datetime64_any_dtype(column):
+        column = pd.to_datetime(column, format=DATE_COLUMN_FORMATS[column.name], errors="coerce")
+    if operator in ("$eq", "$ne"):
+        matches = column.isna() if value is None else column == value
+        return matches if operator == "$eq" else ~matches
+    if operator in ("$in", "$nin"):
+        matches = column.isin([item for item in value if item is not None])
+        if None in value:
+            matches |= column.isna()
+        return matches if operator == "$in" else ~matches
+    comparisons = {"$gt": column.gt, "$gte": column.ge, "$lt": column.lt, "$lte": column.le}
+    if operator not in comparisons:
+        raise ValueError(f"Unsupported operator {operator} on {column.name}")
+    return comparisons[operator](value).fillna(False).astype(bool)
+
+
+def filter_frame(df: pd.DataFrame, query: Dict) -> pd.DataFrame:
+    """
+    Select the rows of a frame matching a query of build_ingestion_query.
+
+    Args:
+        df (pd.DataFrame): The rows.
+        query (Dict): The conditions of each column, a missing column matching None only.
+
+    Returns:
+        pd.DataFrame: The matching rows.
+    """
+    mask = pd.Series(True, index=df.index)
+    for column, condition in query.items():
+        values = df[column] if column in df.columns else pd.Series(None, index=df.index, name=column, dtype=object)
+        for operator, value in condition.items():
+            mask &= match_condition(values, operator, value)
+    return df[mask]
+
+
+class LocalMongoOperation:
+    """
+    Stand-in for MongoDBOperation serving a dataframe from memory, so the
+    ingestion stage can be measured without a database. The queries are
+    applied to the frame, and an index is deemed to serve a query once
+    ensure_query_index has created its keys.
+    """
+
+    def __init__(self, df: pd.DataFrame = None):
+        self.df = df
+        self.documents = []
+        self.indexes = set()
+
+    def get_collection_as_dataframe(self, db_name: str, collection_name: str) -> pd.DataFrame:
+        return self.df.copy()
+
+    def get_collection_as_dataframe_chunks(
+            self, db_name: str, collection_name: str, chunk_size: int, projection: Dict = None, query: Dict = None
+    ) -> Iterator[pd.DataFrame]:
+        df = filter_frame(self.df, query) if query else self.df
+        excluded = [
+            column for column, included in (projection or {}).items()
+            if not included and column in df.columns
+        ]
+        for start in range(0, len(df), chunk_size):
+            # Copied like the documents decoded from a cursor, with the excluded fields left out
+            yield df.iloc[start:start + chunk_size].drop(columns=excluded).reset_index(drop=True)
+
+    def ensure_query_index(
+            self, db_name: str, collection_name: str, query: Dict, projection: Dict = None, create: bool = True
+    ) -> Dict:
+        keys = tuple(get_index_keys(query))
+        index_name = None
+        if create and keys:
+            self.indexes.add(keys)
+            index_name = "_".join(f"{key}_{direction}" for key, direction in keys)
+        stages = ["FETCH", "IXSCAN"] if keys in self.indexes else ["COLLSCAN"]
+        return {
+            "keys": [key for key, _ in keys],
+            "index_name": index_name,
+            "stages": stages,
+            "uses_index": "IXSCAN" in stages,
+        }
+
+
+    def insert_documents(self, documents: List[Dict], db_name: str, collection_name: str) -> int:
+        self.documents.extend(documents)
+        return len(documents)
+
+
+class LocalFileObject:
+    """Local equivalent of the s3 object summary returned by S3Operations.get_file_object."""
+
+    def __init__(self, file_path: str):
+        self.key = file_path
+        self.size = os.path.getsize(file_path)
+        self.e_tag = f'"{int(os.path.getmtime(file_path) * 1e6):x}-{self.size:x}"'
+
+
+class LocalS3Operations:
+    """
+    Stand-in for S3Operations keeping the bucket in a local directory, one
+    sub directory per bucket name.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def get_path(self, key: str, bucket_name: str) -> str:
+        return os.path.join(self.root_dir, bucket_name, key)
+
+    def is_model_present(self, bucket_name: str, s3_model_key: str) -> bool:
+        return os.path.exists(self.get_path(s3_model_key, bucket_name))
+
+    def get_file_object(self, filename: str, bucket_name: str) -> LocalFileObject:
+        return LocalFileObject(self.get_path(filename, bucket_name))
+
+    def load_model(self, model_name: str, bucket_name: str, model_dir: str = None) -> object:
+        model_file = model_name if model_dir is None else f"{model_dir}/{model_name}"
+        return MainUtils.load_object(self.get_path(model_file, bucket_name))
+
+    def upload_file(self, from_filename: str, to_filename: str, bucket_name: str, remove: bool = True) -> None:
+        to_path = self.get_path(to_filename, bucket_name)
+        os.makedirs(os.path.dirname(to_path), exist_ok=True)
+        shutil.copyfile(from_filename, to_path)
+        if remove:
+            os.remove(from_filename)
+
+
+def redirect_artefacts(artefacts_dir: str) -> None:
+    """
+    Point the pipeline configs at another artefacts directory, so the benchmark
+    runs do not add timestamped folders to the project artefacts.
+
+    Args:
+        artefacts_dir (str): The directory receiving the artefacts.
+    """
+    from shipment.entity import config_entity
+    from shipment.pipeline import training_pipeline
+
+    config_entity.ARTEFACTS_DIR = artefacts_dir
+    training_pipeline.ARTEFACTS_DIR = artefacts_dir
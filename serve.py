@@ -0,0 +1,24 @@
+"""
+Serving-only entry point: the prediction and metrics routes of app.py, without
+the /train route. The training dependencies (the training pipeline, evidently,
+pymongo, xgboost, category_encoders) are never imported by the serving code,
+only unpickling the model loads what its estimator needs.
+
+Usage:
+    python serve.py
+    uvicorn serve:create_serving_app --factory --host 0.0.0.0 --port 8080
+"""
+from fastapi import FastAPI
+from uvicorn import run as app_run
+
+from app import create_app
+from shipment.constant import APP_HOST, APP_PORT
+
+
+def create_serving_app() -> FastAPI:
+    """Create the app without the /train route, the factory of the serving replicas."""
+    return create_app(include_training=False)
+
+
+if __name__ == "__main__":
+    app_run(create_serving_app(), host=APP_HOST, port=APP_PORT)
@@ -7,6 +7,6 @@ setup(
     author_email='donadviser@gmail.com',
     license='MIT',
     install_requires=[],
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*", "tests", "tests.*"]),
     version='0.1.0',
 )
\ No newline at end of file
@@ -0,0 +1,66 @@
+import sys
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.monitoring.metrics import PREDICT_LATENCY
+from shipment.utils.sparse_matrix import estimator_input
+
+
+class CostModel:
+    def __init__(
+            self,
+            preprocessing_object: object,
+            trained_model_object: object,
+            reference_profile: dict = None,
+            ):
+        self.preprocessing_object = preprocessing_object
+        self.trained_model_object = trained_model_object
+        self.reference_profile = reference_profile
+        # Serialised ONNX graph of the whole model, set by ModelExporter when enabled
+        self.onnx_model = None
+
+
+    def predict(self, X) -> float:
+        """
+        This method predicts the data
+
+        Args:
+            X (pd.DataFrame): The data to be predicted.
+
+        Returns:
+            float: The predicted data.
+        """
+        try:
+            # Predict the data
+            with PREDICT_LATENCY.labels(phase="preprocess").time():
+                transformed_feature = self.preprocessing_object.transform(X)
+            logging.debug("Used the trained model to get predictions")
+
+            return self.predict_transformed(transformed_feature)
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def predict_transformed(self, transformed_feature) -> float:
+        """
+        This method predicts the data already transformed by the preprocessor,
+        or by an equivalent encoder such as TemplateEncoder
+
+        Args:
+            transformed_feature (object): The transformed features.
+
+        Returns:
+            float: The predicted data.
+        """
+        try:
+            with PREDICT_LATENCY.labels(phase="estimator").time():
+                return self.trained_model_object.predict(
+                    estimator_input(self.trained_model_object, transformed_feature)
+                )
+        except Exception as e:
+            raise ShipmentException(e, sys)
+        
+    def __repr__(self) -> str:
+        return f"{type(self.trained_model_object).__name__}()"
+    
+    def __str__(self) -> str:
+        return f"{type(self.trained_model_object).__name__}()"
@@ -1,12 +1,15 @@
 import sys
 import os
-from typing import Tuple
+from typing import Dict, Tuple
 from shipment.logger import logging
 from shipment.exception import ShipmentException
 
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from shipment.configuration.mongo_operations import MongoDBOperation
+from shipment.utils.schema_validator import SchemaValidator
+from shipment.utils.dtype_plan import DtypePlan, log_memory_usage
+from shipment.utils.mongo_query import build_ingestion_query
 from shipment.entity.config_entity import DataIngestionConfig
 from shipment.entity.artefacts_entity import DataIngestionArtefacts
 from shipment.constant import TEST_SIZE
@@ -20,11 +23,59 @@ class DataIngestion:
             ):
         self.data_ingestion_config = data_ingestion_config
         self.mongo_op = mongo_op
+        self.dtype_plan = DtypePlan(self.data_ingestion_config.SCHEMA_CONFIG)
+        # The drop_columns are left out by the Mongo projection, so they are not validated either
+        self.schema_validator = SchemaValidator(
+            self.data_ingestion_config.SCHEMA_CONFIG,
+            exclude_columns=self.data_ingestion_config.DROP_COLS,
+        )
+
+    # This method builds the query of the documents pulled from mongoDB
+    def get_ingestion_query(self) -> Dict:
+        """
+        Get the query of the training window and filters of the data_ingestion config.
+        Its compound index is created when ensure_indexes is set, and the plan of the
+        query is checked with explain, so a pull does not scan the whole collection of
+        a shared cluster when require_index is set.
+
+        Returns:
+            Dict: The query, empty when the whole collection is pulled.
+        """
+        logging.info("Entered the get_ingestion_query method of DataIngestion class")
+        try:
+            ingestion_config = self.data_ingestion_config.INGESTION_CONFIG
+            query = build_ingestion_query(ingestion_config)
+            if not query:
+                logging.info("Exited the get_ingestion_query method of DataIngestion class")
+                return query
+
+            report = self.mongo_op.ensure_query_index(
+                self.data_ingestion_config.DB_NAME,
+                self.data_ingestion_config.COLLECTION_NAME,
+                query,
+                projection=self.dtype_plan.projection,
+                create=bool(ingestion_config.get("ensure_indexes", True)),
+            )
+            if not report["uses_index"]:
+                message = f"The query {query} is not served by an index, its plan is {report['stages']}"
+                if ingestion_config.get("require_index", True):
+                    raise ValueError(message)
+                logging.warning(message)
+            logging.info("Exited the get_ingestion_query method of DataIngestion class")
+            return query
+        except Exception as e:
+            raise ShipmentException(e, sys)
 
     # This method will fetch data from mongoDB
     def get_data_from_mongodb(self) -> pd.DataFrame:
         """
-        Get the data from mongoDB.
+        Get the data from mongoDB. The documents of the training window and filters
+        of the data_ingestion config are selected by the server, through an index,
+        and streamed in chunks which are validated against the schema as they arrive,
+        so missing columns or values of the wrong type stop the ingestion at the first
+        bad chunk. The drop_columns are never fetched and every chunk is converted to
+        the dtype plan before the next one is read, so the raw object columns of only
+        one chunk are held at a time.
 
         Returns:
             pd.DataFrame: The data from mongoDB.
@@ -34,8 +85,27 @@ class DataIngestion:
 
             db_name = self.data_ingestion_config.DB_NAME
             collection_name = self.data_ingestion_config.COLLECTION_NAME
-            df = self.mongo_op.get_collection_as_dataframe(db_name, collection_name)
-            logging.info("Obtaied the dataframe from mongodb")
+            query = self.get_ingestion_query()
+            chunks = []
+            report = None
+            for chunk in self.mongo_op.get_collection_as_dataframe_chunks(
+                db_name, collection_name, self.data_ingestion_config.CHUNK_SIZE,
+                projection=self.dtype_plan.projection, query=query,
+            ):
+                report = self.schema_validator.validate_chunk(chunk, report)
+                if self.schema_validator.has_structural_errors(report):
+                    report = self.schema_validator.finalize(report)
+                    raise ValueError(
+                        f"Schema validation failed on chunk {report.n_chunks} for columns {report.failed_columns}"
+                    )
+                chunks.append(self.dtype_plan.apply(chunk))
+
+            if not chunks:
+                raise ValueError(f"No documents found in the {collection_name} collection matching {query}")
+            self.schema_validator.finalize(report)
+            df = self.dtype_plan.concat(chunks)
+            log_memory_usage("The ingested dataframe", df)
+            logging.info(f"Obtaied the dataframe from mongodb in {report.n_chunks} chunks")
             logging.info("Exited the get_data_from_mongodb method of DataIngestion class")
             return df
         except Exception as e:
@@ -96,13 +166,9 @@ class DataIngestion:
         """
         logging.info("Entered the initiate_data_ingestion method of DataIngestion class")
         try:
-            # Getting the data from mongoDB
+            # Getting the data from mongoDB, without the unnecessary columns
             df = self.get_data_from_mongodb()
-
-            # Dropping the unnecessary columns from the dataframe
-            df1 = df.drop(columns=self.data_ingestion_config.DROP_COLS, axis=1)
-            df1 = df1.dropna()
-            logging.info("Obtained the data from mongodb and dropped the unnecessary columns from the dataframe")
+            logging.info("Obtained the data from mongodb without the unnecessary columns")
 
             # Splitting the data as train set and test set
             train_set, test_set = self.split_data_as_train_test(df)
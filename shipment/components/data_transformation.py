@@ -1,5 +1,6 @@
 import os
 import sys
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
 import numpy as np
 
@@ -10,6 +11,16 @@ from category_encoders.binary import BinaryEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 
+from shipment.constant import (
+    ARRAY_ARTEFACT_PART_FILE_NAME,
+    FEATURE_DTYPE,
+    OUT_OF_CORE_PROFILE_SAMPLE_ROWS,
+    TRAINING_MODE_OUT_OF_CORE,
+    TRANSFORMED_DATA_COMPRESSION,
+)
+from shipment.monitoring.drift_monitor import build_reference_profile
+from shipment.utils.dtype_plan import DtypePlan, log_memory_usage
+from shipment.utils.sparse_matrix import to_feature_matrix
 from shipment.entity.config_entity import DataTransformationConfig
 from shipment.entity.artefacts_entity import (
     DataIngestionArtefacts,
@@ -21,22 +32,34 @@ class DataTransformation:
             self,
             data_ingestion_artefacts: DataIngestionArtefacts,
             data_transformation_config: DataTransformationConfig,
+            preprocessor: object = None,
     ):
         
         self.data_ingestion_artefacts = data_ingestion_artefacts
         self.data_transformation_config = data_transformation_config
+        # Fitted preprocessor of the champion model when warm starting, reused as it is
+        self.preprocessor = preprocessor
 
-        # Reading the Train and Test data from Data Ingestion Artefacts folder
-        self.train_set = pd.read_csv(self.data_ingestion_artefacts.train_data_file_path)
-        self.test_set = pd.read_csv(self.data_ingestion_artefacts.test_data_file_path)
+        # Reading the Train and Test data from Data Ingestion Artefacts folder, in
+        # out_of_core mode they are read chunk by chunk during the transformation
+        self.dtype_plan = DtypePlan(self.data_transformation_config.SCHEMA_CONFIG)
+        self.train_set = self.test_set = None
+        if self.data_transformation_config.TRAINING_MODE != TRAINING_MODE_OUT_OF_CORE:
+            self.train_set = self.dtype_plan.read_csv(self.data_ingestion_artefacts.train_data_file_path)
+            self.test_set = self.dtype_plan.read_csv(self.data_ingestion_artefacts.test_data_file_path)
+            log_memory_usage("The train set", self.train_set)
         logging.info("Initiated data transformation for the dataset")
 
     
     # This method is used to get the transformer object
-    def get_data_transformer_object(self) -> object:
+    def get_data_transformer_object(self, categories: Dict[str, List] = None) -> object:
         """
         Get the data transformer object. This method gives preprocessor object
 
+        Args:
+            categories (Dict[str, List], optional): The categories of each one hot column,
+                learnt from the data by the OneHotEncoder when not given. Defaults to None.
+
         Returns:
             object: The data transformer object.
         """
@@ -51,17 +74,23 @@ class DataTransformation:
 
             # Creating the transformer object
             numerical_transformer  = StandardScaler()
-            oh_transformer = OneHotEncoder(handle_unknown='ignore')
+            oh_transformer = OneHotEncoder(
+                categories='auto' if categories is None else [categories[column] for column in onehot_columns],
+                handle_unknown='ignore',
+                dtype=FEATURE_DTYPE,
+            )
             binary_transformer = BinaryEncoder()
             logging.info(f"Initialised the StandardScaler, OneHotEncoder and BinaryEncoder")
 
-            # Using transformer objects in column transformer
+            # Using transformer objects in column transformer, the sparse one hot
+            # output is kept sparse whatever the density of the stacked features
             preprocessor = ColumnTransformer(
                 transformers=[
                     ('OneHotEncoder', oh_transformer, onehot_columns),
                     ('BinaryEncoder', binary_transformer, binary_columns),
                     ('StandardScaler', numerical_transformer, numerical_columns),                   
                 ],
+                sparse_threshold=1.0,
             )
             logging.info("Created preprocessor object from ColumnTransformer.")
             logging.info("Exited the get_data_transformer_object method of DataTransformation class.")
@@ -108,6 +137,202 @@ class DataTransformation:
         except Exception as e:
             raise ShipmentException(e, sys)
         
+    # This method is used to save the fitted preprocessor and the reference profile
+    def save_preprocessor_and_reference_profile(self, preprocessor: object, reference_df: pd.DataFrame) -> str:
+        """
+        Save the fitted preprocessor and the reference profile of the drift monitor.
+
+        Args:
+            preprocessor (object): The fitted preprocessor.
+            reference_df (pd.DataFrame): The raw training features, or a sample of them.
+
+        Returns:
+            str: The preprocessor file path.
+        """
+        logging.info("Entered the save_preprocessor_and_reference_profile method of DataTransformation class.")
+        try:
+            preprocessor_obj_file = self.data_transformation_config.UTILS.save_object(
+                self.data_transformation_config.PREPROCESSOR_FILE_PATH,
+                preprocessor,
+            )
+            logging.info("Created the preprocessor object and saving the object")
+
+            # Profiling the raw training features, used as reference by the online drift monitor
+            reference_profile = build_reference_profile(
+                reference_df,
+                numerical_columns=self.data_transformation_config.SCHEMA_CONFIG['numerical_columns'],
+                categorical_columns=self.data_transformation_config.SCHEMA_CONFIG['onehot_columns'],
+            )
+            self.data_transformation_config.UTILS.write_json_to_yaml(
+                reference_profile,
+                self.data_transformation_config.REFERENCE_PROFILE_FILE_PATH,
+            )
+            logging.info("Saved the reference profile of the training features")
+            logging.info("Exited the save_preprocessor_and_reference_profile method of DataTransformation class.")
+            return preprocessor_obj_file
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    # This method is used to fit the preprocessor on the train set read chunk by chunk
+    def fit_preprocessor_out_of_core(self, chunk_size: int) -> Tuple[object, int]:
+        """
+        Fit the preprocessor without loading the train set. The StandardScaler is
+        fitted chunk by chunk with partial_fit while the categories of the encoded
+        columns are collected. The ColumnTransformer is then fitted on a small
+        frame holding every category once, and its scaler is given the
+        statistics of the incrementally fitted one.
+
+        Args:
+            chunk_size (int): The number of rows read at a time.
+
+        Returns:
+            Tuple[object, int]: The fitted preprocessor and the number of rows of the train set.
+        """
+        logging.info("Entered the fit_preprocessor_out_of_core method of DataTransformation class.")
+        try:
+            schema_config = self.data_transformation_config.SCHEMA_CONFIG
+            numerical_columns = schema_config['numerical_columns']
+            encoded_columns = list(dict.fromkeys(schema_config['onehot_columns'] + schema_config['binary_columns']))
+
+            scaler = StandardScaler()
+            # Categories in order of first appearance, None standing for the missing value
+            seen_categories = {column: {} for column in encoded_columns}
+            n_rows = 0
+            for chunk in self.dtype_plan.read_csv_chunks(self.data_ingestion_artefacts.train_data_file_path, chunk_size):
+                scaler.partial_fit(chunk[numerical_columns])
+                for column in encoded_columns:
+                    for value in chunk[column].unique():
+                        seen_categories[column].setdefault(None if pd.isna(value) else value)
+                n_rows += len(chunk)
+            logging.info(f"Fitted the StandardScaler and collected the categories over {n_rows} rows")
+
+            # Sorted with the missing value last, as the OneHotEncoder orders the categories it learns itself
+            categories = {
+                column: sorted(value for value in seen if value is not None) + ([np.nan] if None in seen else [])
+                for column, seen in seen_categories.items()
+            }
+            # The BinaryEncoder numbers the categories by first appearance, the frame keeps that order
+            appearance_order = {
+                column: [np.nan if value is None else value for value in seen] or [np.nan]
+                for column, seen in seen_categories.items()
+            }
+            n_frame_rows = max(len(values) for values in appearance_order.values()) if appearance_order else 1
+            category_frame = pd.DataFrame({
+                **{column: 0.0 for column in numerical_columns},
+                **{
+                    column: [values[index % len(values)] for index in range(n_frame_rows)]
+                    for column, values in appearance_order.items()
+                },
+            }, index=range(n_frame_rows))
+
+            preprocessor = self.get_data_transformer_object(categories=categories)
+            preprocessor.fit(category_frame)
+            fitted_scaler = preprocessor.named_transformers_['StandardScaler']
+            for attribute in ("mean_", "var_", "scale_", "n_samples_seen_"):
+                setattr(fitted_scaler, attribute, getattr(scaler, attribute))
+            logging.info("Fitted the preprocessor object without loading the train set")
+            logging.info("Exited the fit_preprocessor_out_of_core method of DataTransformation class.")
+            return preprocessor, n_rows
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    # This method is used to transform a csv file chunk by chunk
+    def transform_out_of_core(
+            self,
+            preprocessor: object,
+            file_path: str,
+            output_dir: str,
+            chunk_size: int,
+            sample_fraction: float = 0.0,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Transform a CSV artefact chunk by chunk, saving each transformed chunk as an
+        array artefact in output_dir.
+
+        Args:
+            preprocessor (object): The fitted preprocessor.
+            file_path (str): The CSV file.
+            output_dir (str): The directory receiving one array artefact per chunk.
+            chunk_size (int): The number of rows read at a time.
+            sample_fraction (float, optional): The share of raw input rows kept and returned. Defaults to 0.0.
+
+        Returns:
+            Optional[pd.DataFrame]: The sample of the raw input features, None without sampling.
+        """
+        logging.info("Entered the transform_out_of_core method of DataTransformation class.")
+        try:
+            target_column_name = self.data_transformation_config.SCHEMA_CONFIG['target_column']
+            feature_names = preprocessor.get_feature_names_out()
+            os.makedirs(output_dir, exist_ok=True)
+
+            samples = []
+            for index, chunk in enumerate(self.dtype_plan.read_csv_chunks(file_path, chunk_size)):
+                input_feature_df = chunk.drop(columns=[target_column_name])
+                self.data_transformation_config.UTILS.save_sparse_matrix_data(
+                    os.path.join(output_dir, ARRAY_ARTEFACT_PART_FILE_NAME.format(index)),
+                    to_feature_matrix(preprocessor.transform(input_feature_df)),
+                    chunk[target_column_name].to_numpy(dtype=FEATURE_DTYPE),
+                    feature_names=feature_names,
+                    target_name=target_column_name,
+                    compress=TRANSFORMED_DATA_COMPRESSION,
+                )
+                if sample_fraction > 0:
+                    samples.append(input_feature_df.sample(frac=sample_fraction, random_state=index))
+            logging.info(f"Transformed {os.path.basename(file_path)} chunk by chunk into {output_dir}")
+            logging.info("Exited the transform_out_of_core method of DataTransformation class.")
+            return self.dtype_plan.concat(samples) if samples else None
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    # This method is used to run the data transformation chunk by chunk
+    def initiate_out_of_core_data_transformation(self) -> DataTransformationArtefacts:
+        """
+        Initiate the data transformation in out_of_core mode: the train and test
+        sets are never loaded whole, the transformed data is written as
+        directories of array artefacts, one per chunk, and the reference profile
+        is built on a sample of the train set.
+
+        Returns:
+            DataTransformationArtefacts: The data transformation artefacts.
+        """
+        logging.info("Entered the initiate_out_of_core_data_transformation method of DataTransformation class.")
+        try:
+            chunk_size = int(self.data_transformation_config.OUT_OF_CORE_CONFIG["chunk_size"])
+            if self.preprocessor is None:
+                preprocessor, n_rows = self.fit_preprocessor_out_of_core(chunk_size)
+            else:
+                preprocessor = self.preprocessor
+                with open(self.data_ingestion_artefacts.train_data_file_path) as train_file:
+                    n_rows = sum(1 for _ in train_file) - 1
+
+            reference_sample = self.transform_out_of_core(
+                preprocessor,
+                self.data_ingestion_artefacts.train_data_file_path,
+                self.data_transformation_config.TRANSFORMED_TRAIN_FILE_PATH,
+                chunk_size,
+                sample_fraction=min(1.0, OUT_OF_CORE_PROFILE_SAMPLE_ROWS / max(n_rows, 1)),
+            )
+            self.transform_out_of_core(
+                preprocessor,
+                self.data_ingestion_artefacts.test_data_file_path,
+                self.data_transformation_config.TRANSFORMED_TEST_FILE_PATH,
+                chunk_size,
+            )
+            logging.info("Created the transformed train and test dataset chunks")
+
+            preprocessor_obj_file = self.save_preprocessor_and_reference_profile(preprocessor, reference_sample)
+
+            data_transformation_artefacts = DataTransformationArtefacts(
+                transformed_object_file_path=preprocessor_obj_file,
+                transformed_train_file_path=self.data_transformation_config.TRANSFORMED_TRAIN_FILE_PATH,
+                transformed_test_file_path=self.data_transformation_config.TRANSFORMED_TEST_FILE_PATH,
+                reference_profile_file_path=self.data_transformation_config.REFERENCE_PROFILE_FILE_PATH,
+            )
+            logging.info("Exited the initiate_out_of_core_data_transformation method of DataTransformation class.")
+            return data_transformation_artefacts
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
     # This method is used to initialise data transformation
     def initiate_data_transformation(self) -> DataTransformationArtefacts:
         """
@@ -122,8 +347,11 @@ class DataTransformation:
             os.makedirs(self.data_transformation_config.DATA_TRANSFORMATION_ARTEFACTS_DIR, exist_ok=True)
             logging.info(f"Created the data transformation artefacts directory for {os.path.basename(self.data_transformation_config.DATA_TRANSFORMATION_ARTEFACTS_DIR)}")
 
+            if self.data_transformation_config.TRAINING_MODE == TRAINING_MODE_OUT_OF_CORE:
+                return self.initiate_out_of_core_data_transformation()
+
             # Getting the preprocessor object
-            preprocessor = self.get_data_transformer_object()
+            preprocessor = self.get_data_transformer_object() if self.preprocessor is None else self.preprocessor
             logging.info("Obtained the transformer object")
 
             target_column_name = self.data_transformation_config.SCHEMA_CONFIG['target_column']
@@ -149,21 +377,22 @@ class DataTransformation:
             logging.info("Obtained the input features and target feature for Test dataset")
 
             # Applying preprocessing object on training dataframe and testing dataframe
-            input_feature_train_array = preprocessor.fit_transform(input_feature_train_df)
+            if self.preprocessor is None:
+                input_feature_train_array = preprocessor.fit_transform(input_feature_train_df)
+            else:
+                input_feature_train_array = preprocessor.transform(input_feature_train_df)
             input_feature_test_array = preprocessor.transform(input_feature_test_df)
+            feature_names = preprocessor.get_feature_names_out()
             logging.info("Applied the preprocessor object on training and testing dataframe")
 
-            # Concatenating input features and target features array for Train dataset and Test dataset
-            train_array = np.c_[
-                input_feature_train_array,
-                target_feature_train_df.values.reshape(-1, 1),
-            ]
-
-            test_array = np.c_[
-                input_feature_test_array,
-                target_feature_test_df.values.reshape(-1, 1),
-            ]
-            logging.info("Concatenated the input features and target features array for Train and Test dataset")
+            # Keeping the features as CSR matrices, saved next to their target vector
+            input_feature_train_matrix = to_feature_matrix(input_feature_train_array)
+            input_feature_test_matrix = to_feature_matrix(input_feature_test_array)
+            target_feature_train_array = target_feature_train_df.to_numpy(dtype=FEATURE_DTYPE)
+            target_feature_test_array = target_feature_test_df.to_numpy(dtype=FEATURE_DTYPE)
+            del input_feature_train_array, input_feature_test_array
+            log_memory_usage("The transformed train features", input_feature_train_matrix)
+            logging.info("Converted the input features of the Train and Test dataset to CSR matrices")
 
             # Creating directory for transformed train dataset array and saving the array
             os.makedirs(
@@ -171,9 +400,13 @@ class DataTransformation:
                 exist_ok=True,
             )
 
-            transformed_train_file = self.data_transformation_config.UTILS.save_numpy_array_data(
+            transformed_train_file = self.data_transformation_config.UTILS.save_sparse_matrix_data(
                 self.data_transformation_config.TRANSFORMED_TRAIN_FILE_PATH,
-                train_array,
+                input_feature_train_matrix,
+                target_feature_train_array,
+                feature_names=feature_names,
+                target_name=target_column_name,
+                compress=TRANSFORMED_DATA_COMPRESSION,
             )
 
             # Creating directory for transformed test dataset array and saving the array
@@ -182,23 +415,25 @@ class DataTransformation:
                 exist_ok=True,
             )
 
-            transformed_test_file = self.data_transformation_config.UTILS.save_numpy_array_data(
+            transformed_test_file = self.data_transformation_config.UTILS.save_sparse_matrix_data(
                 self.data_transformation_config.TRANSFORMED_TEST_FILE_PATH,
-                test_array,
+                input_feature_test_matrix,
+                target_feature_test_array,
+                feature_names=feature_names,
+                target_name=target_column_name,
+                compress=TRANSFORMED_DATA_COMPRESSION,
             )
 
-            preprocessor_obj_file = self.data_transformation_config.UTILS.save_object(
-                self.data_transformation_config.PREPROCESSOR_FILE_PATH,
-                preprocessor,
-            )
-            logging.info("Created the preprocessor object and saving the object")
-            logging.info("Created the transformed train dataset array and saving the array")
-            logging.info("Created the transformed test dataset array and saving the array")
+            preprocessor_obj_file = self.save_preprocessor_and_reference_profile(preprocessor, input_feature_train_df)
+            logging.info("Created the transformed train dataset matrix and saving the matrix")
+            logging.info("Created the transformed test dataset matrix and saving the matrix")
+
             logging.info("Exited the initiate_data_transformation method of DataTransformation class.")
             data_transformation_artefacts = DataTransformationArtefacts(
                 transformed_object_file_path = preprocessor_obj_file,
                 transformed_train_file_path=transformed_train_file,
                 transformed_test_file_path=transformed_test_file,
+                reference_profile_file_path=self.data_transformation_config.REFERENCE_PROFILE_FILE_PATH,
             )
 
             return data_transformation_artefacts
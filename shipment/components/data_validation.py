@@ -2,7 +2,7 @@ import json
 import os
 import sys
 import pandas as pd
-from typing import Tuple, Union
+from typing import Union
 
 from evidently import ColumnMapping
 from evidently.report import Report
@@ -11,6 +11,8 @@ from evidently.metric_preset import DataDriftPreset
 
 from shipment.logger import logging
 from shipment.exception import ShipmentException
+from shipment.utils.schema_validator import SchemaValidator
+from shipment.utils.dtype_plan import DtypePlan
 from shipment.entity.config_entity import DataValidationConfig
 from shipment.entity.artefacts_entity import (
     DataIngestionArtefacts,
@@ -26,173 +28,14 @@ class DataValidation:
     ):
         self.data_ingestion_artefacts = data_ingestion_artefacts
         self.data_validation_config = data_validation_config
+        self.dtype_plan = DtypePlan(self.data_validation_config.SCHEMA_CONFIG)
+        # The drop_columns are not ingested, so they are not validated either
+        self.schema_validator = SchemaValidator(
+            self.data_validation_config.SCHEMA_CONFIG,
+            exclude_columns=self.dtype_plan.drop_columns,
+        )
         
 
-    # This method is used to validate schema columns
-    def validate_schema_columns(self, df:pd.DataFrame) -> bool:
-        """
-        Validate schema columns.
-
-        Args:
-            df (pd.DataFrame): The dataframe to be validated.
-
-        Returns:
-            bool: The validation status.
-        """
-        logging.info("Entered the validate_schema_columns method of DataValidation class.")
-        try:
-            # Checking the len of the dataframe columns and schema file columns
-            if len(df.columns) == len(self.data_validation_config.SCHEMA_CONFIG["columns"]):
-                validation_status = True
-            else:
-                validation_status = False
-            return validation_status
-            
-        except Exception as e:
-            raise ShipmentException(e, sys)
-
-    # This method is used to validate the numerical columns
-    def is_numerical_column_exists(self, df:pd.DataFrame) -> bool:
-        """
-        Validate numerical columns.
-
-        Args:
-            df (pd.DataFrame): The dataframe to be validated.
-
-        Returns:
-            bool: The validation status.
-        """
-        logging.info("Entered the validate_numerical_columns method of DataValidation class.")
-        try:
-            validation_status = False
-
-            # Checking numerical schema columns with dataframe numerical columns
-            for column in self.data_validation_config.SCHEMA_CONFIG["numerical_columns"]:
-                if column not in df.columns:
-                    validation_status = False
-                    logging.info(f"Numerical column - {column} not found in dataframe")
-                else:
-                    validation_status = True
-
-            return validation_status
-        except Exception as e:
-            raise ShipmentException(e, sys)
-        
-    # This method is used to validate the categorical columns
-    def is_categorical_column_exists(self, df:pd.DataFrame) -> bool:
-        """
-        Validate categorical columns.
-
-        Args:
-            df (pd.DataFrame): The dataframe to be validated.
-
-        Returns:
-            bool: The validation status.
-        """
-        logging.info("Entered the validate_categorical_columns method of DataValidation class.")
-        try:
-            validation_status = False
-
-            # Checking categorical schema columns with dataframe categorical columns
-            for column in self.data_validation_config.SCHEMA_CONFIG["categorical_columns"]:
-                if column not in df.columns:
-                    validation_status = False
-                    logging.info(f"Categorical column - {column} not found in dataframe")
-                else:
-                    validation_status = True
-
-            return validation_status
-        except Exception as e:
-            raise ShipmentException(e, sys)
-        
-    # This method is used to validate dataset schema columns
-    def validate_dataset_schema_columns(self) -> Tuple[bool, bool]:
-        """
-        Validate dataset schema.
-
-        Args:
-            df (pd.DataFrame): The dataframe to be validated.
-
-        Returns:
-            bool: The validation status.
-        """
-        logging.info("Entered the validate_dataset_schema method of DataValidation class.")
-        try:
-            logging.info("Validating dataset schema columns")
-            
-            # Validating schema columns for Train dataframe
-            train_schema_status = self.validate_schema_columns(self.train_set)
-            logging.info("Validated dataset schema columns on the train set")
-
-            # Validating schema columns for Test dataframe
-            test_schema_status = self.validate_schema_columns(self.test_set)
-            logging.info("Validated dataset schema columns on the test set")
-
-            logging.info("Validated dataset schema columns")
-
-            return train_schema_status, test_schema_status
-        except Exception as e:
-            raise ShipmentException(e, sys)
-        
-
-    # This method is used to validate dataset numerical columns
-    def validate_is_numerical_column_exists(self) -> Tuple[bool, bool]:
-        """
-        Validate dataset numerical columns.
-
-        Args:
-            df (pd.DataFrame): The dataframe to be validated.
-
-        Returns:
-            bool: The validation status.
-        """
-        logging.info("Entered the validate_is_numerical_column_exists method of DataValidation class.")
-        try:
-            logging.info("Validating dataset numerical columns")
-            
-            # Validating numerical columns for Train dataframe
-            train_num_datatype_status = self.is_numerical_column_exists(self.train_set)
-            logging.info("Validated dataset numerical columns on the train set")
-
-            # Validating numerical columns for Test dataframe
-            test_num_datatype_status = self.is_numerical_column_exists(self.test_set)
-            logging.info("Validated dataset numerical columns on the test set")
-
-            logging.info("Validated dataset numerical columns")
-
-            return train_num_datatype_status, test_num_datatype_status
-        except Exception as e:
-            raise ShipmentException(e, sys)
-        
-    # This method is used to validate the categorical columns
-    def validate_is_categorical_column_exists(self) -> Tuple[bool, bool]:
-        """
-        Validate dataset categorical columns.
-
-        Args:
-            df (pd.DataFrame): The dataframe to be validated.
-
-        Returns:
-            bool: The validation status.
-        """
-        logging.info("Entered the validate_is_categorical_column_exists method of DataValidation class.")
-        try:
-            logging.info("Validating dataset categorical columns")
-            
-            # Validating categorical columns for Train dataframe
-            train_cat_datatype_status = self.is_categorical_column_exists(self.train_set)
-            logging.info("Validated dataset categorical columns on the train set")
-
-            # Validating categorical columns for Test dataframe
-            test_cat_datatype_status = self.is_categorical_column_exists(self.test_set)
-            logging.info("Validated dataset categorical columns on the test set")
-
-            logging.info("Validated dataset categorical columns")
-
-            return train_cat_datatype_status, test_cat_datatype_status
-        except Exception as e:
-            raise ShipmentException(e, sys)
-            
     def detect_dataset_drift(self, reference: pd.DataFrame, production: pd.DataFrame, get_ratio: bool = False) -> Union[bool, float]:
         """
         Detect data drift between reference and production dataframes.
@@ -250,10 +93,10 @@ class DataValidation:
         try:
             # Reading the Train and Test data from Data Ingestion Artefacts folder
 
-            self.train_set = pd.read_csv(
+            self.train_set = self.dtype_plan.read_csv(
                 self.data_ingestion_artefacts.train_data_file_path
             )
-            self.test_set = pd.read_csv(
+            self.test_set = self.dtype_plan.read_csv(
                 self.data_ingestion_artefacts.test_data_file_path
             )
             logging.info("Initiated data validation for the dataset")
@@ -266,37 +109,17 @@ class DataValidation:
 
             # Checking the dataset drift
             drift = self.detect_dataset_drift(self.train_set, self.test_set)
-            (
-                schema_train_col_status,
-                schema_test_col_status,
-            ) = self.validate_dataset_schema_columns()
-            logging.info(f"Schema train cols status is {schema_train_col_status} and schema test cols status is {schema_test_col_status}")
-
-            (
-                schema_train_cat_cols_status,
-                schema_test_cat_cols_status,
-            ) = self.validate_is_categorical_column_exists()
-            logging.info(f"Schema train cat cols status is {schema_train_cat_cols_status} and schema test cat cols status is {schema_test_cat_cols_status}")
-
-            (
-                schema_train_num_cols_status,
-                schema_test_num_cols_status,
-            ) = self.validate_is_numerical_column_exists()
-            logging.info(f"Schema train num cols status is {schema_train_num_cols_status} and schema test num cols status is {schema_test_num_cols_status}")
 
-            logging.info("Validated dataset schema for numerical datatype")
+            # Validating presence, dtype, null rate, ranges and domains of train and test sets in one pass
+            schema_report = self.schema_validator.validate(self.train_set, self.test_set)
+            self.data_validation_config.UTILS.write_json_to_yaml(
+                schema_report.to_dict(),
+                self.data_validation_config.SCHEMA_VALIDATION_REPORT_FILE_PATH,
+            )
 
             # Checking drift status, initially the status is None
             drift_status = None
-            if (
-                schema_train_cat_cols_status is True and
-                schema_test_cat_cols_status is True and
-                schema_train_num_cols_status is True and
-                schema_test_num_cols_status is True and
-                schema_train_col_status is True and
-                schema_test_col_status is True and
-                drift is False
-            ):
+            if schema_report.validation_status is True and drift is False:
                 logging.info(f"Dataset schema validation completed")
                 drift_status = True
             else:
@@ -306,6 +129,7 @@ class DataValidation:
             data_validation_artefacts = DataValidationArtefacts(
                 data_drift_file_path=self.data_validation_config.DATA_DRIFT_FILE_PATH,
                 validation_status=drift_status,
+                schema_validation_report_file_path=self.data_validation_config.SCHEMA_VALIDATION_REPORT_FILE_PATH,
             )
 
             return data_validation_artefacts
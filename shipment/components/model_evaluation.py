@@ -1,11 +1,11 @@
 import os
 import sys
-import pandas as pd
 from dataclasses import dataclass
 from shipment.logger import logging
 from shipment.exception import ShipmentException
 from shipment.constant import *
 from shipment.entity.config_entity import ModelEvaluationConfig
+from shipment.utils.dtype_plan import DtypePlan
 from shipment.entity.artefacts_entity import (
     DataIngestionArtefacts,
     ModelTrainerArtefacts,
@@ -79,7 +79,9 @@ class ModelEvaluation:
         
         try:
             # Reading the test data and splitting it into train and test
-            test_df = pd.read_csv(self.data_ingestion_artefact.test_data_file_path)
+            test_df = DtypePlan(self.model_evaluation_config.SCHEMA_CONFIG).read_csv(
+                self.data_ingestion_artefact.test_data_file_path
+            )
             X, y = test_df.drop(TARGET_COLUMN, axis=1), test_df[TARGET_COLUMN]
             logging.info("Loaded the test data from DataIngestionArtefacts directory and splitted the data into X and y")
 
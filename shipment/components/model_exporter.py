@@ -0,0 +1,87 @@
+import os
+import sys
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.constant import TARGET_COLUMN
+from shipment.entity.config_entity import ModelExporterConfig
+from shipment.utils.dtype_plan import DtypePlan
+from shipment.utils.onnx_export import onnx_export_with_report
+from shipment.entity.artefacts_entity import (
+    DataIngestionArtefacts,
+    ModelTrainerArtefacts,
+    ModelExporterArtefacts,
+)
+
+
+
+class ModelExporter:
+    def __init__(
+            self,
+            model_trainer_artefact: ModelTrainerArtefacts,
+            model_exporter_config: ModelExporterConfig,
+            data_ingestion_artefact: DataIngestionArtefacts,
+        ):
+        self.model_trainer_artefact = model_trainer_artefact
+        self.model_exporter_config = model_exporter_config
+        self.data_ingestion_artefact = data_ingestion_artefact
+
+
+    # This method is used to start the model export
+    def initiate_model_exporter(self) -> ModelExporterArtefacts:
+        """
+        Export the trained cost model to a single ONNX graph when the onnx_export
+        config is enabled, and check its predictions on the test set. The graph is
+        stored in the cost model file, for the onnx serving backend, when they match.
+
+        Returns:
+            ModelExporterArtefacts: The model exporter artefacts.
+        """
+        logging.info("Entered the initiate_model_exporter method of ModelExporter class.")
+        try:
+            onnx_export_config = self.model_exporter_config.ONNX_EXPORT_CONFIG
+            if not onnx_export_config.get("enabled"):
+                logging.info("The ONNX export is disabled in the model config file")
+                logging.info("Exited the initiate_model_exporter method of ModelExporter class.")
+                return ModelExporterArtefacts()
+
+            os.makedirs(self.model_exporter_config.MODEL_EXPORTER_ARTEFACTS_DIR, exist_ok=True)
+            logging.info("Created the model exporter artefacts directory")
+
+            # Reading the test data, the predictions of the graph are checked on it
+            test_df = DtypePlan(self.model_exporter_config.SCHEMA_CONFIG).read_csv(
+                self.data_ingestion_artefact.test_data_file_path
+            )
+            X, y = test_df.drop(TARGET_COLUMN, axis=1), test_df[TARGET_COLUMN]
+            logging.info("Loaded the test data from DataIngestionArtefacts directory")
+
+            trained_model_file_path = self.model_trainer_artefact.trained_model_file_path
+            cost_model = self.model_exporter_config.UTILS.load_object(trained_model_file_path)
+            onnx_model, report = onnx_export_with_report(
+                cost_model, X, y, float(onnx_export_config.get("parity_tolerance", 1e-4))
+            )
+            self.model_exporter_config.UTILS.write_json_to_yaml(
+                report, self.model_exporter_config.ONNX_EXPORT_REPORT_FILE_PATH
+            )
+            logging.info("Saved the ONNX export report")
+
+            onnx_model_file_path = None
+            if onnx_model is not None:
+                onnx_model_file_path = self.model_exporter_config.ONNX_MODEL_FILE_PATH
+                with open(onnx_model_file_path, "wb") as onnx_model_file:
+                    onnx_model_file.write(onnx_model)
+
+                # Pushed with the cost model, the serving backend is selected per deployment
+                cost_model.onnx_model = onnx_model
+                self.model_exporter_config.UTILS.save_object(trained_model_file_path, cost_model)
+                logging.info("Saved the ONNX graph with the cost model")
+            else:
+                logging.warning("The cost model is pushed without its ONNX graph, see the ONNX export report")
+
+            model_exporter_artefact = ModelExporterArtefacts(
+                onnx_model_file_path=onnx_model_file_path,
+                onnx_export_report_file_path=self.model_exporter_config.ONNX_EXPORT_REPORT_FILE_PATH,
+            )
+            logging.info("Exited the initiate_model_exporter method of ModelExporter class.")
+            return model_exporter_artefact
+        except Exception as e:
+            raise ShipmentException(e, sys)
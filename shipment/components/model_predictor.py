@@ -1,11 +1,24 @@
 
 import sys
-from typing import Dict
+import time
+import threading
+from typing import Dict, List
+import numpy as np
 import pandas as pd
 from shipment.logger import logging
 from shipment.exception import ShipmentException
 from shipment.constant import *
 from shipment.configuration.s3_operations import S3Operations
+from shipment.monitoring.drift_monitor import DriftMonitor
+from shipment.monitoring.metrics import (
+    MODEL_CACHE_REQUESTS,
+    MODEL_INFO,
+    MODEL_LOAD_SECONDS,
+    MODEL_SIZE_BYTES,
+    PREDICT_LATENCY,
+)
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.schema_validator import RequestValidator
 
 
 
@@ -50,7 +63,7 @@ class ShippingData:
         Returns:
             Dict: The data.
         """
-        logging.info("Entered the get_data method of ShippingData class")
+        logging.debug("Entered the get_data method of ShippingData class")
         try:
             # Saving the features as dictionary
             input_data = {
@@ -69,7 +82,7 @@ class ShippingData:
                     "Customer Information": [self.customerInformation],
                     "Remote Location": [self.remoteLocation],
             }
-            logging.info("Exited the get_data method of ShippingData class")
+            logging.debug("Exited the get_data method of ShippingData class")
             return input_data
         except Exception as e:
             raise ShipmentException(e, sys)
@@ -82,22 +95,249 @@ class ShippingData:
         Returns:
             pd.DataFrame: The input data frame.
         """
-        logging.info("Entered the get_input_data_frame method of ShippingData class")
+        logging.debug("Entered the get_input_data_frame method of ShippingData class")
         try:
             # Getting the input data in dictionary format
             input_dict = self.get_data()
-            logging.info("Obtained the input data in dictionary format")
-            logging.info("Exited the get_input_data_frame method of ShippingData class")
-            return pd.DataFrame(input_dict)
+            logging.debug("Obtained the input data in dictionary format")
+            logging.debug("Exited the get_input_data_frame method of ShippingData class")
+
+            # Object columns, as seen by the preprocessor in training, even for a single missing category
+            return pd.DataFrame(input_dict, dtype=object)
         
         except Exception as e:
             raise ShipmentException(e, sys)
 
 
+class ServedModel:
+    """
+    A model of the bucket with everything derived from it for serving. A new
+    ServedModel replaces the old one whole when the model changes, so a request
+    never mixes the model of one version with the encoders of another.
+    """
+
+    def __init__(self, model: object, model_version: str):
+        self.model = model
+        self.model_version = model_version
+        self.drift_monitor = None
+        self.request_validator = None
+        self.template_encoder = None
+        self.onnx_model = None
+        # Built on the first explanation and sweep requests, most deployments make neither
+        self.explainer = None
+        self.sweep_encoder = None
+
+
 class CostPredictor:
-    def __init__(self):
+    # The model is shared by every predictor of the process, it is loaded from s3 once and
+    # its ETag is compared with the bucket's every MODEL_REFRESH_INTERVAL seconds
+    _served: ServedModel = None
+    _next_refresh_time = 0.0
+    _lock = threading.Lock()
+
+    def __init__(
+            self,
+            serving_preprocessing: str = SERVING_PREPROCESSING_COLUMN_TRANSFORMER,
+            serving_backend: str = SERVING_BACKEND_PYTHON,
+            onnx_intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+            explain_cache_size: int = EXPLAIN_CACHE_SIZE,
+            refresh_interval: float = MODEL_REFRESH_INTERVAL,
+    ):
         self.s3 = S3Operations()
         self.bucket_name = BUCKET_NAME
+        self.serving_preprocessing = serving_preprocessing
+        self.serving_backend = serving_backend
+        self.onnx_intra_op_threads = onnx_intra_op_threads
+        self.explain_cache_size = explain_cache_size
+        self.refresh_interval = refresh_interval
+
+    @classmethod
+    def invalidate_model(cls) -> None:
+        """Compare the ETag of the bucket's model on the next request, after a push."""
+        cls._next_refresh_time = 0.0
+
+    def load_served_model(self, model_file: object, model_version: str) -> ServedModel:
+        """
+        Load the model of the bucket and build everything derived from it.
+
+        Args:
+            model_file (object): The s3 object summary of the model.
+            model_version (str): The ETag of the model.
+
+        Returns:
+            ServedModel: The model ready to serve.
+        """
+        start_time = time.perf_counter()
+        model = self.s3.load_model(MODEL_FILE_NAME, self.bucket_name)
+        served = ServedModel(model, model_version)
+        logging.info(f"Loaded best model version {model_version} from s3 bucket")
+
+        # Models trained before drift monitoring have no reference profile
+        reference_profile = getattr(model, "reference_profile", None)
+        if reference_profile is not None:
+            served.drift_monitor = DriftMonitor(reference_profile)
+
+        # Compiling the request checks from the schema and the categories learned by the model
+        schema_config = MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH)
+        preprocessing_object = getattr(model, "preprocessing_object", None)
+        served.request_validator = RequestValidator(schema_config, preprocessing_object)
+        # Precomputing the encoded categorical part of the rows, when it reproduces the preprocessor
+        if self.serving_preprocessing == SERVING_PREPROCESSING_TEMPLATE:
+            from shipment.utils.template_encoder import TemplateEncoder
+
+            if TemplateEncoder.supports(preprocessing_object):
+                served.template_encoder = TemplateEncoder(preprocessing_object)
+            else:
+                logging.warning("The preprocessor of the model is not supported by TemplateEncoder")
+        # Running the ONNX graph exported with the model, preprocessor included
+        if self.serving_backend == SERVING_BACKEND_ONNX:
+            onnx_model = getattr(model, "onnx_model", None)
+            if onnx_model is not None:
+                from shipment.utils.onnx_backend import OnnxCostModel
+
+                served.onnx_model = OnnxCostModel(onnx_model, self.onnx_intra_op_threads)
+            else:
+                logging.warning("The model has no ONNX graph, it is served by the python backend")
+
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start_time)
+        MODEL_SIZE_BYTES.set(getattr(model_file, "size", 0) or 0)
+        MODEL_INFO.clear()
+        MODEL_INFO.labels(version=model_version, model=str(model)).set(1)
+        return served
+
+    def get_served_model(self) -> ServedModel:
+        """
+        Get the served model, loading it from s3 bucket on first use, and again when the
+        ETag of the bucket's model changed. The ETag is read at most every refresh_interval
+        seconds, by one request while the others keep the current model.
+
+        Returns:
+            ServedModel: The served model.
+        """
+        served = CostPredictor._served
+        if served is not None and time.monotonic() < CostPredictor._next_refresh_time:
+            MODEL_CACHE_REQUESTS.labels(result="hit").inc()
+            return served
+
+        if not CostPredictor._lock.acquire(blocking=served is None):
+            MODEL_CACHE_REQUESTS.labels(result="hit").inc()
+            return served
+        try:
+            served = CostPredictor._served
+            if served is None or time.monotonic() >= CostPredictor._next_refresh_time:
+                model_file = self.s3.get_file_object(MODEL_FILE_NAME, self.bucket_name)
+                model_version = str(getattr(model_file, "e_tag", "unknown")).strip('"')
+                if served is None or served.model_version != model_version:
+                    MODEL_CACHE_REQUESTS.labels(result="miss").inc()
+                    served = self.load_served_model(model_file, model_version)
+                    CostPredictor._served = served
+                else:
+                    MODEL_CACHE_REQUESTS.labels(result="hit").inc()
+                CostPredictor._next_refresh_time = time.monotonic() + self.refresh_interval
+            else:
+                MODEL_CACHE_REQUESTS.labels(result="hit").inc()
+            return served
+        finally:
+            CostPredictor._lock.release()
+
+    def get_model(self) -> object:
+        """
+        Get the best model, see get_served_model.
+
+        Returns:
+            object: The best model.
+        """
+        return self.get_served_model().model
+
+    @property
+    def model_version(self) -> str:
+        return None if CostPredictor._served is None else CostPredictor._served.model_version
+
+    def validate_request(self, form_data: Dict) -> tuple:
+        """
+        Validate the raw fields of a prediction request before any inference work.
+
+        Args:
+            form_data (Dict): Field name to raw value.
+
+        Returns:
+            tuple: The converted values by field name and the list of offending fields.
+        """
+        try:
+            return self.get_served_model().request_validator.validate(form_data)
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def validate_columns(self, columns: Dict) -> tuple:
+        """
+        Validate a batch of requests given column by column.
+
+        Args:
+            columns (Dict): Column name, as in the schema, to the values of the rows.
+
+        Returns:
+            tuple: The input data frame, None if a row is invalid, and the list of errors by column.
+        """
+        try:
+            return self.get_served_model().request_validator.validate_columns(columns)
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def validate_sweep(self, input_data: Dict, sweep: Dict) -> tuple:
+        """
+        Validate the values of the fields swept around a validated request.
+
+        Args:
+            input_data (Dict): The converted values by field name, as returned by validate_request.
+            sweep (Dict): Swept field name to its raw values.
+
+        Returns:
+            tuple: The input data frame of the request repeated with each swept field set to
+                each of its values, by column, and the list of errors by field.
+        """
+        try:
+            request_validator = self.get_served_model().request_validator
+            axes, errors = {}, []
+            for field_name, values in sweep.items():
+                axis, axis_errors = request_validator.validate_axis(input_data, field_name, values)
+                errors += axis_errors
+                if axis is not None:
+                    axes[SHIPPING_DATA_FIELDS[field_name]] = axis
+            return axes, errors
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    @property
+    def drift_monitor(self) -> DriftMonitor:
+        return None if CostPredictor._served is None else CostPredictor._served.drift_monitor
+
+    def update_drift_monitor(self, input_data: Dict) -> None:
+        """
+        Feed the features of a request to the online drift monitor.
+
+        Args:
+            input_data (Dict): The input data as returned by ShippingData.get_data.
+        """
+        try:
+            drift_monitor = self.drift_monitor
+            if drift_monitor is not None:
+                drift_monitor.update(input_data)
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def update_drift_monitor_columns(self, X: pd.DataFrame) -> None:
+        """
+        Feed the features of a batch of requests to the online drift monitor.
+
+        Args:
+            X (pd.DataFrame): The input data frame of the batch.
+        """
+        try:
+            drift_monitor = self.drift_monitor
+            if drift_monitor is not None:
+                drift_monitor.update_columns({column: X[column].to_numpy() for column in X.columns})
+        except Exception as e:
+            raise ShipmentException(e, sys)
 
     def predict(self, X) -> float:
         """
@@ -110,16 +350,102 @@ class CostPredictor:
             float: The predicted data.
 
         """
-        logging.info("Entered the predict method of ModelPredictor class")
+        logging.debug("Entered the predict method of ModelPredictor class")
         try:
-            # Loading the best model from s3 bucket
-            best_model = self.s3.load_model(MODEL_FILE_NAME, self.bucket_name)
-            logging.info("Loaded best model from s3 bucket")
+            # Getting the best model, loaded from s3 bucket on the first call
+            served = self.get_served_model()
+            best_model = served.model
 
             # Predicting the data with the best model
-            results = best_model.predict(X)
-            logging.info("Exited the predict method of ModelPredictor class")
+            template_encoder = served.template_encoder
+            if served.onnx_model is not None:
+                with PREDICT_LATENCY.labels(phase="onnx").time():
+                    results = served.onnx_model.predict(X)
+            elif template_encoder is None:
+                results = best_model.predict(X)
+            else:
+                with PREDICT_LATENCY.labels(phase="preprocess").time():
+                    transformed_feature = template_encoder.transform(X)
+                results = best_model.predict_transformed(transformed_feature)
+            logging.debug("Exited the predict method of ModelPredictor class")
             return results
         
         except Exception as e:
-            raise ShipmentException(e, sys)
\ No newline at end of file
+            raise ShipmentException(e, sys)
+
+    def explain(self, X: pd.DataFrame) -> List[Dict]:
+        """
+        Explain the predictions of the rows by the contribution of every request field.
+
+        Args:
+            X (pd.DataFrame): The data to be explained.
+
+        Returns:
+            List[Dict]: Per row, the prediction, the base value and the contribution of every field.
+        """
+        logging.debug("Entered the explain method of ModelPredictor class")
+        try:
+            served = self.get_served_model()
+            if served.explainer is None:
+                with CostPredictor._lock:
+                    if served.explainer is None:
+                        from shipment.utils.explainer import CostExplainer
+
+                        served.explainer = CostExplainer(
+                            served.model, served.model_version, cache_size=self.explain_cache_size
+                        )
+                        logging.info("Built the explainer of the best model")
+
+            template_encoder = served.template_encoder
+            with PREDICT_LATENCY.labels(phase="explain").time():
+                explanations = served.explainer.explain(
+                    X, template_encoder.transform if template_encoder is not None else None
+                )
+            logging.debug("Exited the explain method of ModelPredictor class")
+            return explanations
+
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def sweep(self, base: pd.DataFrame, axes: Dict[str, pd.DataFrame]) -> np.ndarray:
+        """
+        Predict the cost over a what-if grid around a request, in a single call of the model.
+
+        Args:
+            base (pd.DataFrame): The request, as returned by ShippingData.get_input_data_frame.
+            axes (Dict[str, pd.DataFrame]): Swept column to the request repeated with the column
+                set to each of its values, as returned by validate_sweep.
+
+        Returns:
+            np.ndarray: The predictions, with one dimension per swept column.
+        """
+        logging.debug("Entered the sweep method of ModelPredictor class")
+        try:
+            from shipment.utils.sweep import SweepEncoder, get_grid_frame
+            from shipment.utils.template_encoder import TemplateEncoder
+
+            served = self.get_served_model()
+            best_model = served.model
+            if served.sweep_encoder is None:
+                with CostPredictor._lock:
+                    if served.sweep_encoder is None:
+                        # False when the preprocessor does not encode the columns independently
+                        sweep_encoder = False
+                        if TemplateEncoder.supports(best_model.preprocessing_object):
+                            sweep_encoder = SweepEncoder(best_model.preprocessing_object)
+                        served.sweep_encoder = sweep_encoder
+
+            if served.onnx_model is not None:
+                with PREDICT_LATENCY.labels(phase="onnx").time():
+                    results = served.onnx_model.predict(get_grid_frame(base, axes))
+            elif served.sweep_encoder:
+                with PREDICT_LATENCY.labels(phase="preprocess").time():
+                    transformed_feature = served.sweep_encoder.transform(base, axes)
+                results = best_model.predict_transformed(transformed_feature)
+            else:
+                results = best_model.predict(get_grid_frame(base, axes))
+            logging.debug("Exited the sweep method of ModelPredictor class")
+            return np.asarray(results).reshape([len(axis) for axis in axes.values()])
+
+        except Exception as e:
+            raise ShipmentException(e, sys)
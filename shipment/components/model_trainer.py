@@ -1,49 +1,82 @@
+import copy
 import os
+import shutil
 import sys
-import pandas as pd
+from functools import lru_cache
+import numpy as np
+from scipy import sparse
 from typing import List, Tuple
 
 from shipment.logger import logging
 from shipment.exception import ShipmentException
-from shipment.constant import MODEL_CONFIG_FILE
+from shipment.constant import MODEL_CONFIG_FILE, TRAINING_MODE_OUT_OF_CORE, XGBOOST_CACHE_DIR
+from shipment.utils.array_artefact import list_array_artefact_parts
+from shipment.utils.compact_forest import compact_forest_with_report, is_forest
+from shipment.utils.dtype_plan import log_memory_usage
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.sparse_matrix import estimator_input
 from shipment.entity.config_entity import ModelTrainerConfig
+# Also keeps the models pickled before CostModel moved to its serving module loadable
+from shipment.components.cost_model import CostModel
 from shipment.entity.artefacts_entity import (
     DataTransformationArtefacts,
     ModelTrainerArtefacts,
 )
 
-class CostModel:
-    def __init__(
-            self, preprocessing_object: object, trained_model_object: object):
-        self.preprocessing_object = preprocessing_object
-        self.trained_model_object = trained_model_object
+@lru_cache(maxsize=None)
+def get_sparse_matrix_chunk_iter_class() -> type:
+    """
+    Get the SparseMatrixChunkIter class, defined with the first out_of_core training
+    as it subclasses xgboost.DataIter and xgboost is only imported by the training code.
 
+    Returns:
+        type: The SparseMatrixChunkIter class.
+    """
+    import xgboost
 
-    def predict(self, X) -> float:
+    class SparseMatrixChunkIter(xgboost.DataIter):
+        """
+        Feeds the chunks of a transformed data artefact to an XGBoost DMatrix one at
+        a time. Each chunk is memory mapped, so only the chunk being read is resident.
         """
-        This method predicts the data
 
-        Args:
-            X (pd.DataFrame): The data to be predicted.
+        def __init__(self, path: str, cache_prefix: str):
+            self.file_paths = list_array_artefact_parts(path)
+            self.utils = MainUtils()
+            self.index = 0
+            super().__init__(cache_prefix=cache_prefix)
 
-        Returns:
-            float: The predicted data.
-        """
-        try:
-            # Predict the data
-            transformed_feature = self.preprocessing_object.transform(X)
-            logging.info("Used the trained model to get predictions")
-             
-            return self.trained_model_object.predict(transformed_feature)
-        except Exception as e:
-            raise ShipmentException(e, sys)
-        
-    def __repr__(self) -> str:
-        return f"{type(self.trained_model_object).__name__}()"
-    
-    def __str__(self) -> str:
-        return f"{type(self.trained_model_object).__name__}()"
+        def next(self, input_data) -> bool:
+            if self.index == len(self.file_paths):
+                return False
+            features, target = self.utils.load_sparse_matrix_data(self.file_paths[self.index])
+            input_data(data=features, label=target)
+            self.index += 1
+            return True
+
+        def reset(self) -> None:
+            self.index = 0
 
+    return SparseMatrixChunkIter
+
+
+def can_warm_start(estimator: object) -> bool:
+    """
+    Whether an estimator can be trained further: an XGBoost model, continued
+    from its booster, or an ensemble growing more estimators with warm_start.
+
+    Args:
+        estimator (object): The fitted estimator.
+
+    Returns:
+        bool: True if the estimator can be warm started.
+    """
+    import xgboost
+
+    if isinstance(estimator, xgboost.XGBModel):
+        return True
+    params = estimator.get_params() if hasattr(estimator, "get_params") else {}
+    return "warm_start" in params and "n_estimators" in params
 
 
 class ModelTrainer:
@@ -51,20 +84,26 @@ class ModelTrainer:
             self,
             data_transformation_artefact: DataTransformationArtefacts,
             model_trainer_config: ModelTrainerConfig,
+            champion: CostModel = None,
     ):
         self.data_transformation_artefact = data_transformation_artefact
         self.model_trainer_config = model_trainer_config
+        # Current model of the bucket when warm starting, see TrainPipeline.get_warm_start_champion
+        self.champion = champion
 
 
     # This method is used to get the trained models
     def get_trained_models(
-            self, X_data: pd.DataFrame, y_data: pd.DataFrame
+            self,
+            train_data: Tuple[sparse.csr_matrix, np.ndarray],
+            test_data: Tuple[sparse.csr_matrix, np.ndarray],
             ) -> List[Tuple[float, object, str]]:
         """
         Get the trained models.
 
         Args:
-            X_data (pd.DataFrame): The X data.
+            train_data (Tuple[sparse.csr_matrix, np.ndarray]): The train features and target.
+            test_data (Tuple[sparse.csr_matrix, np.ndarray]): The test features and target.
         
         Returns:
             List[Tuple[float, object, str]]: The trained models.
@@ -72,19 +111,12 @@ class ModelTrainer:
         logging.info("Entered the get_trained_models method of ModelTrainer class.")
         try:
             # Get the model lists from model config file
-            model_config = self.model_trainer_config.UTILS.read_yaml_file(
-                filename=MODEL_CONFIG_FILE
-            )
+            model_config = self.model_trainer_config.UTILS.read_yaml_file_cached(MODEL_CONFIG_FILE)
             models_list = list(model_config["train_model"].keys())
             logging.info("Got model list from tthe config file")
 
-            # Splitting the data in X_train, y_train  X_test, and y_test
-            X_train, y_train, X_test, y_test = (
-                X_data.drop(X_data.columns[len(X_data.columns) - 1], axis=1),
-                X_data.iloc[:, -1],
-                y_data.drop(y_data.columns[len(y_data.columns) - 1], axis=1),
-                y_data.iloc[:, -1],
-            )
+            X_train, y_train = train_data
+            X_test, y_test = test_data
 
             # Getting the trained model list
             tuned_model_list = [
@@ -101,6 +133,144 @@ class ModelTrainer:
         except Exception as e:
             raise ShipmentException(e, sys)
         
+    # This method is used to train the champion model further instead of from scratch
+    def get_warm_started_models(
+            self,
+            train_data: Tuple[sparse.csr_matrix, np.ndarray],
+            test_data: Tuple[sparse.csr_matrix, np.ndarray],
+            ) -> List[Tuple[float, object, str]]:
+        """
+        Train a copy of the champion estimator further on the train data, with its
+        hyperparameters: an XGBoost model boosts n_new_estimators more rounds from
+        the champion's booster, a forest grows n_new_estimators more trees with
+        warm_start. There is no grid search.
+
+        Args:
+            train_data (Tuple[sparse.csr_matrix, np.ndarray]): The train features and target.
+            test_data (Tuple[sparse.csr_matrix, np.ndarray]): The test features and target.
+
+        Returns:
+            List[Tuple[float, object, str]]: The warm started model with its score.
+        """
+        logging.info("Entered the get_warm_started_models method of ModelTrainer class.")
+        try:
+            import xgboost
+
+            n_new_estimators = int(self.model_trainer_config.WARM_START_CONFIG["n_new_estimators"])
+            model = copy.deepcopy(self.champion.trained_model_object)
+            X_train, y_train = train_data
+            X_test, y_test = test_data
+            X_train = estimator_input(model, X_train)
+
+            if isinstance(model, xgboost.XGBModel):
+                n_rounds = model.get_booster().num_boosted_rounds()
+                model.set_params(n_estimators=n_new_estimators)
+                model.fit(X_train, y_train, xgb_model=model.get_booster())
+                model.set_params(n_estimators=n_rounds + n_new_estimators)
+            else:
+                model.set_params(warm_start=True, n_estimators=model.n_estimators + n_new_estimators)
+                model.fit(X_train, y_train)
+                model.set_params(warm_start=False)
+            logging.info(f"Added {n_new_estimators} estimators to the champion {type(model).__name__}")
+
+            preds = model.predict(estimator_input(model, X_test))
+            model_score = self.model_trainer_config.UTILS.get_model_score(y_test, preds)
+            logging.info("Exited the get_warm_started_models method of ModelTrainer class.")
+            return [(model_score, model, type(model).__name__)]
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    # This method is used to export a forest to its compact serving copy
+    def get_compact_forest(self, forest: object) -> Tuple[object, float]:
+        """
+        Export the winning forest to a CompactForest, pruned with the prune_tolerance
+        of the compact_forest config, and save the report of its size and accuracy.
+
+        Args:
+            forest (object): The fitted forest regressor.
+
+        Returns:
+            Tuple[object, float]: The compact forest and its score on the test set.
+        """
+        logging.info("Entered the get_compact_forest method of ModelTrainer class.")
+        try:
+            X_test, y_test = self.model_trainer_config.UTILS.load_sparse_matrix_data(
+                self.data_transformation_artefact.transformed_test_file_path
+            )
+            compact_forest, report = compact_forest_with_report(
+                forest,
+                estimator_input(forest, X_test),
+                y_test,
+                prune_tolerance=float(self.model_trainer_config.COMPACT_FOREST_CONFIG.get("prune_tolerance", 0.0)),
+            )
+            os.makedirs(self.model_trainer_config.MODEL_TRAINER_ARTEFACTS_DIR, exist_ok=True)
+            self.model_trainer_config.UTILS.write_json_to_yaml(
+                report, self.model_trainer_config.COMPACT_FOREST_REPORT_FILE_PATH
+            )
+            logging.info("Exited the get_compact_forest method of ModelTrainer class.")
+            return compact_forest, report["compact_r2_score"]
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    # This method is used to train on the transformed data chunk by chunk
+    def get_out_of_core_trained_models(self) -> List[Tuple[float, object, str]]:
+        """
+        Train an XGBRegressor on the transformed train chunks through XGBoost's
+        external memory DMatrix, which keeps its quantised pages in a cache
+        directory on disk instead of holding the train set in memory. There is no
+        grid search, the parameters come from the out_of_core section of the model
+        config. The model is scored on the test chunks, one at a time.
+
+        Returns:
+            List[Tuple[float, object, str]]: The trained model with its score.
+        """
+        logging.info("Entered the get_out_of_core_trained_models method of ModelTrainer class.")
+        try:
+            import xgboost
+
+            params = dict(self.model_trainer_config.OUT_OF_CORE_CONFIG["XGBRegressor"])
+            n_estimators = int(params.pop("n_estimators"))
+            params["max_bin"] = int(params.get("max_bin", 256))
+            # Warm starting boosts a few more rounds from the champion's booster
+            champion_booster, n_rounds = None, n_estimators
+            if self.champion is not None:
+                champion_booster = self.champion.trained_model_object.get_booster()
+                n_rounds = int(self.model_trainer_config.WARM_START_CONFIG["n_new_estimators"])
+
+            cache_dir = os.path.join(self.model_trainer_config.MODEL_TRAINER_ARTEFACTS_DIR, XGBOOST_CACHE_DIR)
+            os.makedirs(cache_dir, exist_ok=True)
+            try:
+                train_matrix = xgboost.ExtMemQuantileDMatrix(
+                    get_sparse_matrix_chunk_iter_class()(
+                        self.data_transformation_artefact.transformed_train_file_path,
+                        cache_prefix=os.path.join(cache_dir, "train"),
+                    ),
+                    max_bin=params["max_bin"],
+                )
+                booster = xgboost.train(
+                    {"tree_method": "hist", **params}, train_matrix, num_boost_round=n_rounds, xgb_model=champion_booster,
+                )
+                del train_matrix
+            finally:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            logging.info(f"Trained XGBRegressor on the train chunks with {params} and {n_rounds} rounds")
+
+            # Wrapping the booster in the sklearn estimator served by CostModel
+            model = xgboost.XGBRegressor(n_estimators=booster.num_boosted_rounds(), **params)
+            model.load_model(bytearray(booster.save_raw(raw_format="ubj")))
+
+            y_test, y_pred = [], []
+            for X_chunk, y_chunk in self.model_trainer_config.UTILS.iter_sparse_matrix_data(
+                self.data_transformation_artefact.transformed_test_file_path
+            ):
+                y_test.append(y_chunk)
+                y_pred.append(model.predict(X_chunk))
+            model_score = self.model_trainer_config.UTILS.get_model_score(np.concatenate(y_test), np.concatenate(y_pred))
+            logging.info("Exited the get_out_of_core_trained_models method of ModelTrainer class.")
+            return [(model_score, model, type(model).__name__)]
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
     # This method is used to initialise model training
     def initiate_model_trainer(self) -> ModelTrainerArtefacts:
         """
@@ -115,23 +285,34 @@ class ModelTrainer:
             os.makedirs(self.model_trainer_config.MODEL_TRAINER_ARTEFACTS_DIR, exist_ok=True)
             logging.info(f"Created the model trainer artefacts directory for {os.path.basename(self.model_trainer_config.MODEL_TRAINER_ARTEFACTS_DIR)}")
 
-            # Loading the train array data and reading it into a DataFrame
-            train_array = self.model_trainer_config.UTILS.load_numpy_array_data(
-                self.data_transformation_artefact.transformed_train_file_path
-            )
-            train_df = pd.DataFrame(train_array)
-            logging.info("Loaded train array from DataTransformationArtefacts directory and converted into DataFrame")
+            if self.model_trainer_config.TRAINING_MODE == TRAINING_MODE_OUT_OF_CORE:
+                # Training on the transformed chunks without loading them together
+                list_of_trained_models = self.get_out_of_core_trained_models()
+            elif self.champion is not None:
+                list_of_trained_models = self.get_warm_started_models(
+                    self.model_trainer_config.UTILS.load_sparse_matrix_data(
+                        self.data_transformation_artefact.transformed_train_file_path
+                    ),
+                    self.model_trainer_config.UTILS.load_sparse_matrix_data(
+                        self.data_transformation_artefact.transformed_test_file_path
+                    ),
+                )
+            else:
+                # Loading the train features as a CSR matrix and the train target
+                train_data = self.model_trainer_config.UTILS.load_sparse_matrix_data(
+                    self.data_transformation_artefact.transformed_train_file_path
+                )
+                log_memory_usage("The train features", train_data[0])
+                logging.info("Loaded train data from DataTransformationArtefacts directory")
 
-            #Loading the test array data and reading it into a DataFrame
-            test_array = self.model_trainer_config.UTILS.load_numpy_array_data(
-                self.data_transformation_artefact.transformed_test_file_path
-            )
-        
-            test_df = pd.DataFrame(test_array)
-            logging.info("Loaded test array from DataTransformationArtefacts directory and converted into DataFrame")
+                #Loading the test features and target
+                test_data = self.model_trainer_config.UTILS.load_sparse_matrix_data(
+                    self.data_transformation_artefact.transformed_test_file_path
+                )
+                logging.info("Loaded test data from DataTransformationArtefacts directory")
 
-            # Getting the models list and finding the best model with score
-            list_of_trained_models = self.get_trained_models(train_df, test_df)
+                # Getting the models list and finding the best model with score
+                list_of_trained_models = self.get_trained_models(train_data, test_data)
             logging.info("Got the list of tuple of model score, model and model_name")
 
             (
@@ -142,6 +323,12 @@ class ModelTrainer:
             )
             logging.info("Got the best model and its score")
 
+            compact_forest_report_file_path = None
+            if self.model_trainer_config.COMPACT_FOREST_CONFIG.get("enabled") and is_forest(best_model):
+                best_model, best_model_score = self.get_compact_forest(best_model)
+                compact_forest_report_file_path = self.model_trainer_config.COMPACT_FOREST_REPORT_FILE_PATH
+                logging.info("Replaced the best model with its compact forest")
+
             # Loading the preprocessor object
             preprocessor_obj_file_path =  (
                 self.data_transformation_artefact.transformed_object_file_path
@@ -152,10 +339,14 @@ class ModelTrainer:
             )
             logging.info("Loaded the preprocessor object from DataTransformationArtefacts directory")
 
-            # Reading model config file for getting the best model score
-            model_config = self.model_trainer_config.UTILS.read_yaml_file(
-                filename=MODEL_CONFIG_FILE
+            # Loading the reference profile of the training features for drift monitoring
+            reference_profile = self.model_trainer_config.UTILS.read_yaml_file(
+                filename=self.data_transformation_artefact.reference_profile_file_path
             )
+            logging.info("Loaded the reference profile from DataTransformationArtefacts directory")
+
+            # Reading model config file for getting the best model score
+            model_config = self.model_trainer_config.UTILS.read_yaml_file_cached(MODEL_CONFIG_FILE)
             base_model_score = float(model_config["base_model_score"])
             logging.info("Got the best model score from model config file")
 
@@ -165,7 +356,7 @@ class ModelTrainer:
                 #logging.info("Updated the best model score to model config file")
 
                 # Loading cost model object with preprocessor and model
-                cost_model = CostModel(preprocessing_obj, best_model)
+                cost_model = CostModel(preprocessing_obj, best_model, reference_profile)
                 logging.info("Created the cost model object with preprocessor and model")
                 
                 trained_model_path = self.model_trainer_config.TRAINED_MODEL_FILE_PATH
@@ -182,7 +373,9 @@ class ModelTrainer:
             
             # Savind the Model trainer artefacts
             model_trainer_artefacts = ModelTrainerArtefacts(
-                trained_model_file_path=model_file_path
+                trained_model_file_path=model_file_path,
+                warm_started=self.champion is not None,
+                compact_forest_report_file_path=compact_forest_report_file_path,
             )
             logging.info("Created the model trainer artefacts")
             logging.info("Exited the initiate_model_trainer method of ModelTrainer class.")
@@ -1,18 +1,77 @@
+import os
 import sys
-from json import loads
-from typing import Collection
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Collection, Dict, Iterator, List
 import pandas as pd
 from pymongo.database import Database
-from pymongo import MongoClient
-from shipment.constant import DB_URL
+from pymongo.errors import BulkWriteError
+from pymongo import MongoClient, ReplaceOne
+from shipment.constant import (
+    MONGO_DB_URL_ENV_KEY,
+    MONGO_INSERT_BATCH_SIZE,
+    MONGO_INSERT_WORKERS,
+    MONGO_MAX_POOL_SIZE,
+)
 from shipment.exception import ShipmentException
 from shipment.logger import logging
+from shipment.utils.mongo_query import get_index_keys, get_plan_stages
+
+
+def get_records(data_frame: pd.DataFrame) -> List[Dict]:
+    """
+    Convert the rows of a dataframe to documents ready for BSON, column by column
+    without a JSON round trip: the numpy values become Python ints, floats, bools
+    and datetimes, and the missing values None.
+
+    Args:
+        data_frame (pd.DataFrame): The dataframe.
+
+    Returns:
+        List[Dict]: One document per row.
+    """
+    columns = [str(column) for column in data_frame.columns]
+    values = [
+        data_frame[column].astype(object).where(data_frame[column].notna(), None).tolist()
+        for column in data_frame.columns
+    ]
+    return [dict(zip(columns, row)) for row in zip(*values)]
 
 
 class MongoDBOperation:
-    def __init__(self):
-        self.DB_URL = DB_URL
-        self.client = MongoClient(self.DB_URL)
+    # One pooled client per url, shared by every MongoDBOperation of the process
+    _clients: Dict[str, MongoClient] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, db_url: str = None):
+        # Read from the environment when the pipeline starts, importing the package does not need it
+        self.DB_URL = db_url or os.environ.get(MONGO_DB_URL_ENV_KEY)
+        if not self.DB_URL:
+            raise EnvironmentError(f"{MONGO_DB_URL_ENV_KEY} is not set")
+        self.client = self.get_client(self.DB_URL)
+
+    @classmethod
+    def get_client(cls, db_url: str) -> MongoClient:
+        """
+        Get the client of a url, created on first use. The client connects in the
+        background and keeps a pool of at most MONGO_MAX_POOL_SIZE connections.
+
+        Args:
+            db_url (str): The MongoDB url.
+
+        Returns:
+            MongoClient: The shared client.
+        """
+        client = cls._clients.get(db_url)
+        if client is None:
+            with cls._lock:
+                client = cls._clients.get(db_url)
+                if client is None:
+                    client = MongoClient(db_url, maxPoolSize=MONGO_MAX_POOL_SIZE)
+                    cls._clients[db_url] = client
+        return client
 
 
     def get_database(self, db_name) -> Database:
@@ -85,33 +144,222 @@ class MongoDBOperation:
         except Exception as e:
             raise ShipmentException(e, sys)
         
+    def get_collection_as_dataframe_chunks(
+            self, db_name: str, collection_name: str, chunk_size: int, projection: Dict = None, query: Dict = None
+            ) -> Iterator[pd.DataFrame]:
+        """
+        Stream the documents of the collection as dataframes of at most chunk_size documents.
+
+        Args:
+            db_name (str): The name of database object.
+            collection_name (str): The name of the collection.
+            chunk_size (int): The number of documents per dataframe.
+            projection (Dict, optional): The fields returned by the server. Defaults to all but _id.
+            query (Dict, optional): The documents returned, filtered by the server. Defaults to all.
+
+        Yields:
+            pd.DataFrame: The next chunk of the collection, without the _id column.
+        """
+        logging.info("Entered the get_collection_as_dataframe_chunks method of MongoDBOperation class.")
+        try:
+            database = self.get_database(db_name=db_name)
+            collection = self.get_collection(database=database, collection_name=collection_name)
+
+            cursor = collection.find(query or {}, projection or {"_id": 0}).batch_size(chunk_size)
+            while True:
+                documents = list(islice(cursor, chunk_size))
+                if not documents:
+                    break
+                yield pd.DataFrame(documents)
+
+            logging.info(f"Successfully streamed the {collection_name} collection in MongoDB.")
+            logging.info("Exited the get_collection_as_dataframe_chunks method of MongoDBOperation class.")
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def aggregate(self, db_name: str, collection_name: str, pipeline: List[Dict]) -> List[Dict]:
+        """
+        Run an aggregation pipeline on the server.
+
+        Args:
+            db_name (str): The name of the database.
+            collection_name (str): The name of the collection.
+            pipeline (List[Dict]): The pipeline.
+
+        Returns:
+            List[Dict]: The output documents.
+        """
+        try:
+            # The $group, $bucketAuto and $facet stages of a large collection spill to disk past 100MB
+            return list(self.client[db_name][collection_name].aggregate(pipeline, allowDiskUse=True))
+        except Exception as e:
+            raise ShipmentException(e, sys)
 
-    def insert_dataframe_as_record(self, data_frame: pd.DataFrame, db_name: str, collection_name: str) -> None:
+    def explain_find(self, db_name: str, collection_name: str, query: Dict, projection: Dict = None) -> Dict:
         """
-        Insert the dataframe as a record in the collection.
+        Get the plan the server chooses for a find, without running it.
+
+        Args:
+            db_name (str): The name of the database.
+            collection_name (str): The name of the collection.
+            query (Dict): The query.
+            projection (Dict, optional): The fields returned. Defaults to all but _id.
+
+        Returns:
+            Dict: The output of the explain command in queryPlanner verbosity, see get_plan_stages.
+        """
+        try:
+            # queryPlanner verbosity, the default executionStats of Cursor.explain reads the documents
+            return self.client[db_name].command({
+                "explain": {"find": collection_name, "filter": query, "projection": projection or {"_id": 0}},
+                "verbosity": "queryPlanner",
+            })
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def ensure_query_index(
+            self, db_name: str, collection_name: str, query: Dict, projection: Dict = None, create: bool = True
+    ) -> Dict:
+        """
+        Make sure a query is served by an index: create the compound index of its fields,
+        when it does not exist yet, and check the plan of the query with explain_find.
+
+        Args:
+            db_name (str): The name of the database.
+            collection_name (str): The name of the collection.
+            query (Dict): The query, such as one of build_ingestion_query.
+            projection (Dict, optional): The fields returned. Defaults to all but _id.
+            create (bool, optional): Whether to create the index. Defaults to True, False
+                only checks the plan.
+
+        Returns:
+            Dict: The index keys, the index name when created, the stages of the winning plan
+                and whether it scans an index rather than the whole collection.
+        """
+        logging.info("Entered the ensure_query_index method of MongoDBOperation class.")
+        try:
+            keys = get_index_keys(query)
+            index_name = None
+            if create and keys:
+                # A no-op when the index exists, otherwise built without blocking the collection
+                index_name = self.client[db_name][collection_name].create_index(keys)
+                logging.info(f"Ensured the {index_name} index of the {collection_name} collection")
+
+            stages = get_plan_stages(self.explain_find(db_name, collection_name, query, projection))
+            report = {
+                "keys": [key for key, _ in keys],
+                "index_name": index_name,
+                "stages": stages,
+                "uses_index": "IXSCAN" in stages and "COLLSCAN" not in stages,
+            }
+            logging.info(f"Query plan of {query} on the {collection_name} collection: {report}")
+            logging.info("Exited the ensure_query_index method of MongoDBOperation class.")
+            return report
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+
+    def insert_dataframe_as_record(
+            self,
+            data_frame: pd.DataFrame,
+            db_name: str,
+            collection_name: str,
+            batch_size: int = MONGO_INSERT_BATCH_SIZE,
+            n_workers: int = MONGO_INSERT_WORKERS,
+            upsert_key: str = None,
+            date_formats: Dict[str, str] = None,
+    ) -> Dict:
+        """
+        Insert the dataframe as records in the collection, in unordered batches sent
+        from several threads over the pooled client.
 
         Args:
             data_frame (pd.DataFrame): The dataframe to be inserted.
             db_name (str): The name of the database.
             collection_name (str): The name of the collection.
+            batch_size (int, optional): The documents per batch. Defaults to MONGO_INSERT_BATCH_SIZE.
+            n_workers (int, optional): The threads sending the batches. Defaults to MONGO_INSERT_WORKERS.
+            upsert_key (str, optional): A field identifying the documents, such as CUSTOMER_ID_COLUMN.
+                The documents replace those with the same key, so a reload does not duplicate
+                them. Inserted when None.
+            date_formats (Dict[str, str], optional): Date columns stored as strings, such as
+                DATE_COLUMN_FORMATS, to their strftime format. They are stored as BSON dates,
+                which the training window queries by range.
+
+        Returns:
+            Dict: The rows, the documents inserted, upserted and matched by their key, the seconds
+                taken and the rows per second.
         """
         logging.info("Entered the insert_dataframe_as_record method of MongoDBOperation class.")
         try:
-            # Converting dataframe into json
-            records = loads(data_frame.T.to_json()).values()
-            logging.info("Converted dataframe to json records")
+            start_time = time.perf_counter()
+            if date_formats:
+                data_frame = data_frame.assign(**{
+                    column: pd.to_datetime(data_frame[column], format=date_format)
+                    for column, date_format in date_formats.items()
+                })
+            records = get_records(data_frame)
+            logging.info(f"Converted {len(records)} rows to documents")
 
             # Getting the database
             database = self.get_database(db_name=db_name)
 
             # Get the collection object.
             collection = self.get_collection(database=database, collection_name=collection_name)
+            if upsert_key is not None:
+                # Each upsert looks its key up
+                collection.create_index(upsert_key)
+
+            def write_batch(batch: List[Dict]) -> tuple:
+                if upsert_key is None:
+                    return len(collection.insert_many(batch, ordered=False).inserted_ids), 0, 0
+                result = collection.bulk_write(
+                    [ReplaceOne({upsert_key: record[upsert_key]}, record, upsert=True) for record in batch],
+                    ordered=False,
+                )
+                return 0, result.upserted_count, result.matched_count
 
-            # Inserting the dataframe as a record in the collection.
+            # Inserting the batches in parallel, over the connections of the shared client
             logging.info("Inserting recording to MongoDB")
-            collection.insert_many(records)
-            logging.info(f"Successfully inserted the {collection_name} collection in MongoDB.")
+            batches = [records[start:start + batch_size] for start in range(0, len(records), batch_size)]
+            with ThreadPoolExecutor(max_workers=max(1, min(n_workers, len(batches)))) as executor:
+                counts = list(executor.map(write_batch, batches))
+
+            seconds = time.perf_counter() - start_time
+            report = {
+                "rows": len(records),
+                "inserted": sum(count[0] for count in counts),
+                "upserted": sum(count[1] for count in counts),
+                "matched": sum(count[2] for count in counts),
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(len(records) / seconds, 1) if seconds else None,
+            }
+            logging.info(f"Successfully loaded the {collection_name} collection in MongoDB: {report}")
             logging.info("Exited the insert_dataframe_as_record method of MongoDBOperation class.")
+            return report
         except Exception as e:
             raise ShipmentException(e, sys)
 
+    def insert_documents(self, documents: List[Dict], db_name: str, collection_name: str) -> int:
+        """
+        Insert documents with an unordered insert_many, the server writes them in
+        parallel and a failed document does not stop the others.
+
+        Args:
+            documents (List[Dict]): The documents to be inserted.
+            db_name (str): The name of the database.
+            collection_name (str): The name of the collection.
+
+        Returns:
+            int: The number of documents inserted.
+        """
+        try:
+            # Called for every batch of a background writer, without the logging of get_collection
+            collection = self.client[db_name][collection_name]
+            try:
+                return len(collection.insert_many(documents, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                logging.warning(f"{len(e.details.get('writeErrors', []))} documents rejected by {collection_name}")
+                return e.details.get("nInserted", 0)
+        except Exception as e:
+            raise ShipmentException(e, sys)
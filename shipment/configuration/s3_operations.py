@@ -1,23 +1,39 @@
 from shipment.constant import *
-import boto3
 from shipment.logger import logging
 from shipment.exception import ShipmentException
-from botocore.exceptions import ClientError
-from mypy_boto3_s3.service_resource import Bucket
+from shipment.monitoring.metrics import S3_CALLS
 import pandas as pd
-from typing import Union, List
+from typing import TYPE_CHECKING, Union, List
 from io import StringIO, BytesIO
 import sys
 import pickle
 import os
 
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import Bucket
+
 
 class S3Operations:
     BUCKET_NAME = 'hexa-shipment-model-io-files'
     
     def __init__(self):
-        self.s3_resource = boto3.resource("s3")
-        self.s3_client = boto3.client("s3")
+        # boto3 is imported and the clients are created on first use, not when the app is imported
+        self._s3_resource = None
+        self._s3_client = None
+
+    @property
+    def s3_resource(self):
+        if self._s3_resource is None:
+            import boto3
+            self._s3_resource = boto3.resource("s3")
+        return self._s3_resource
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            import boto3
+            self._s3_client = boto3.client("s3")
+        return self._s3_client
         
 
     @staticmethod
@@ -35,7 +51,9 @@ class S3Operations:
         """
         logging.info("Entered the read_object method of S3Operations class.")
         try:
+            import boto3
             s3_client = boto3.client("s3")
+            S3_CALLS.labels(operation="get_object").inc()
             response = s3_client.get_object(Bucket=S3Operations.BUCKET_NAME, Key=object_name)
             content = response['Body'].read()
 
@@ -55,7 +73,7 @@ class S3Operations:
             raise ShipmentException(e, sys)
 
         
-    def get_bucket(self, bucket_name: str) -> Bucket:
+    def get_bucket(self, bucket_name: str) -> "Bucket":
         """
         Get the bucket object.
 
@@ -87,6 +105,7 @@ class S3Operations:
         logging.info("Entered the is_model_present method of S3Operations class.")
         try:
             bucket = self.get_bucket(bucket_name)
+            S3_CALLS.labels(operation="list_objects").inc()
             file_objects = list(bucket.objects.filter(Prefix=s3_model_key))
             return len(file_objects) > 0
         except Exception as e:
@@ -108,6 +127,7 @@ class S3Operations:
         logging.info("Entered the get_file_object method of S3Operations class.")
         try:
             bucket = self.get_bucket(bucket_name)
+            S3_CALLS.labels(operation="list_objects").inc()
             list_objs = list(bucket.objects.filter(Prefix=filename))
             file_objs = list_objs[0] if len(list_objs) == 1 else list_objs
             logging.info("Exited the get_file_object method of S3Operations class.")
@@ -159,11 +179,14 @@ class S3Operations:
             bucket_name (str): The name of the bucket.
         """
         logging.info("Entered the create_folder method of S3Operations class.")
+        from botocore.exceptions import ClientError
         try:
+            S3_CALLS.labels(operation="head_object").inc()
             self.s3_resource.Object(bucket_name, folder_name).load()
         except ClientError as e:
             if e.response["Error"]["Code"] == "404":
                 folder_obj = folder_name + "/"
+                S3_CALLS.labels(operation="put_object").inc()
                 self.s3_client.put_object(Bucket=bucket_name, Key=folder_obj)
             else:
                 raise ShipmentException(e, sys)
@@ -190,6 +213,7 @@ class S3Operations:
             logging.info(
                 f"Uploading {from_filename} file to {to_filename} file in {bucket_name} bucket"
             )
+            S3_CALLS.labels(operation="upload_file").inc()
             self.s3_resource.meta.client.upload_file(
                 from_filename, bucket_name, to_filename
             )
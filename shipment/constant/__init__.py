@@ -9,16 +9,63 @@ MODEL_CONFIG_FILE = "config/model.yaml"
 # CONFIG_FILE_PATH = "config/config.yaml"
 SCHEMA_FILE_PATH = "config/schema.yaml"
 
-DB_URL = environ["MONGO_DB_URL"]
+# Environment variable of the MongoDB url, read when MongoDBOperation is created
+MONGO_DB_URL_ENV_KEY = "MONGO_DB_URL"
+# Connections of the client shared by every MongoDBOperation of the process
+MONGO_MAX_POOL_SIZE = 20
+# Documents per unordered insert_many of the bulk loader, and the threads sending them
+MONGO_INSERT_BATCH_SIZE = 10000
+MONGO_INSERT_WORKERS = 4
+# Key of the documents of the ship collection, the reloads upsert on it
+CUSTOMER_ID_COLUMN = "Customer Id"
+# Date columns of the source files and their format, stored as BSON dates by the bulk loader
+DATE_COLUMN_FORMATS = {"Scheduled Date": "%m/%d/%y", "Delivery Date": "%m/%d/%y"}
 DB_NAME = "shipmentdata"
 COLLECTION_NAME = "ship"
 
 TARGET_COLUMN = "Cost"
 
+# Fields of a prediction request and the feature column each one fills
+SHIPPING_DATA_FIELDS = {
+    "artist": "Artist Reputation",
+    "height": "Height",
+    "width": "Width",
+    "weight": "Weight",
+    "material": "Material",
+    "priceOfSculpture": "Price Of Sculpture",
+    "baseShippingPrice": "Base Shipping Price",
+    "international": "International",
+    "expressShipment": "Express Shipment",
+    "installationIncluded": "Installation Included",
+    "transport": "Transport",
+    "fragile": "Fragile",
+    "customerInformation": "Customer Information",
+    "remoteLocation": "Remote Location",
+}
+
 TEST_SIZE = 0.2
 
+# Number of documents read from MongoDB and validated at a time during ingestion
+DATA_INGESTION_CHUNK_SIZE = 50000
+
+# Dtype of the numerical columns, the target and the transformed feature arrays
+FEATURE_DTYPE = "float32"
+
+# Size of the compressed chunks of the array artefacts
+ARRAY_ARTEFACT_CHUNK_SIZE = 1 << 20
+
+# Packages whose estimators read NaN in sparse input as missing values, the
+# others are given a dense copy of the features when they hold missing values
+SPARSE_MISSING_VALUE_PACKAGES = ("xgboost", "lightgbm", "catboost", "shipment")
+# Packages whose estimators reject read only sparse buffers, such as the memory
+# mapped array artefacts, they are given a copy
+SPARSE_WRITABLE_INPUT_PACKAGES = ("catboost",)
+
 ARTEFACTS_DIR = os.path.join(from_root(), "artefacts", TIMESTAMP)
 
+# Wall time, CPU time and peak memory of each stage of the training pipeline
+PIPELINE_METRICS_FILE_NAME = "PipelineMetrics.yaml"
+
 DATA_INGESTION_ARTEFACTS_DIR = "DataIngestionArtefacts"
 DATA_INGESTION_TRAIN_DIR = "Train"
 DATA_INGESTION_TEST_DIR = "Test"
@@ -27,22 +74,158 @@ DATA_INGESTION_TEST_FILE_NAME = "test.csv"
 
 DATA_VALIDATION_ARTEFACT_DIR = "DataValidationArtefacts"
 DATA_DRIFT_FILE_NAME = "DataDriftReport.yaml"
+SCHEMA_VALIDATION_REPORT_FILE_NAME = "SchemaValidationReport.yaml"
 
 DATA_TRANSFORMATION_ARTEFACTS_DIR = "DataTransformationArtefacts"
 TRANSFORMED_TRAIN_DATA_DIR = "TransformedTrain"
 TRANSFORMED_TEST_DATA_DIR = "TransformedTest"
-TRANSFORMED_TRAIN_DATA_FILE_NAME = "transformed_train_data.npz"
-TRANSFORMED_TEST_DATA_FILE_NAME = "transformed_test_data.npz"
+TRANSFORMED_TRAIN_DATA_FILE_NAME = "transformed_train_data.arr"
+TRANSFORMED_TEST_DATA_FILE_NAME = "transformed_test_data.arr"
+# Training modes selected by training_mode in config/model.yaml
+TRAINING_MODE_IN_MEMORY = "in_memory"
+TRAINING_MODE_OUT_OF_CORE = "out_of_core"
+# Rows of the train set compared with the champion's reference profile before a warm start
+WARM_START_DRIFT_SAMPLE_ROWS = 200000
+# Rows of the train set sampled for the reference profile in out_of_core mode
+OUT_OF_CORE_PROFILE_SAMPLE_ROWS = 200000
+# Name of the chunk files of an array artefact written chunk by chunk
+ARRAY_ARTEFACT_PART_FILE_NAME = "part-{:05d}.arr"
+# Compressed array artefacts are smaller to transfer but can not be memory mapped
+TRANSFORMED_DATA_COMPRESSION = False
 PREPROCESSOR_OBJECT_FILE_NAME = "shipping_preprocessor.pkl"
+REFERENCE_PROFILE_FILE_NAME = "reference_profile.yaml"
 
 MODEL_TRAINER_ARTEFACTS_DIR = "ModelTrainerArtefacts"
 MODEL_FILE_NAME = "shipping_price_model.pkl"
+# Seconds between two comparisons of the served model's ETag with the bucket's, a
+# model pushed by another process is served at most this long after the push
+MODEL_REFRESH_INTERVAL = 60.0
+# External memory pages of the out_of_core training, removed once trained
+XGBOOST_CACHE_DIR = "xgboost_cache"
+# Accuracy and size of the compact forest against the forest it was exported from
+COMPACT_FOREST_REPORT_FILE_NAME = "CompactForestReport.yaml"
+# Rows of the test set the trees are pruned on
+COMPACT_FOREST_PRUNE_SAMPLE_ROWS = 20000
+# Rows traversed together by CompactForest.predict, bounding its (rows, trees) node arrays
+COMPACT_FOREST_BLOCK_ROWS = 4096
 MODEL_SAVE_FORMAT = ".pkl"
 
+MODEL_EXPORTER_ARTEFACTS_DIR = "ModelExporterArtefacts"
+ONNX_MODEL_FILE_NAME = "shipping_price_model.onnx"
+# Size of the graph and its prediction differences with the cost model on the test set
+ONNX_EXPORT_REPORT_FILE_NAME = "OnnxExportReport.yaml"
+ONNX_TARGET_OPSET = {"": 15, "ai.onnx.ml": 3}
+# IR version of the opsets above, newer versions are refused by older onnxruntime releases
+ONNX_IR_VERSION = 8
+# Inputs of the exported graph, and the categories the missing and the unknown values are given
+ONNX_CATEGORICAL_INPUT = "categorical"
+ONNX_NUMERICAL_INPUT = "numerical"
+ONNX_MISSING_CATEGORY = "__missing__"
+ONNX_UNKNOWN_CATEGORY = "__unknown__"
+# Packages reading the entries absent from a sparse matrix as missing values, not zeros
+SPARSE_ABSENT_AS_MISSING_PACKAGES = ("xgboost",)
+
 #S3 BUCKET
 BUCKET_NAME = "hexa-shipment-model-io-files"
 S3_MODEL_NAME = "shipping_price_model.pkl"
 
+# Online drift monitoring of the prediction traffic
+DRIFT_NUM_BINS = 10
+DRIFT_CHECK_INTERVAL = 500
+DRIFT_MIN_SAMPLES = 200
+DRIFT_PSI_THRESHOLD = 0.2
+# Weight kept by the sketch counts after every periodic check, so the PSI follows the
+# recent traffic: a record weighs half as much once DRIFT_CHECK_INTERVAL newer ones came
+DRIFT_DECAY = 0.5
+# Most frequent values kept per categorical column by the profiles computed inside MongoDB,
+# above the number of categories of the onehot columns so their proportions are complete
+COLLECTION_PROFILE_TOP_K = 50
+COLLECTION_PROFILE_FILE_NAME = "CollectionProfile.yaml"
+
+# Distributed model selection, see shipment/utils/distributed_search.py. The
+# default key only protects searches served on the loopback interface
+SEARCH_DEFAULT_AUTHKEY = b"shipment-search"
+SEARCH_AUTHKEY_ENV_KEY = "SEARCH_AUTHKEY"
+# Seconds between two polls of the task board by the workers and the coordinator
+SEARCH_POLL_INTERVAL = 0.05
+# Seconds a persistent worker waits before connecting again to a missing coordinator
+SEARCH_WORKER_RECONNECT_INTERVAL = 5.0
+
+# Profiling of the pipeline stages and prediction requests, opt-in from the environment:
+# "1" profiles every pipeline run, read when a TrainPipeline is created
+PROFILE_PIPELINE_ENV_KEY = "PROFILE_PIPELINE"
+# Share of the /predict requests profiled, a single request can ask for it by sending
+# the token in the header, on demand profiling is off without a token. Read by create_app
+PROFILE_REQUEST_SAMPLE_RATE_ENV_KEY = "PROFILE_REQUEST_SAMPLE_RATE"
+PROFILE_REQUEST_TOKEN_ENV_KEY = "PROFILE_REQUEST_TOKEN"
+PROFILE_REQUEST_HEADER = "X-Profile"
+# Requests profiled at the same time, the others run unprofiled, and the request
+# profiles kept on disk, the oldest being deleted
+PROFILE_REQUEST_MAX_CONCURRENT = 1
+PROFILE_REQUEST_MAX_FILES = 100
+# Seconds between two stack samples
+PROFILE_PIPELINE_INTERVAL = 0.005
+PROFILE_REQUEST_INTERVAL = 0.0005
+# Stages whose allocations are also traced with tracemalloc
+PROFILE_MEMORY_STAGES = ("data_ingestion", "data_transformation")
+PROFILE_TRACEMALLOC_FRAMES = 10
+PROFILES_DIR_NAME = "Profiles"
+REQUEST_PROFILES_DIR = os.path.join(from_root(), "profiles", "predict")
+
+
+# Preprocessing of the prediction requests: "column_transformer" runs the fitted
+# preprocessor, "template" copies a precomputed encoded row per category
+# combination and only scales the numerical values, see TemplateEncoder
+SERVING_PREPROCESSING_COLUMN_TRANSFORMER = "column_transformer"
+SERVING_PREPROCESSING_TEMPLATE = "template"
+# Environment variables of the serving settings, read by create_app at startup
+SERVING_PREPROCESSING_ENV_KEY = "SERVING_PREPROCESSING"
+# Encoded row templates kept at most, the requests of other combinations run the preprocessor
+TEMPLATE_ENCODER_MAX_TEMPLATES = 65536
+# Backend of the prediction requests: "python" runs the pickled CostModel, "onnx" runs
+# its ONNX export with onnxruntime, see OnnxCostModel
+SERVING_BACKEND_PYTHON = "python"
+SERVING_BACKEND_ONNX = "onnx"
+SERVING_BACKEND_ENV_KEY = "SERVING_BACKEND"
+# Threads of each onnxruntime operator, one suits the single row requests
+ONNX_INTRA_OP_THREADS = 1
+ONNX_INTRA_OP_THREADS_ENV_KEY = "ONNX_INTRA_OP_THREADS"
+
+
+# Binary batch scoring of /predict/batch, for the service to service calls: an Arrow IPC
+# stream or a MessagePack map of the schema columns, answered in the same format
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+PREDICTION_COLUMN = "prediction"
+BATCH_PREDICT_MAX_ROWS = 100000
+# Offending row indices listed per column in the errors of a rejected batch
+REQUEST_ERROR_MAX_ROWS = 10
+
+
+# Explanations of /predict/explain: the explanations kept per model version and
+# input row, the (rows, leaves, depth) path elements the forest TreeSHAP evaluates
+# at a time, bounding its memory, and the rows accepted per request
+EXPLAIN_CACHE_SIZE = 4096
+EXPLAIN_CACHE_SIZE_ENV_KEY = "EXPLAIN_CACHE_SIZE"
+EXPLAIN_BLOCK_ELEMENTS = 1 << 22
+EXPLAIN_MAX_ROWS = 1000
+
+
+# What-if sweeps of /predict/sweep: the fields swept together and the points of their grid
+SWEEP_MAX_FIELDS = 2
+SWEEP_MAX_POINTS = 10000
+
+
+# Asynchronous log of the /predict predictions to MongoDB, for the comparison with the
+# realised costs and the retraining: records kept in memory while MongoDB is behind,
+# the newest replacing the oldest, and the insert_many batches of the background writer
+PREDICTION_LOG_ENABLED_ENV_KEY = "PREDICTION_LOG_ENABLED"
+PREDICTION_LOG_COLLECTION_NAME = "predictions"
+PREDICTION_LOG_BUFFER_SIZE = 50000
+PREDICTION_LOG_BATCH_SIZE = 500
+PREDICTION_LOG_FLUSH_INTERVAL = 1.0
+PREDICTION_LOG_MAX_BACKOFF = 30.0
+
 
 APP_HOST = "0.0.0.0"
 APP_PORT = 8080
\ No newline at end of file
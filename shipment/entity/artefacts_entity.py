@@ -12,6 +12,7 @@ class DataIngestionArtefacts:
 class DataValidationArtefacts:
     data_drift_file_path: str
     validation_status: bool
+    schema_validation_report_file_path: str
 
 
 @dataclass
@@ -19,12 +20,22 @@ class DataTransformationArtefacts:
     transformed_object_file_path: str
     transformed_train_file_path: str
     transformed_test_file_path: str
+    reference_profile_file_path: str
 
 
 
 @dataclass
 class ModelTrainerArtefacts:
     trained_model_file_path: str
+    warm_started: bool = False
+    compact_forest_report_file_path: str = None
+
+
+# Model Exporter Artefacts
+@dataclass
+class ModelExporterArtefacts:
+    onnx_model_file_path: str = None
+    onnx_export_report_file_path: str = None
 
 
 # Model Evaluation Artefacts
@@ -16,6 +16,9 @@ class DataIngestionConfig:
         self.DB_NAME = DB_NAME
         self.COLLECTION_NAME = COLLECTION_NAME
         self.TARGET_COLUMN = TARGET_COLUMN
+        self.CHUNK_SIZE = DATA_INGESTION_CHUNK_SIZE
+        model_config = self.UTILS.read_yaml_file(filename=MODEL_CONFIG_FILE)
+        self.INGESTION_CONFIG: dict = model_config.get("data_ingestion") or {}
 
         self.DROP_COLS = list(self.SCHEMA_CONFIG["drop_columns"])
         self.DATA_INGESTION_ARTEFACTS_DIR: str = os.path.join(
@@ -50,6 +53,9 @@ class DataValidationConfig:
         self.DATA_DRIFT_FILE_PATH: str = os.path.join(
             self.DATA_VALIDATION_ARTEFACTS_DIR, DATA_DRIFT_FILE_NAME
             )
+        self.SCHEMA_VALIDATION_REPORT_FILE_PATH: str = os.path.join(
+            self.DATA_VALIDATION_ARTEFACTS_DIR, SCHEMA_VALIDATION_REPORT_FILE_NAME
+            )
         
 
 
@@ -80,6 +86,13 @@ class DataTransformationConfig:
         self.PREPROCESSOR_FILE_PATH: str = os.path.join(
             from_root(), ARTEFACTS_DIR, DATA_TRANSFORMATION_ARTEFACTS_DIR, PREPROCESSOR_OBJECT_FILE_NAME
             )
+        self.REFERENCE_PROFILE_FILE_PATH: str = os.path.join(
+            self.DATA_TRANSFORMATION_ARTEFACTS_DIR, REFERENCE_PROFILE_FILE_NAME
+            )
+
+        model_config = self.UTILS.read_yaml_file(filename=MODEL_CONFIG_FILE)
+        self.TRAINING_MODE: str = model_config.get("training_mode", TRAINING_MODE_IN_MEMORY)
+        self.OUT_OF_CORE_CONFIG: dict = model_config.get("out_of_core", {})
 
 # Model Evaluation Configurations
 @dataclass
@@ -100,13 +113,40 @@ class ModelTrainerConfig:
         self.TRAINED_MODEL_FILE_PATH: str = os.path.join(
             from_root(), ARTEFACTS_DIR, MODEL_TRAINER_ARTEFACTS_DIR, MODEL_FILE_NAME
             )
+
+        model_config = self.UTILS.read_yaml_file(filename=MODEL_CONFIG_FILE)
+        self.TRAINING_MODE: str = model_config.get("training_mode", TRAINING_MODE_IN_MEMORY)
+        self.OUT_OF_CORE_CONFIG: dict = model_config.get("out_of_core", {})
+        self.WARM_START_CONFIG: dict = model_config.get("warm_start", {})
+        self.COMPACT_FOREST_CONFIG: dict = model_config.get("compact_forest", {})
+        self.COMPACT_FOREST_REPORT_FILE_PATH: str = os.path.join(
+            self.MODEL_TRAINER_ARTEFACTS_DIR, COMPACT_FOREST_REPORT_FILE_NAME
+        )
         
 
+@dataclass
+class ModelExporterConfig:
+    def __init__(self):
+        self.UTILS = MainUtils()
+        self.SCHEMA_CONFIG = self.UTILS.read_yaml_file(filename=SCHEMA_FILE_PATH)
+        self.MODEL_EXPORTER_ARTEFACTS_DIR: str = os.path.join(
+            from_root(), ARTEFACTS_DIR, MODEL_EXPORTER_ARTEFACTS_DIR
+        )
+        self.ONNX_MODEL_FILE_PATH: str = os.path.join(self.MODEL_EXPORTER_ARTEFACTS_DIR, ONNX_MODEL_FILE_NAME)
+        self.ONNX_EXPORT_REPORT_FILE_PATH: str = os.path.join(
+            self.MODEL_EXPORTER_ARTEFACTS_DIR, ONNX_EXPORT_REPORT_FILE_NAME
+        )
+
+        model_config = self.UTILS.read_yaml_file(filename=MODEL_CONFIG_FILE)
+        self.ONNX_EXPORT_CONFIG: dict = model_config.get("onnx_export", {})
+
+
 @dataclass
 class ModelEvaluationConfig:
     def __init__(self):
         self.S3_OPERATIONS =S3Operations()
         self.UTILS = MainUtils()
+        self.SCHEMA_CONFIG = self.UTILS.read_yaml_file(filename=SCHEMA_FILE_PATH)
         self.BUCKET_NAME: str = BUCKET_NAME
         self.BEST_MODEL_PATH: str = os.path.join(
             from_root(), ARTEFACTS_DIR, MODEL_TRAINER_ARTEFACTS_DIR, MODEL_FILE_NAME
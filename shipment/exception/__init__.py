@@ -43,7 +43,10 @@ class ShipmentException(Exception):
     def __init__(self, error_message: str, error_detail:sys):
         super().__init__(error_message)
         self.error_message = error_message_details(error_message, error_detail=error_detail)
-        logging.info(self.error_message)
+
+        # Logging only where the error is raised, not again at every level that wraps it
+        if not isinstance(error_message, ShipmentException):
+            logging.error(self.error_message)
     
     def __str__(self):
         return self.error_message
\ No newline at end of file
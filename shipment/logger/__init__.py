@@ -1,17 +1,179 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 from datetime import datetime
 from from_root import from_root
 
 LOG_FILE = f"{datetime.now().strftime('%Y_%m_%d_%H_%S')}.log"
 log_path = os.path.join(from_root(), "log", LOG_FILE)
 
-os.makedirs(log_path, exist_ok=True)
-
 LOG_FILE_PATH = os.path.join(log_path, LOG_FILE)
 
-logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    level=logging.INFO,
-    format="[ %(asctime)s ] - %(name)s - %(levelname)s - %(message)s",
-)
\ No newline at end of file
+# Environment variables of the logging settings, read by configure_logging
+LOG_LEVEL_ENV_KEY = "LOG_LEVEL"
+# "json" for one structured record per line, "text" for the classic format
+LOG_FORMAT_ENV_KEY = "LOG_FORMAT"
+# Share of DEBUG/INFO records kept, warnings and errors are always kept
+LOG_SAMPLE_RATE_ENV_KEY = "LOG_SAMPLE_RATE"
+# Per-module levels, e.g. "shipment.components.model_predictor=DEBUG,shipment.utils=WARNING"
+LOG_MODULE_LEVELS_ENV_KEY = "LOG_MODULE_LEVELS"
+
+TEXT_FORMAT = "[ %(asctime)s ] - %(name)s - %(levelname)s - %(message)s"
+
+# Listener of the configured logging, started once by configure_logging
+log_listener = None
+
+# Directory holding the shipment package, module names are resolved from it
+PACKAGE_PARENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a single line json object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_record = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            log_record["exc_info"] = record.exc_text
+        return json.dumps(log_record, default=str)
+
+
+class LazyFileHandler(logging.FileHandler):
+    """
+    File handler creating the log directory and file with the first record,
+    so importing the package has no side effect on the file system.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler doing the least possible work in the calling thread: the
+    message is merged with its arguments and the record is queued as is,
+    formatting happens in the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Traceback objects must be rendered before leaving the calling thread
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a share of the records below WARNING, the others always go through."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.sample_rate
+
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    Apply per-module levels to the records of the root logger.
+
+    The project logs through the root logger, so the module is resolved from
+    the path of the calling file and cached per file.
+    """
+
+    def __init__(self, module_levels: dict, default_level: int):
+        super().__init__()
+        self.module_levels = sorted(module_levels.items(), key=lambda item: -len(item[0]))
+        self.default_level = default_level
+        self._levels_by_path = {}
+
+    def get_level(self, pathname: str) -> int:
+        level = self._levels_by_path.get(pathname)
+        if level is None:
+            module = os.path.splitext(os.path.relpath(pathname, PACKAGE_PARENT_DIR))[0].replace(os.sep, ".")
+            level = next(
+                (
+                    module_level for prefix, module_level in self.module_levels
+                    if module == prefix or module.startswith(prefix + ".")
+                ),
+                self.default_level,
+            )
+            self._levels_by_path[pathname] = level
+        return level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.get_level(record.pathname)
+
+
+def parse_module_levels(module_levels: str) -> dict:
+    levels = {}
+    for item in filter(None, (part.strip() for part in module_levels.split(","))):
+        module, _, level = item.partition("=")
+        levels[module.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """
+    Configure the root logger with a non blocking queue handler. Records are
+    filtered and sampled in the calling thread, then formatted and written to
+    the log file by a background listener thread. The settings are read from
+    the environment when it is first called, by the entry points at startup,
+    the later calls return the running listener.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener.
+    """
+    global log_listener
+    if log_listener is not None:
+        return log_listener
+
+    default_level = logging.getLevelName(os.environ.get(LOG_LEVEL_ENV_KEY, "INFO").upper())
+    module_levels = parse_module_levels(os.environ.get(LOG_MODULE_LEVELS_ENV_KEY, ""))
+    log_format = os.environ.get(LOG_FORMAT_ENV_KEY, "json").lower()
+    sample_rate = float(os.environ.get(LOG_SAMPLE_RATE_ENV_KEY, "1.0"))
+
+    file_handler = LazyFileHandler(LOG_FILE_PATH)
+    file_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = AsyncQueueHandler(log_queue)
+    queue_handler.addFilter(ModuleLevelFilter(module_levels, default_level))
+    if sample_rate < 1.0:
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    # The root level is the lowest configured one so that module overrides can lower it
+    logging.basicConfig(
+        level=min([default_level, *module_levels.values()]),
+        handlers=[queue_handler],
+    )
+
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(stop_logging, log_listener)
+    return log_listener
+
+
+def stop_logging(listener: logging.handlers.QueueListener) -> None:
+    """Flush the queued records and stop the listener thread, safe to call twice."""
+    if listener._thread is not None:
+        listener.stop()
+
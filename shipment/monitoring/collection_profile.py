@@ -0,0 +1,227 @@
+import sys
+from typing import Dict, List
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.utils.schema_validator import SchemaValidator
+from shipment.constant import COLLECTION_PROFILE_TOP_K, DRIFT_NUM_BINS
+
+
+def is_null(column: str) -> Dict:
+    # A missing field reads as null, like the NaN of a dataframe built from the documents
+    return {"$eq": [{"$ifNull": [f"${column}", None]}, None]}
+
+
+def count_if(condition: Dict) -> Dict:
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+
+def number_or_null(column: str) -> Dict:
+    # The accumulators skip the nulls, so they only see the numbers
+    return {"$cond": [{"$isNumber": f"${column}"}, f"${column}", None]}
+
+
+def build_profile_pipeline(
+        schema_config: Dict,
+        reference_profile: Dict = None,
+        query: Dict = None,
+        n_bins: int = DRIFT_NUM_BINS,
+        top_k: int = COLLECTION_PROFILE_TOP_K,
+) -> List[Dict]:
+    """
+    Build the aggregation pipeline profiling a collection in a single pass of the server.
+
+    The documents matched by the query go through one $facet stage: a $group counting,
+    for every column of the schema validator, the nulls, the values of the wrong type,
+    out of range or out of domain and the min, max, mean and standard deviation of the
+    numbers; a $bucket histogram per numerical column, on the bin edges of the reference
+    profile, or $bucketAuto quantile bins without one; and the top_k values with their
+    counts per categorical column.
+
+    Args:
+        schema_config (Dict): The content of the schema file.
+        reference_profile (Dict, optional): The profile the collection is compared with,
+            its columns and bin edges are used. Defaults to the numerical and onehot
+            columns of the schema, with n_bins quantile bins.
+        query (Dict, optional): The documents profiled, such as the training window of
+            build_ingestion_query. Defaults to all.
+        n_bins (int, optional): The quantile bins without a reference profile. Defaults to DRIFT_NUM_BINS.
+        top_k (int, optional): The most frequent values kept per categorical column.
+            Defaults to COLLECTION_PROFILE_TOP_K.
+
+    Returns:
+        List[Dict]: The pipeline, its single output document is read by read_profile.
+    """
+    try:
+        rules = SchemaValidator.compile_rules(schema_config, schema_config.get("drop_columns", ()))
+        numerical_columns, categorical_columns = get_profiled_columns(schema_config, reference_profile)
+
+        summary = {"_id": None, "n_rows": {"$sum": 1}}
+        for index, rule in enumerate(rules.values()):
+            column, prefix = rule.name, f"c{index}_"
+            not_null = {"$not": is_null(column)}
+            summary[prefix + "present"] = {"$max": {"$cond": [{"$eq": [{"$type": f"${column}"}, "missing"]}, 0, 1]}}
+            summary[prefix + "n_null"] = count_if(is_null(column))
+            if rule.is_numeric:
+                summary[prefix + "n_invalid_type"] = count_if({"$and": [not_null, {"$not": {"$isNumber": f"${column}"}}]})
+                summary[prefix + "min_value"] = {"$min": number_or_null(column)}
+                summary[prefix + "max_value"] = {"$max": number_or_null(column)}
+                summary[prefix + "mean"] = {"$avg": number_or_null(column)}
+                summary[prefix + "std"] = {"$stdDevPop": number_or_null(column)}
+                bounds = [
+                    {"$lt": [f"${column}", rule.min_value]} if rule.min_value is not None else None,
+                    {"$gt": [f"${column}", rule.max_value]} if rule.max_value is not None else None,
+                ]
+                bounds = [bound for bound in bounds if bound is not None]
+                if bounds:
+                    summary[prefix + "n_out_of_range"] = count_if({"$and": [{"$isNumber": f"${column}"}, {"$or": bounds}]})
+            else:
+                summary[prefix + "n_invalid_type"] = count_if({"$isNumber": f"${column}"})
+            if rule.domain is not None:
+                summary[prefix + "n_out_of_domain"] = count_if(
+                    {"$and": [not_null, {"$not": {"$in": [f"${column}", list(rule.domain)]}}]}
+                )
+
+        facets = {"summary": [{"$group": summary}]}
+        for index, column in enumerate(numerical_columns):
+            numbers = {"$match": {column: {"$type": "number"}}}
+            edges = ((reference_profile or {}).get("numerical", {}).get(column) or {}).get("edges")
+            if edges is not None:
+                # The open ended outer bins of build_reference_profile, [edge, next edge) like its searchsorted
+                facets[f"histogram_{index}"] = [numbers, {"$bucket": {
+                    "groupBy": f"${column}",
+                    "boundaries": [float("-inf"), *map(float, edges), float("inf")],
+                    "default": "inf",
+                    "output": {"count": {"$sum": 1}},
+                }}]
+            else:
+                facets[f"histogram_{index}"] = [numbers, {"$bucketAuto": {"groupBy": f"${column}", "buckets": n_bins}}]
+        for index, column in enumerate(categorical_columns):
+            present = {"$match": {column: {"$ne": None}}}
+            facets[f"top_{index}"] = [
+                present,
+                {"$group": {"_id": f"${column}", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": top_k},
+            ]
+            facets[f"distinct_{index}"] = [present, {"$group": {"_id": f"${column}"}}, {"$count": "n"}]
+
+        pipeline = [{"$match": query}] if query else []
+        pipeline.append({"$facet": facets})
+        return pipeline
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def get_profiled_columns(schema_config: Dict, reference_profile: Dict = None) -> tuple:
+    """The numerical and categorical columns profiled, those of the reference profile if any."""
+    if reference_profile is not None:
+        return list(reference_profile.get("numerical", {})), list(reference_profile.get("categorical", {}))
+    return list(schema_config["numerical_columns"]), list(schema_config["onehot_columns"])
+
+
+def read_profile(result: Dict, schema_config: Dict, reference_profile: Dict = None) -> Dict:
+    """
+    Read the output document of a build_profile_pipeline aggregation as a profile.
+
+    Args:
+        result (Dict): The output document of the $facet stage.
+        schema_config (Dict): The content of the schema file, as given to build_profile_pipeline.
+        reference_profile (Dict, optional): The reference profile given to build_profile_pipeline.
+
+    Returns:
+        Dict: The profile, of plain python types so it can be saved as yaml. Its numerical
+            and categorical sections are shaped like those of build_reference_profile, so it
+            can be compared with one by compare_profiles or stored as one, and its columns
+            section holds the counts of the schema validator, see SchemaValidator.validate_profile.
+    """
+    try:
+        rules = SchemaValidator.compile_rules(schema_config, schema_config.get("drop_columns", ()))
+        numerical_columns, categorical_columns = get_profiled_columns(schema_config, reference_profile)
+        summary = (result.get("summary") or [{}])[0]
+        n_rows = int(summary.get("n_rows", 0))
+
+        profile = {"n_rows": n_rows, "columns": {}, "numerical": {}, "categorical": {}}
+        for index, rule in enumerate(rules.values()):
+            prefix = f"c{index}_"
+            n_null = int(summary.get(prefix + "n_null", 0))
+            stats = {
+                "present": bool(summary.get(prefix + "present", 0)),
+                "n_rows": n_rows,
+                "n_null": n_null,
+                "null_rate": round(n_null / n_rows, 6) if n_rows else 0.0,
+                "n_invalid_type": int(summary.get(prefix + "n_invalid_type", 0)),
+                "n_out_of_range": int(summary.get(prefix + "n_out_of_range", 0)),
+                "n_out_of_domain": int(summary.get(prefix + "n_out_of_domain", 0)),
+            }
+            if rule.is_numeric:
+                for key in ("min_value", "max_value", "mean", "std"):
+                    value = summary.get(prefix + key)
+                    stats[key] = None if value is None else float(value)
+            profile["columns"][rule.name] = stats
+
+        for index, column in enumerate(numerical_columns):
+            buckets = result.get(f"histogram_{index}", [])
+            edges = ((reference_profile or {}).get("numerical", {}).get(column) or {}).get("edges")
+            if edges is not None:
+                counts = [0] * (len(edges) + 1)
+                bins = [float("-inf"), *map(float, edges)]
+                for bucket in buckets:
+                    # The values above every edge, +inf included, fall in the last bin
+                    position = len(counts) - 1 if bucket["_id"] == "inf" else bins.index(float(bucket["_id"]))
+                    counts[position] += int(bucket["count"])
+            else:
+                # The lower bound of every bucket but the first is the edge of a quantile bin
+                edges = [float(bucket["_id"]["min"]) for bucket in buckets[1:]]
+                counts = [int(bucket["count"]) for bucket in buckets]
+            total = sum(counts)
+            profile["numerical"][column] = {
+                "edges": [float(edge) for edge in edges],
+                "proportions": [count / total if total else 0.0 for count in counts],
+            }
+
+        for index, column in enumerate(categorical_columns):
+            n_values = n_rows - profile["columns"].get(column, {}).get("n_null", 0)
+            top = result.get(f"top_{index}", [])
+            profile["categorical"][column] = {
+                "proportions": {str(item["_id"]): item["count"] / n_values for item in top if n_values},
+                "n_distinct": int((result.get(f"distinct_{index}") or [{"n": 0}])[0]["n"]),
+            }
+        return profile
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def profile_collection(
+        mongo_op: object,
+        db_name: str,
+        collection_name: str,
+        schema_config: Dict,
+        reference_profile: Dict = None,
+        query: Dict = None,
+) -> Dict:
+    """
+    Profile the documents of a collection inside MongoDB, only the profile, a few
+    kilobytes, is downloaded.
+
+    Args:
+        mongo_op (object): The MongoDBOperation.
+        db_name (str): The name of the database.
+        collection_name (str): The name of the collection.
+        schema_config (Dict): The content of the schema file.
+        reference_profile (Dict, optional): The profile the collection is compared with.
+        query (Dict, optional): The documents profiled. Defaults to all.
+
+    Returns:
+        Dict: The profile, see read_profile.
+    """
+    logging.info("Entered the profile_collection method of collection_profile module")
+    try:
+        pipeline = build_profile_pipeline(schema_config, reference_profile, query)
+        result = mongo_op.aggregate(db_name, collection_name, pipeline)
+        profile = read_profile(result[0] if result else {}, schema_config, reference_profile)
+        logging.info(f"Profiled {profile['n_rows']} documents of the {collection_name} collection")
+        logging.info("Exited the profile_collection method of collection_profile module")
+        return profile
+    except Exception as e:
+        raise ShipmentException(e, sys)
@@ -0,0 +1,396 @@
+import sys
+import math
+import threading
+from bisect import bisect_right
+from typing import Dict, List, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.monitoring.metrics import DRIFT_DETECTED, DRIFT_PSI
+from shipment.constant import (
+    DRIFT_NUM_BINS,
+    DRIFT_CHECK_INTERVAL,
+    DRIFT_DECAY,
+    DRIFT_MIN_SAMPLES,
+    DRIFT_PSI_THRESHOLD,
+)
+
+# Small probability used in place of empty bins so the PSI stays finite
+PSI_EPSILON = 1e-4
+
+
+def build_reference_profile(
+        df: pd.DataFrame,
+        numerical_columns: List[str],
+        categorical_columns: List[str],
+        n_bins: int = DRIFT_NUM_BINS,
+) -> Dict:
+    """
+    Build the reference profile of the training data used by the drift monitor.
+
+    Numerical columns are summarised by quantile bin edges and the share of rows
+    falling in each bin, categorical columns by the share of each category.
+
+    Args:
+        df (pd.DataFrame): The reference (training) dataframe.
+        numerical_columns (List[str]): The numerical columns to profile.
+        categorical_columns (List[str]): The categorical columns to profile.
+        n_bins (int, optional): The number of quantile bins. Defaults to DRIFT_NUM_BINS.
+
+    Returns:
+        Dict: The reference profile, made of plain python types so it can be saved as yaml.
+    """
+    logging.info("Entered the build_reference_profile method of drift_monitor module")
+    try:
+        profile = {"n_rows": int(len(df)), "numerical": {}, "categorical": {}}
+
+        for column in numerical_columns:
+            values = pd.to_numeric(df[column], errors="coerce").dropna().to_numpy()
+            # Inner edges only, the outer bins are open ended
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+            counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+            profile["numerical"][column] = {
+                "edges": [float(edge) for edge in edges],
+                "proportions": [float(count) for count in counts / max(len(values), 1)],
+            }
+
+        for column in categorical_columns:
+            proportions = df[column].dropna().astype(str).value_counts(normalize=True)
+            profile["categorical"][column] = {
+                "proportions": {str(key): float(value) for key, value in proportions.items()},
+            }
+
+        logging.info("Exited the build_reference_profile method of drift_monitor module")
+        return profile
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def population_stability_index(expected: Sequence[float], actual: Sequence[float]) -> float:
+    """
+    Compute the population stability index between two discrete distributions.
+
+    Args:
+        expected (Sequence[float]): The reference proportions.
+        actual (Sequence[float]): The live proportions.
+
+    Returns:
+        float: The PSI, 0 when both distributions are identical.
+    """
+    psi = 0.0
+    for p_ref, p_live in zip(expected, actual):
+        p_ref = max(p_ref, PSI_EPSILON)
+        p_live = max(p_live, PSI_EPSILON)
+        psi += (p_live - p_ref) * math.log(p_live / p_ref)
+    return psi
+
+
+def compare_with_reference_profile(
+        reference_profile: Dict,
+        df: pd.DataFrame,
+        psi_threshold: float = DRIFT_PSI_THRESHOLD,
+) -> Dict:
+    """
+    Compare a batch of data with a reference profile, column by column.
+
+    The offline counterpart of DriftMonitor.check, used on training data: the
+    values are binned like build_reference_profile does and the gauges of the
+    live traffic are left untouched.
+
+    Args:
+        reference_profile (Dict): The reference profile, as saved with the model.
+        df (pd.DataFrame): The data to compare.
+        psi_threshold (float, optional): The PSI above which a column has drifted. Defaults to DRIFT_PSI_THRESHOLD.
+
+    Returns:
+        Dict: The PSI of every profiled column found in df, the drifted columns and whether any drifted.
+    """
+    try:
+        psi = {}
+        for column, stats in reference_profile.get("numerical", {}).items():
+            if column not in df.columns:
+                continue
+            values = pd.to_numeric(df[column], errors="coerce").dropna().to_numpy()
+            counts = np.bincount(
+                np.searchsorted(stats["edges"], values, side="right"), minlength=len(stats["edges"]) + 1
+            )
+            psi[column] = population_stability_index(stats["proportions"], counts / max(len(values), 1))
+
+        for column, stats in reference_profile.get("categorical", {}).items():
+            if column not in df.columns:
+                continue
+            proportions = df[column].dropna().astype(str).value_counts(normalize=True)
+            psi[column] = get_categorical_psi(stats["proportions"], proportions.to_dict())
+
+        return get_drift_report(psi, psi_threshold)
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def get_drift_report(psi: Dict[str, float], psi_threshold: float) -> Dict:
+    drifted_columns = sorted(column for column, value in psi.items() if value > psi_threshold)
+    return {
+        "psi": {column: round(value, 6) for column, value in psi.items()},
+        "drifted_columns": drifted_columns,
+        "dataset_drift": bool(drifted_columns),
+    }
+
+
+def get_categorical_psi(expected: Mapping[str, float], actual: Mapping[str, float]) -> float:
+    categories = sorted(set(expected) | set(actual))
+    return population_stability_index(
+        [expected.get(category, 0.0) for category in categories],
+        [float(actual.get(category, 0.0)) for category in categories],
+    )
+
+
+def compare_profiles(
+        reference_profile: Dict,
+        profile: Dict,
+        psi_threshold: float = DRIFT_PSI_THRESHOLD,
+) -> Dict:
+    """
+    Compare a profile with a reference profile, column by column, without the data.
+
+    The counterpart of compare_with_reference_profile for the profiles computed inside
+    MongoDB by profile_collection, binned on the edges of the reference profile.
+
+    Args:
+        reference_profile (Dict): The reference profile, as saved with the model.
+        profile (Dict): The profile to compare, built with reference_profile.
+        psi_threshold (float, optional): The PSI above which a column has drifted. Defaults to DRIFT_PSI_THRESHOLD.
+
+    Returns:
+        Dict: The PSI of every column of both profiles, the drifted columns and whether any drifted.
+    """
+    try:
+        psi = {}
+        for column, stats in reference_profile.get("numerical", {}).items():
+            if column not in profile.get("numerical", {}):
+                continue
+            live = profile["numerical"][column]
+            if not np.allclose(live["edges"], stats["edges"]):
+                raise ValueError(f"The profile of {column} is not binned on the edges of the reference profile")
+            psi[column] = population_stability_index(stats["proportions"], live["proportions"])
+
+        for column, stats in reference_profile.get("categorical", {}).items():
+            if column in profile.get("categorical", {}):
+                psi[column] = get_categorical_psi(stats["proportions"], profile["categorical"][column]["proportions"])
+
+        return get_drift_report(psi, psi_threshold)
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+class NumericSketch:
+    """
+    Streaming histogram over the reference quantile bins of one numerical column.
+
+    An update is a binary search over a handful of edges and one counter
+    increment, so its cost does not grow with the traffic seen.
+    """
+
+    def __init__(self, edges: List[float]):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.count = 0
+        self.invalid = 0
+
+    def update(self, value: object) -> None:
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            self.invalid += 1
+            return
+        if value != value:
+            self.invalid += 1
+            return
+        self.counts[bisect_right(self.edges, value)] += 1
+        self.count += 1
+
+    def update_many(self, values: np.ndarray) -> None:
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+        valid = values[~np.isnan(values)]
+        self.invalid += len(values) - len(valid)
+        bins = np.bincount(np.searchsorted(self.edges, valid, side="right"), minlength=len(self.counts))
+        self.counts = [count + int(added) for count, added in zip(self.counts, bins)]
+        self.count += len(valid)
+
+    def decay(self, factor: float) -> None:
+        self.counts = [count * factor for count in self.counts]
+        self.count *= factor
+        self.invalid *= factor
+
+    def proportions(self) -> List[float]:
+        return [count / self.count for count in self.counts] if self.count else list(self.counts)
+
+
+class CategoricalSketch:
+    """Streaming count table of one categorical column."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.count = 0
+        self.invalid = 0
+
+    def update(self, value: object) -> None:
+        if value is None or value == "" or value != value:
+            self.invalid += 1
+            return
+        key = str(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+
+    def update_many(self, values: np.ndarray) -> None:
+        values = pd.Series(values, dtype=object)
+        valid = values[values.notna() & (values != "")]
+        self.invalid += len(values) - len(valid)
+        for key, count in valid.astype(str).value_counts().items():
+            self.counts[key] = self.counts.get(key, 0) + int(count)
+        self.count += len(valid)
+
+    def decay(self, factor: float) -> None:
+        self.counts = {key: count * factor for key, count in self.counts.items()}
+        self.count *= factor
+        self.invalid *= factor
+
+    def proportions(self, categories: List[str]) -> List[float]:
+        if not self.count:
+            return [0.0] * len(categories)
+        return [self.counts.get(category, 0) / self.count for category in categories]
+
+
+class DriftMonitor:
+    """
+    Online drift monitor of the features received by the prediction service.
+
+    The live traffic is summarised with streaming sketches that are compared
+    against the reference profile saved with the model every `check_interval`
+    records, or on demand through `check`. After every periodic check the
+    sketch counts are multiplied by `decay`, so the older traffic fades out and
+    the PSI reflects the recent records rather than the whole uptime.
+    """
+
+    def __init__(
+            self,
+            reference_profile: Dict,
+            check_interval: int = DRIFT_CHECK_INTERVAL,
+            min_samples: int = DRIFT_MIN_SAMPLES,
+            psi_threshold: float = DRIFT_PSI_THRESHOLD,
+            decay: float = DRIFT_DECAY,
+    ):
+        self.reference_profile = reference_profile
+        self.check_interval = check_interval
+        self.min_samples = min_samples
+        self.psi_threshold = psi_threshold
+        self.decay = decay
+
+        self.numeric_sketches = {
+            column: NumericSketch(stats["edges"])
+            for column, stats in reference_profile.get("numerical", {}).items()
+        }
+        self.categorical_sketches = {
+            column: CategoricalSketch()
+            for column in reference_profile.get("categorical", {})
+        }
+        self.n_records = 0
+        self.status = {"n_records": 0, "drifted_columns": [], "psi": {}, "dataset_drift": False}
+        self._lock = threading.Lock()
+
+    def update(self, input_data: Mapping[str, Sequence]) -> None:
+        """
+        Update the sketches with incoming records.
+
+        Args:
+            input_data (Mapping[str, Sequence]): Column name to list of values, as
+                returned by ShippingData.get_data.
+        """
+        with self._lock:
+            for column, sketch in self.numeric_sketches.items():
+                for value in input_data.get(column, ()):
+                    sketch.update(value)
+            for column, sketch in self.categorical_sketches.items():
+                for value in input_data.get(column, ()):
+                    sketch.update(value)
+
+            previous = self.n_records
+            self.n_records += len(next(iter(input_data.values()), ()))
+            run_check = self.n_records // self.check_interval > previous // self.check_interval
+
+        if run_check:
+            self.check()
+            self.decay_sketches()
+
+    def update_columns(self, columns: Mapping[str, np.ndarray]) -> None:
+        """
+        Update the sketches with a batch of records, one vectorised update per column.
+
+        Args:
+            columns (Mapping[str, np.ndarray]): Column name to the values of the records.
+        """
+        with self._lock:
+            for sketches in (self.numeric_sketches, self.categorical_sketches):
+                for column, sketch in sketches.items():
+                    if column in columns:
+                        sketch.update_many(columns[column])
+
+            previous = self.n_records
+            self.n_records += len(next(iter(columns.values()), ()))
+            run_check = self.n_records // self.check_interval > previous // self.check_interval
+
+        if run_check:
+            self.check()
+            self.decay_sketches()
+
+    def decay_sketches(self) -> None:
+        """Scale the counts of every sketch down by the decay factor."""
+        with self._lock:
+            for sketches in (self.numeric_sketches, self.categorical_sketches):
+                for sketch in sketches.values():
+                    sketch.decay(self.decay)
+
+    def check(self) -> Dict:
+        """
+        Compare the live sketches with the reference profile.
+
+        Returns:
+            Dict: The drift status with the PSI of every monitored column.
+        """
+        try:
+            psi = {}
+            with self._lock:
+                for column, sketch in self.numeric_sketches.items():
+                    if sketch.count >= self.min_samples:
+                        expected = self.reference_profile["numerical"][column]["proportions"]
+                        psi[column] = population_stability_index(expected, sketch.proportions())
+
+                for column, sketch in self.categorical_sketches.items():
+                    if sketch.count >= self.min_samples:
+                        expected = self.reference_profile["categorical"][column]["proportions"]
+                        categories = sorted(set(expected) | set(sketch.counts))
+                        psi[column] = population_stability_index(
+                            [expected.get(category, 0.0) for category in categories],
+                            sketch.proportions(categories),
+                        )
+                n_records = self.n_records
+
+            drifted_columns = sorted(column for column, value in psi.items() if value > self.psi_threshold)
+            if drifted_columns and drifted_columns != self.status["drifted_columns"]:
+                logging.warning(f"Drift detected on live traffic for columns {drifted_columns}")
+
+            for column, value in psi.items():
+                DRIFT_PSI.labels(column=column).set(value)
+            DRIFT_DETECTED.set(1 if drifted_columns else 0)
+
+            self.status = {
+                "n_records": n_records,
+                "drifted_columns": drifted_columns,
+                "psi": {column: round(value, 6) for column, value in psi.items()},
+                "dataset_drift": bool(drifted_columns),
+            }
+            return self.status
+        except Exception as e:
+            raise ShipmentException(e, sys)
@@ -0,0 +1,329 @@
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Default latency buckets in seconds, from 0.5ms to 10s
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class of the metrics, one child per combination of label values."""
+
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *labelvalues: str, **labelkwargs: str):
+        if labelkwargs:
+            labelvalues = tuple(labelkwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default_child(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labelvalues, child in sorted(self._children.items()):
+            lines.extend(self._collect_child(labelvalues, child))
+        return lines
+
+    def _collect_child(self, labelvalues, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(child.value)}"]
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. requests or errors."""
+
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default_child().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. model size or drift score."""
+
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default_child().set(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, e.g. latencies."""
+
+    metric_type = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+            registry=None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+    def _collect_child(self, labelvalues, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), child.counts):
+            cumulative += count
+            bucket_label = f'le="{_format_value(bound)}"'
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, bucket_label)} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Serving metrics
+PREDICT_LATENCY = Histogram(
+    "shipment_predict_latency_seconds",
+    "Latency of the /predict route by phase (parse, validation, preprocess, estimator, onnx, explain, total).",
+    labelnames=("phase",),
+)
+MODEL_CACHE_REQUESTS = Counter(
+    "shipment_model_cache_requests_total",
+    "Lookups of the in-process model cache by result (hit, miss).",
+    labelnames=("result",),
+)
+EXPLAIN_CACHE_REQUESTS = Counter(
+    "shipment_explain_cache_requests_total",
+    "Rows looked up in the explanation cache by result (hit, miss).",
+    labelnames=("result",),
+)
+S3_CALLS = Counter(
+    "shipment_s3_calls_total",
+    "Calls made to S3 by operation.",
+    labelnames=("operation",),
+)
+ERRORS = Counter(
+    "shipment_errors_total",
+    "Errors returned by the service by route and reason (validation, exception).",
+    labelnames=("route", "reason"),
+)
+PREDICTION_LOG_RECORDS = Counter(
+    "shipment_prediction_log_records_total",
+    "Records of the prediction log by outcome (enqueued, written, dropped, failed).",
+    labelnames=("result",),
+)
+PREDICTION_LOG_PENDING = Gauge(
+    "shipment_prediction_log_pending_records",
+    "Records of the prediction log waiting for the background writer.",
+)
+PREDICTION_LOG_WRITE_SECONDS = Histogram(
+    "shipment_prediction_log_write_seconds",
+    "Duration of the insert_many batches of the prediction log.",
+)
+MODEL_INFO = Gauge(
+    "shipment_model_info",
+    "Version of the model being served, always 1.",
+    labelnames=("version", "model"),
+)
+MODEL_SIZE_BYTES = Gauge("shipment_model_size_bytes", "Size of the serialized model being served.")
+MODEL_LOAD_SECONDS = Gauge("shipment_model_load_seconds", "Time taken to load the model being served.")
+DRIFT_PSI = Gauge(
+    "shipment_drift_psi",
+    "Population stability index of the live features against the training profile.",
+    labelnames=("column",),
+)
+DRIFT_DETECTED = Gauge("shipment_drift_detected", "1 when drift is detected on the live features.")
+
+# Training metrics
+TRAINING_STAGE_SECONDS = Gauge(
+    "shipment_training_stage_seconds",
+    "Wall time of the last run of each training pipeline stage.",
+    labelnames=("stage",),
+)
+
+
+def get_peak_rss_bytes() -> int:
+    """
+    Get the peak resident set size of the process.
+
+    Returns:
+        int: VmHWM on Linux (resettable per stage), ru_maxrss otherwise.
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_rss_bytes() -> int:
+    """
+    Get the current resident set size of the process, 0 where /proc is not available.
+
+    Returns:
+        int: VmRSS in bytes.
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak resident set size of the process, Linux only.
+
+    Returns:
+        bool: Whether the peak could be reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+@contextmanager
+def track_stage(stage_name: str, stage_metrics: Dict) -> Iterator[Dict]:
+    """
+    Measure wall time, CPU time (including finished child processes), peak RSS and
+    the RSS left when a stage exits, i.e. the memory the stage hands to the next one.
+
+    Args:
+        stage_name (str): The name of the stage.
+        stage_metrics (Dict): The dictionary receiving the metrics under stage_name.
+
+    Yields:
+        Dict: The metrics of the stage, filled when the block exits.
+    """
+    metrics = {}
+    peak_rss_reset = reset_peak_rss()
+    start_time = time.perf_counter()
+    start_times = os.times()
+    try:
+        yield metrics
+    finally:
+        end_times = os.times()
+        metrics["wall_time_seconds"] = round(time.perf_counter() - start_time, 4)
+        metrics["cpu_time_seconds"] = round(
+            (end_times.user - start_times.user) + (end_times.system - start_times.system)
+            + (end_times.children_user - start_times.children_user)
+            + (end_times.children_system - start_times.children_system),
+            4,
+        )
+        metrics["peak_rss_bytes"] = get_peak_rss_bytes()
+        metrics["peak_rss_is_stage_peak"] = peak_rss_reset
+        metrics["end_rss_bytes"] = get_rss_bytes()
+        stage_metrics[stage_name] = metrics
+        TRAINING_STAGE_SECONDS.labels(stage=stage_name).set(metrics["wall_time_seconds"])
@@ -0,0 +1,179 @@
+import sys
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.monitoring.metrics import PREDICTION_LOG_PENDING, PREDICTION_LOG_RECORDS, PREDICTION_LOG_WRITE_SECONDS
+from shipment.constant import (
+    DB_NAME,
+    PREDICTION_LOG_BATCH_SIZE,
+    PREDICTION_LOG_BUFFER_SIZE,
+    PREDICTION_LOG_COLLECTION_NAME,
+    PREDICTION_LOG_FLUSH_INTERVAL,
+    PREDICTION_LOG_MAX_BACKOFF,
+)
+
+
+def get_mongo_operation() -> object:
+    # pymongo is imported by the writer thread, the serving process does not load it otherwise
+    from shipment.configuration.mongo_operations import MongoDBOperation
+
+    return MongoDBOperation()
+
+
+class PredictionLogger:
+    """
+    Asynchronous log of the predictions served, written to a MongoDB collection
+    by a background thread.
+
+    The request path only appends its record to a bounded in-memory ring buffer,
+    the newest record replacing the oldest when it is full. The writer takes the
+    records in batches of batch_size, as soon as a batch is full or every
+    flush_interval seconds, and writes them with an unordered insert_many. A
+    failed batch is put back in the buffer and retried with an exponential
+    backoff, so a slow or unreachable MongoDB fills the buffer and drops records,
+    counted in shipment_prediction_log_records_total, instead of slowing the
+    requests down.
+
+    Usage:
+        prediction_logger = PredictionLogger()
+        prediction_logger.log("/predict", inputs, prediction, model_version, latency_seconds)
+        prediction_logger.close()
+    """
+
+    def __init__(
+            self,
+            mongo_operation_factory: Callable[[], object] = get_mongo_operation,
+            db_name: str = DB_NAME,
+            collection_name: str = PREDICTION_LOG_COLLECTION_NAME,
+            buffer_size: int = PREDICTION_LOG_BUFFER_SIZE,
+            batch_size: int = PREDICTION_LOG_BATCH_SIZE,
+            flush_interval: float = PREDICTION_LOG_FLUSH_INTERVAL,
+            max_backoff: float = PREDICTION_LOG_MAX_BACKOFF,
+    ):
+        self.mongo_operation_factory = mongo_operation_factory
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._mongo_operation = None
+        self._writer = None
+        self._closed = False
+        self._backoff = 0.0
+
+    @staticmethod
+    def get_record(
+            route: str, inputs: Dict, prediction: float, model_version: str, latency_seconds: float
+    ) -> Dict:
+        return {
+            "timestamp": datetime.now(timezone.utc),
+            "route": route,
+            "model_version": model_version,
+            # Missing values as null, the documents read back like those of the training collection
+            "inputs": {column: None if value != value else value for column, value in inputs.items()},
+            "prediction": float(prediction),
+            "latency_ms": round(latency_seconds * 1e3, 3),
+        }
+
+    def log(self, route: str, inputs: Dict, prediction: float, model_version: str, latency_seconds: float) -> None:
+        """
+        Enqueue the record of a prediction, without waiting for MongoDB.
+
+        Args:
+            route (str): The route which served the prediction.
+            inputs (Dict): The input columns, as in the schema, to their values.
+            prediction (float): The predicted cost.
+            model_version (str): The version of the model which made the prediction.
+            latency_seconds (float): The time taken to serve the request.
+        """
+        try:
+            record = self.get_record(route, inputs, prediction, model_version, latency_seconds)
+            with self._condition:
+                if self._closed:
+                    PREDICTION_LOG_RECORDS.labels(result="dropped").inc()
+                    return
+                if len(self._buffer) == self._buffer.maxlen:
+                    PREDICTION_LOG_RECORDS.labels(result="dropped").inc()
+                self._buffer.append(record)
+                PREDICTION_LOG_RECORDS.labels(result="enqueued").inc()
+                PREDICTION_LOG_PENDING.set(len(self._buffer))
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self.run, name="prediction-log-writer", daemon=True)
+                    self._writer.start()
+                elif len(self._buffer) >= self.batch_size:
+                    self._condition.notify()
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def take_batch(self) -> List[Dict]:
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        PREDICTION_LOG_PENDING.set(len(self._buffer))
+        return batch
+
+    def run(self) -> None:
+        """Write the buffered records until the logger is closed and its buffer is empty."""
+        while True:
+            with self._condition:
+                if not self._closed and len(self._buffer) < self.batch_size:
+                    self._condition.wait(timeout=self.flush_interval)
+                if self._closed and not self._buffer:
+                    return
+                batch = self.take_batch()
+            if batch and not self.write(batch):
+                with self._condition:
+                    self._condition.wait_for(lambda: self._closed, timeout=self._backoff)
+
+    def write(self, batch: List[Dict]) -> bool:
+        """
+        Write a batch of records, putting it back in the buffer when MongoDB fails.
+
+        Args:
+            batch (List[Dict]): The records.
+
+        Returns:
+            bool: True if the batch reached MongoDB.
+        """
+        try:
+            if self._mongo_operation is None:
+                self._mongo_operation = self.mongo_operation_factory()
+            with PREDICTION_LOG_WRITE_SECONDS.time():
+                written = self._mongo_operation.insert_documents(batch, self.db_name, self.collection_name)
+            PREDICTION_LOG_RECORDS.labels(result="written").inc(written)
+            # Rejected by the server, such as invalid documents, they would fail again
+            PREDICTION_LOG_RECORDS.labels(result="failed").inc(len(batch) - written)
+            self._backoff = 0.0
+            return True
+        except Exception as e:
+            self._backoff = min(self.max_backoff, max(2 * self._backoff, self.flush_interval))
+            logging.warning(f"Could not write {len(batch)} prediction records, retrying in {self._backoff}s: {e}")
+            with self._condition:
+                if self._closed:
+                    PREDICTION_LOG_RECORDS.labels(result="failed").inc(len(batch))
+                    return False
+                # Ahead of the newer records, the oldest of the batch are dropped when the buffer is full
+                room = self._buffer.maxlen - len(self._buffer)
+                PREDICTION_LOG_RECORDS.labels(result="dropped").inc(max(0, len(batch) - room))
+                self._buffer.extendleft(reversed(batch[len(batch) - room:] if room < len(batch) else batch))
+                PREDICTION_LOG_PENDING.set(len(self._buffer))
+            return False
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Stop the writer once the buffered records are written, with a single attempt each.
+
+        Args:
+            timeout (float, optional): The seconds to wait for the writer. Defaults to 10.
+        """
+        logging.info("Entered the close method of PredictionLogger class")
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._writer is not None:
+            self._writer.join(timeout)
+        logging.info("Exited the close method of PredictionLogger class")
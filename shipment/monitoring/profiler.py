@@ -0,0 +1,286 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from shipment.logger import logging
+from shipment.constant import (
+    PROFILE_PIPELINE_INTERVAL,
+    PROFILE_REQUEST_MAX_CONCURRENT,
+    PROFILE_REQUEST_MAX_FILES,
+    PROFILE_TRACEMALLOC_FRAMES,
+)
+
+# Number of allocation sites written to the memory report
+MEMORY_REPORT_TOP_N = 30
+
+# The switch interval is process wide: the intervals of the running profilers, and
+# the interval to restore once the last one stops
+_switch_interval_lock = threading.Lock()
+_switch_interval_overrides: List[float] = []
+_original_switch_interval: Optional[float] = None
+
+# Request profiles running at the same time
+_request_profile_slots = threading.BoundedSemaphore(PROFILE_REQUEST_MAX_CONCURRENT)
+
+
+def override_switch_interval(interval: float) -> None:
+    """Lower the switch interval to interval while a profiler runs, see restore_switch_interval."""
+    global _original_switch_interval
+    with _switch_interval_lock:
+        if not _switch_interval_overrides:
+            _original_switch_interval = sys.getswitchinterval()
+        _switch_interval_overrides.append(interval)
+        sys.setswitchinterval(min([_original_switch_interval, *_switch_interval_overrides]))
+
+
+def restore_switch_interval(interval: float) -> None:
+    """Drop the override of a stopped profiler, the original interval is restored with the last one."""
+    with _switch_interval_lock:
+        _switch_interval_overrides.remove(interval)
+        sys.setswitchinterval(min([_original_switch_interval, *_switch_interval_overrides]))
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stack of one thread from a background thread.
+
+    The profiled code runs untouched, the cost is one stack walk per sample in
+    the sampler thread. Stacks are aggregated in the folded format read by
+    flamegraph.pl, speedscope and most flamegraph viewers: one line per unique
+    stack, frames from the root separated by ";", then the number of samples.
+
+    Usage:
+        profiler = SamplingProfiler(interval=0.005)
+        profiler.start()
+        ...
+        profiler.stop()
+        profiler.write_folded("stage.folded")
+    """
+
+    def __init__(self, interval: float = PROFILE_PIPELINE_INTERVAL, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks: Dict[str, int] = {}
+        self.n_samples = 0
+        self.duration = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_time = None
+
+    def start(self) -> None:
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        # The sampler only runs when the profiled thread releases the GIL, which a
+        # busy thread does every switch interval (5ms by default)
+        override_switch_interval(self.interval)
+        self._stop_event.clear()
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="shipment-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.perf_counter() - self._start_time
+        restore_switch_interval(self.interval)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            stack = ";".join(reversed(labels))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.n_samples += 1
+
+    def write_folded(self, file_path: str) -> None:
+        """
+        Write the sampled stacks in the folded format.
+
+        Args:
+            file_path (str): The output file, conventionally with a .folded extension.
+        """
+        with open(file_path, "w") as folded_file:
+            for stack, count in sorted(self.stacks.items()):
+                folded_file.write(f"{stack} {count}\n")
+
+
+def write_memory_report(snapshot: tracemalloc.Snapshot, peak_bytes: int, file_path: str) -> None:
+    """
+    Write the largest allocation sites of a tracemalloc snapshot as text.
+
+    Args:
+        snapshot (tracemalloc.Snapshot): The snapshot taken at the end of the block.
+        peak_bytes (int): The peak of traced memory during the block.
+        file_path (str): The output file.
+    """
+    statistics = snapshot.statistics("traceback")
+    with open(file_path, "w") as report_file:
+        report_file.write(f"Peak traced memory: {peak_bytes / 2 ** 20:.1f} MiB\n")
+        report_file.write(f"Memory still allocated: {sum(stat.size for stat in statistics) / 2 ** 20:.1f} MiB\n\n")
+        for index, stat in enumerate(statistics[:MEMORY_REPORT_TOP_N], start=1):
+            report_file.write(f"#{index}: {stat.size / 2 ** 20:.2f} MiB in {stat.count} blocks\n")
+            for line in stat.traceback.format(most_recent_first=True):
+                report_file.write(f"{line}\n")
+            report_file.write("\n")
+
+
+@contextmanager
+def profile_block(
+        name: str,
+        output_dir: str,
+        interval: float = PROFILE_PIPELINE_INTERVAL,
+        trace_memory: bool = False,
+) -> Iterator[Dict]:
+    """
+    Profile the code run in the block and save the results in output_dir.
+
+    Writes `<name>.folded` with the sampled stacks and, when trace_memory is
+    set, `<name>.memory.txt` with the largest allocation sites and
+    `<name>.tracemalloc`, the raw snapshot readable with
+    tracemalloc.Snapshot.load.
+
+    Args:
+        name (str): The name of the profile, used for the file names.
+        output_dir (str): The directory receiving the profile files.
+        interval (float, optional): Seconds between two stack samples. Defaults to PROFILE_PIPELINE_INTERVAL.
+        trace_memory (bool, optional): Whether to trace the allocations as well. Defaults to False.
+
+    Yields:
+        Dict: The paths of the written files and the number of samples, filled when the block exits.
+    """
+    profile = {}
+    profiler = SamplingProfiler(interval=interval)
+    start_tracing = trace_memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    elif trace_memory:
+        tracemalloc.reset_peak()
+
+    profiler.start()
+    try:
+        yield profile
+    finally:
+        profiler.stop()
+        if trace_memory:
+            # Leaving out the allocations of the sampler thread
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__)])
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            if start_tracing:
+                tracemalloc.stop()
+
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            profile["folded_file_path"] = os.path.join(output_dir, f"{name}.folded")
+            profile["n_samples"] = profiler.n_samples
+            profiler.write_folded(profile["folded_file_path"])
+
+            if trace_memory:
+                profile["memory_report_file_path"] = os.path.join(output_dir, f"{name}.memory.txt")
+                profile["memory_snapshot_file_path"] = os.path.join(output_dir, f"{name}.tracemalloc")
+                profile["peak_traced_bytes"] = peak_bytes
+                write_memory_report(snapshot, peak_bytes, profile["memory_report_file_path"])
+                snapshot.dump(profile["memory_snapshot_file_path"])
+
+            logging.info(f"Saved the profile of {name} ({profiler.n_samples} samples) to {output_dir}")
+        except Exception as e:
+            # A failed profile must never fail the profiled work
+            logging.warning(f"Could not save the profile of {name}: {e}")
+
+
+def prune_profiles(output_dir: str, max_profiles: int) -> None:
+    """
+    Delete the oldest profiles of output_dir, keeping the max_profiles newest.
+
+    Args:
+        output_dir (str): The directory of the profiles, their files are named after the profile.
+        max_profiles (int): The number of profiles kept.
+    """
+    profiles: Dict[str, List[os.DirEntry]] = {}
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                profiles.setdefault(entry.name.split(".")[0], []).append(entry)
+    if len(profiles) <= max_profiles:
+        return
+    by_age = sorted(profiles.values(), key=lambda files: max(entry.stat().st_mtime for entry in files))
+    for files in by_age[:len(profiles) - max_profiles]:
+        for entry in files:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def profile_request(
+        name: str,
+        output_dir: str,
+        interval: float,
+        max_profiles: int = PROFILE_REQUEST_MAX_FILES,
+) -> Iterator[Optional[Dict]]:
+    """
+    Profile a request with profile_block when fewer than PROFILE_REQUEST_MAX_CONCURRENT
+    requests are being profiled, and keep the max_profiles newest profiles of output_dir.
+
+    Args:
+        name (str): The name of the profile, used for the file names.
+        output_dir (str): The directory receiving the profile files.
+        interval (float): Seconds between two stack samples.
+        max_profiles (int, optional): The number of profiles kept. Defaults to PROFILE_REQUEST_MAX_FILES.
+
+    Yields:
+        Optional[Dict]: The profile as yielded by profile_block, None when the request is not profiled.
+    """
+    if not _request_profile_slots.acquire(blocking=False):
+        yield None
+        return
+    try:
+        with profile_block(name, output_dir, interval=interval) as profile:
+            yield profile
+        try:
+            prune_profiles(output_dir, max_profiles)
+        except Exception as e:
+            logging.warning(f"Could not prune the profiles of {output_dir}: {e}")
+    finally:
+        _request_profile_slots.release()
+
+
+def should_profile_request(
+        header_value: Optional[str],
+        token: str,
+        sample_rate: float,
+) -> bool:
+    """
+    Whether a request is profiled: asked with the header holding the token, or sampled.
+
+    Args:
+        header_value (Optional[str]): The value of the profiling header.
+        token (str): The token of on demand profiling, disabled when empty.
+        sample_rate (float): The share of requests profiled.
+
+    Returns:
+        bool: True if the request is to be profiled.
+    """
+    if token and header_value and hmac.compare_digest(header_value.encode(), token.encode()):
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
@@ -1,13 +1,40 @@
+import os
 import sys
+from contextlib import nullcontext
+from typing import Optional
 from shipment.logger import logging
 from shipment.exception import ShipmentException
+from shipment.utils.main_utils import MainUtils
+from shipment.monitoring.metrics import track_stage
+from shipment.monitoring.drift_monitor import compare_profiles, compare_with_reference_profile
+from shipment.monitoring.collection_profile import profile_collection
+from shipment.monitoring.profiler import profile_block
+from shipment.constant import (
+    ARTEFACTS_DIR,
+    BUCKET_NAME,
+    COLLECTION_PROFILE_FILE_NAME,
+    DATA_INGESTION_CHUNK_SIZE,
+    DRIFT_PSI_THRESHOLD,
+    MODEL_FILE_NAME,
+    PIPELINE_METRICS_FILE_NAME,
+    PROFILE_MEMORY_STAGES,
+    PROFILE_PIPELINE_ENV_KEY,
+    PROFILES_DIR_NAME,
+    S3_MODEL_NAME,
+    TRAINING_MODE_OUT_OF_CORE,
+    WARM_START_DRIFT_SAMPLE_ROWS,
+)
 
 from shipment.configuration.mongo_operations import MongoDBOperation
+from shipment.utils.dtype_plan import DtypePlan
+from shipment.utils.mongo_query import build_ingestion_query
+from shipment.utils.schema_validator import SchemaValidator
 from shipment.entity.artefacts_entity import (
     DataIngestionArtefacts,
     DataValidationArtefacts,
     DataTransformationArtefacts,
     ModelTrainerArtefacts,
+    ModelExporterArtefacts,
     ModelEvaluationArtefacts,
     ModelPusherArtefacts,
     )
@@ -17,6 +44,7 @@ from shipment.entity.config_entity import (
     DataValidationConfig,
     DataTransformationConfig,
     ModelTrainerConfig,
+    ModelExporterConfig,
     ModelEvaluationConfig,
     ModelPusherConfig,
     )
@@ -24,22 +52,30 @@ from shipment.entity.config_entity import (
 from shipment.components.data_ingestion import DataIngestion
 from shipment.components.data_validation import DataValidation
 from shipment.components.data_transformation import DataTransformation
-from shipment.components.model_trainer import ModelTrainer
+from shipment.components.cost_model import CostModel
+from shipment.components.model_trainer import ModelTrainer, can_warm_start
+from shipment.components.model_exporter import ModelExporter
 from shipment.components.model_evaluation import ModelEvaluation
 from shipment.configuration.s3_operations import S3Operations
 from shipment.components.model_pusher import ModelPusher
 
 
 class TrainPipeline:
-    def __init__(self):
+    def __init__(self, profile: Optional[bool] = None, warm_start: bool = False, if_drifted: bool = False):
         self.data_ingestion_config = DataIngestionConfig()
         self.data_validation_config = DataValidationConfig()
         self.data_transformation_config = DataTransformationConfig()
         self.model_trainer_config = ModelTrainerConfig()
+        self.model_exporter_config = ModelExporterConfig()
         self.model_evaluation_config = ModelEvaluationConfig()
         self.s3_operations = S3Operations()
         self.model_pusher_config = ModelPusherConfig()
         self.mongo_op = MongoDBOperation()
+        self.stage_metrics = {}
+        # Profiling every run when set in the environment, unless the caller chose
+        self.profile = os.environ.get(PROFILE_PIPELINE_ENV_KEY, "0") == "1" if profile is None else profile
+        self.warm_start = warm_start
+        self.if_drifted = if_drifted
 
     # This method is used to start the data ingestion.
     def start_data_ingestion(self) -> DataIngestionArtefacts:
@@ -70,15 +106,118 @@ class TrainPipeline:
             raise ShipmentException(e, sys)
         
 
+    # This method is used to check whether the collection drifted from the champion model.
+    def is_retrain_needed(self) -> bool:
+        """
+        Whether the documents of the training window drifted from the reference profile
+        of the model of the bucket. They are profiled inside MongoDB, on the bins of the
+        reference profile, and validated against the schema from their profile, so only
+        the profile is downloaded.
+
+        Returns:
+            bool: True when the collection drifted or is invalid, or when there is no model
+                or reference profile to compare with.
+        """
+        logging.info("Entered the is_retrain_needed method of TrainPipeline class.")
+        try:
+            if not self.s3_operations.is_model_present(BUCKET_NAME, S3_MODEL_NAME):
+                logging.info("No model in the bucket, a retrain is needed")
+                return True
+            reference_profile = self.s3_operations.load_model(MODEL_FILE_NAME, BUCKET_NAME).reference_profile
+            if reference_profile is None:
+                logging.info("The model of the bucket has no reference profile, a retrain is needed")
+                return True
+
+            profile = profile_collection(
+                self.mongo_op,
+                self.data_ingestion_config.DB_NAME,
+                self.data_ingestion_config.COLLECTION_NAME,
+                self.data_ingestion_config.SCHEMA_CONFIG,
+                reference_profile=reference_profile,
+                query=build_ingestion_query(self.data_ingestion_config.INGESTION_CONFIG),
+            )
+            os.makedirs(ARTEFACTS_DIR, exist_ok=True)
+            MainUtils().write_json_to_yaml(profile, os.path.join(ARTEFACTS_DIR, COLLECTION_PROFILE_FILE_NAME))
+
+            schema_report = SchemaValidator(
+                self.data_ingestion_config.SCHEMA_CONFIG, exclude_columns=self.data_ingestion_config.DROP_COLS
+            ).validate_profile(profile)
+            if not schema_report.validation_status:
+                logging.warning(f"The collection fails the schema on {schema_report.failed_columns}, retraining")
+                return True
+
+            drift = compare_profiles(reference_profile, profile, psi_threshold=DRIFT_PSI_THRESHOLD)
+            logging.info(f"Drift of the collection from the reference profile: {drift}")
+            logging.info("Exited the is_retrain_needed method of TrainPipeline class.")
+            return drift["dataset_drift"]
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+
+    # This method is used to get the champion model to warm start from.
+    def get_warm_start_champion(self, data_ingestion_artefact: DataIngestionArtefacts) -> CostModel:
+        """
+        Get the model of the bucket to continue training from, or None to retrain
+        in full: when there is no model yet, when its estimator cannot be trained
+        further, or when the new training data drifted from its reference profile.
+
+        Args:
+            data_ingestion_artefact (DataIngestionArtefacts): The ingested data.
+
+        Returns:
+            CostModel: The champion model, or None.
+        """
+        logging.info("Entered the get_warm_start_champion method of TrainPipeline class.")
+        try:
+            if not self.s3_operations.is_model_present(BUCKET_NAME, S3_MODEL_NAME):
+                logging.warning("No model in the bucket to warm start from, retraining in full")
+                return None
+            champion = self.s3_operations.load_model(MODEL_FILE_NAME, BUCKET_NAME)
+            estimator = champion.trained_model_object
+
+            if not can_warm_start(estimator) or (
+                self.model_trainer_config.TRAINING_MODE == TRAINING_MODE_OUT_OF_CORE
+                and not hasattr(estimator, "get_booster")
+            ):
+                logging.warning(f"Cannot warm start a {type(estimator).__name__}, retraining in full")
+                return None
+
+            if champion.reference_profile is not None:
+                # A random sample of the whole split, its first rows are not representative
+                train_df = DtypePlan(self.data_transformation_config.SCHEMA_CONFIG).sample_csv(
+                    data_ingestion_artefact.train_data_file_path,
+                    WARM_START_DRIFT_SAMPLE_ROWS,
+                    DATA_INGESTION_CHUNK_SIZE,
+                )
+                drift = compare_with_reference_profile(
+                    champion.reference_profile,
+                    train_df,
+                    psi_threshold=float(self.model_trainer_config.WARM_START_CONFIG["psi_threshold"]),
+                )
+                if drift["dataset_drift"]:
+                    logging.warning(
+                        f"The training data drifted from the champion's reference profile on "
+                        f"{drift['drifted_columns']}, retraining in full"
+                    )
+                    return None
+
+            logging.info(f"Warm starting from the champion {champion}")
+            logging.info("Exited the get_warm_start_champion method of TrainPipeline class.")
+            return champion
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+
     # This method is used to start the data transformation.
     def start_data_transformation(
-            self, data_ingestion_artefact: DataIngestionArtefacts
+            self, data_ingestion_artefact: DataIngestionArtefacts, champion: CostModel = None
             ) -> DataTransformationArtefacts:
         logging.info("Entered the start_data_transformation method of TrainPipeline class.")
         try:
             data_transformation = DataTransformation(
                 data_ingestion_artefacts=data_ingestion_artefact,
-                data_transformation_config=self.data_transformation_config)
+                data_transformation_config=self.data_transformation_config,
+                preprocessor=None if champion is None else champion.preprocessing_object)
             
             data_transformation_artefact = data_transformation.initiate_data_transformation()
             logging.info("Performed the data transformation operation.")
@@ -90,13 +229,14 @@ class TrainPipeline:
 
     # This method is used to start the model trainer.
     def start_model_trainer(
-            self, data_transformation_artefact: DataTransformationArtefacts
+            self, data_transformation_artefact: DataTransformationArtefacts, champion: CostModel = None
             ) -> ModelTrainerArtefacts:
         logging.info("Entered the start_model_trainer method of TrainPipeline class.")
         try:
             model_trainer = ModelTrainer(
                 data_transformation_artefact=data_transformation_artefact,
-                model_trainer_config=self.model_trainer_config
+                model_trainer_config=self.model_trainer_config,
+                champion=champion,
                 )
             
             model_trainer_artefact = model_trainer.initiate_model_trainer()
@@ -109,6 +249,28 @@ class TrainPipeline:
 
 
 
+    # This method is used to start the model export.
+    def start_model_exporter(
+            self,
+            data_ingestion_artefact: DataIngestionArtefacts,
+            model_trainer_artefact: ModelTrainerArtefacts,
+        ) -> ModelExporterArtefacts:
+        logging.info("Entered the start_model_exporter method of TrainPipeline class.")
+        try:
+            model_exporter = ModelExporter(
+                model_trainer_artefact=model_trainer_artefact,
+                model_exporter_config=self.model_exporter_config,
+                data_ingestion_artefact=data_ingestion_artefact,
+            )
+
+            model_exporter_artefact = model_exporter.initiate_model_exporter()
+            logging.info("Performed the model export operation.")
+            logging.info("Exited the start_model_exporter method of TrainPipeline class.")
+            return model_exporter_artefact
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+
     # This method is used to start the model evaluation.
     def start_model_evaluation(
             self,
@@ -160,34 +322,77 @@ class TrainPipeline:
     def run_pipeline(self) -> None:
         logging.info("Entered the run_pipeline method of TrainPipeline class.")
         try:
-            data_ingestion_artefact = self.start_data_ingestion()
+            self.stage_metrics = {}
+            if self.if_drifted:
+                with track_stage("drift_check", self.stage_metrics):
+                    retrain_needed = self.is_retrain_needed()
+                if not retrain_needed:
+                    logging.info("The collection did not drift from the model of the bucket, the training is skipped")
+                    return None
 
-            data_validation_artefact = self.start_data_validation(
-                data_ingestion_artefact=data_ingestion_artefact
-            )
+            with track_stage("data_ingestion", self.stage_metrics), self.profile_stage("data_ingestion"):
+                data_ingestion_artefact = self.start_data_ingestion()
 
-            data_transformation_artefact = self.start_data_transformation(
-                data_ingestion_artefact=data_ingestion_artefact
-            )
+            with track_stage("data_validation", self.stage_metrics), self.profile_stage("data_validation"):
+                data_validation_artefact = self.start_data_validation(
+                    data_ingestion_artefact=data_ingestion_artefact
+                )
 
-            model_trainer_artefact = self.start_model_trainer(
-                data_transformation_artefact=data_transformation_artefact
-            )
+            champion = self.get_warm_start_champion(data_ingestion_artefact) if self.warm_start else None
 
-            model_evaluation_artefact = self.start_model_evaluation(
-                data_ingestion_artefact=data_ingestion_artefact,
-                model_trainer_artefact=model_trainer_artefact,
-            )
+            with track_stage("data_transformation", self.stage_metrics), self.profile_stage("data_transformation"):
+                data_transformation_artefact = self.start_data_transformation(
+                    data_ingestion_artefact=data_ingestion_artefact, champion=champion
+                )
+
+            with track_stage("model_trainer", self.stage_metrics), self.profile_stage("model_trainer"):
+                model_trainer_artefact = self.start_model_trainer(
+                    data_transformation_artefact=data_transformation_artefact, champion=champion
+                )
+
+            with track_stage("model_exporter", self.stage_metrics), self.profile_stage("model_exporter"):
+                self.start_model_exporter(
+                    data_ingestion_artefact=data_ingestion_artefact,
+                    model_trainer_artefact=model_trainer_artefact,
+                )
+
+            with track_stage("model_evaluation", self.stage_metrics), self.profile_stage("model_evaluation"):
+                model_evaluation_artefact = self.start_model_evaluation(
+                    data_ingestion_artefact=data_ingestion_artefact,
+                    model_trainer_artefact=model_trainer_artefact,
+                )
             if not model_evaluation_artefact.is_model_accepted:
                 logging.info("The model is not accpeted.")
                 return None
             
-            model_pusher_artefact = self.start_model_pusher(
-                model_trainer_artefacts=model_trainer_artefact,
-                s3=self.s3_operations,
-                data_transformation_artefacts=data_transformation_artefact,
-            )
+            with track_stage("model_pusher", self.stage_metrics), self.profile_stage("model_pusher"):
+                model_pusher_artefact = self.start_model_pusher(
+                    model_trainer_artefacts=model_trainer_artefact,
+                    s3=self.s3_operations,
+                    data_transformation_artefacts=data_transformation_artefact,
+                )
 
             logging.info("Exited the run_pipeline method of TrainPipeline class.")
         except Exception as e:
-            raise ShipmentException(e, sys)
\ No newline at end of file
+            raise ShipmentException(e, sys)
+        finally:
+            self.save_stage_metrics()
+
+    # This method is used to profile a stage when the profiling mode is on.
+    def profile_stage(self, stage_name: str):
+        if not self.profile:
+            return nullcontext()
+        return profile_block(
+            stage_name,
+            os.path.join(ARTEFACTS_DIR, PROFILES_DIR_NAME),
+            trace_memory=stage_name in PROFILE_MEMORY_STAGES,
+        )
+
+    # This method is used to save the metrics of the stages run so far.
+    def save_stage_metrics(self) -> None:
+        if not self.stage_metrics:
+            return
+        os.makedirs(ARTEFACTS_DIR, exist_ok=True)
+        pipeline_metrics_file_path = os.path.join(ARTEFACTS_DIR, PIPELINE_METRICS_FILE_NAME)
+        MainUtils().write_json_to_yaml(self.stage_metrics, pipeline_metrics_file_path)
+        logging.info(f"Saved the pipeline stage metrics to {pipeline_metrics_file_path}")
@@ -0,0 +1,173 @@
+import glob
+import json
+import os
+import struct
+import sys
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from shipment.exception import ShipmentException
+from shipment.constant import ARRAY_ARTEFACT_CHUNK_SIZE
+
+ARRAY_ARTEFACT_MAGIC = b"SHIPARR1"
+ARRAY_ARTEFACT_ALIGNMENT = 64
+HEADER_LENGTH_FORMAT = "<Q"
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ARRAY_ARTEFACT_ALIGNMENT) * ARRAY_ARTEFACT_ALIGNMENT
+
+
+def save_array_artefact(
+        file_path: str,
+        arrays: Dict[str, np.ndarray],
+        metadata: Dict = None,
+        compress: bool = False,
+) -> str:
+    """
+    Save named numeric arrays and a json metadata header in one file.
+
+    Layout: the magic bytes, the length of the json header, the header, then
+    the raw bytes of every array in C order, each one starting on a 64 bytes
+    boundary. Uncompressed files are read back as memory mapped views without
+    any copy. Compressed files store each array as zlib chunks of
+    ARRAY_ARTEFACT_CHUNK_SIZE bytes, smaller to transfer but decompressed on load.
+
+    Args:
+        file_path (str): The artefact file.
+        arrays (Dict[str, np.ndarray]): The arrays, numeric dtypes only.
+        metadata (Dict, optional): Json serialisable metadata, such as the column names. Defaults to None.
+        compress (bool, optional): Whether to compress the arrays. Defaults to False.
+
+    Returns:
+        str: The file path.
+    """
+    try:
+        payloads, entries = [], {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            if array.dtype.hasobject:
+                raise TypeError(f"Array {name} has dtype {array.dtype}, only numeric arrays are stored")
+            raw = memoryview(array).cast("B")
+            entry = {"dtype": array.dtype.str, "shape": list(array.shape), "nbytes": array.nbytes}
+            if compress:
+                chunks = [
+                    zlib.compress(raw[start:start + ARRAY_ARTEFACT_CHUNK_SIZE], 1)
+                    for start in range(0, array.nbytes, ARRAY_ARTEFACT_CHUNK_SIZE)
+                ]
+                entry["chunks"] = [len(chunk) for chunk in chunks]
+                payloads.append(chunks)
+            else:
+                payloads.append([raw])
+            entries[name] = entry
+
+        # The offsets depend on the header length, which depends on the offsets:
+        # they are given relative to the first aligned byte after the header
+        offset = 0
+        for entry, payload in zip(entries.values(), payloads):
+            offset = _aligned(offset)
+            entry["offset"] = offset
+            offset += sum(len(part) for part in payload)
+
+        header = json.dumps({
+            "compression": "zlib" if compress else None,
+            "arrays": entries,
+            "metadata": metadata or {},
+        }).encode()
+        data_start = _aligned(len(ARRAY_ARTEFACT_MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT) + len(header))
+
+        with open(file_path, "wb") as file_obj:
+            file_obj.write(ARRAY_ARTEFACT_MAGIC)
+            file_obj.write(struct.pack(HEADER_LENGTH_FORMAT, len(header)))
+            file_obj.write(header)
+            for entry, payload in zip(entries.values(), payloads):
+                file_obj.seek(data_start + entry["offset"])
+                for part in payload:
+                    file_obj.write(part)
+        return file_path
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def read_array_artefact_header(file_path: str) -> Tuple[Dict, int]:
+    """
+    Read the header of an array artefact.
+
+    Args:
+        file_path (str): The artefact file.
+
+    Returns:
+        Tuple[Dict, int]: The header and the file offset of the first array.
+    """
+    try:
+        with open(file_path, "rb") as file_obj:
+            if file_obj.read(len(ARRAY_ARTEFACT_MAGIC)) != ARRAY_ARTEFACT_MAGIC:
+                raise ValueError(f"{file_path} is not an array artefact")
+            (header_length,) = struct.unpack(
+                HEADER_LENGTH_FORMAT, file_obj.read(struct.calcsize(HEADER_LENGTH_FORMAT))
+            )
+            header = json.loads(file_obj.read(header_length))
+        data_start = _aligned(len(ARRAY_ARTEFACT_MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT) + header_length)
+        return header, data_start
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def load_array_artefact(file_path: str, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Load the arrays and the metadata of an array artefact.
+
+    Args:
+        file_path (str): The artefact file.
+        mmap (bool, optional): Whether to return read only views of a memory map
+            of the file instead of reading it, ignored for compressed files. Defaults to True.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], Dict]: The arrays by name and the metadata.
+    """
+    try:
+        header, data_start = read_array_artefact_header(file_path)
+        arrays = {}
+        if header["compression"] is None and mmap:
+            file_map = np.memmap(file_path, dtype=np.uint8, mode="r")
+            for name, entry in header["arrays"].items():
+                start = data_start + entry["offset"]
+                arrays[name] = (
+                    file_map[start:start + entry["nbytes"]].view(np.dtype(entry["dtype"])).reshape(entry["shape"])
+                )
+            return arrays, header["metadata"]
+
+        with open(file_path, "rb") as file_obj:
+            for name, entry in header["arrays"].items():
+                array = np.empty(entry["shape"], dtype=np.dtype(entry["dtype"]))
+                buffer = memoryview(array).cast("B")
+                file_obj.seek(data_start + entry["offset"])
+                if header["compression"] is None:
+                    file_obj.readinto(buffer)
+                else:
+                    position = 0
+                    for chunk_length in entry["chunks"]:
+                        chunk = zlib.decompress(file_obj.read(chunk_length))
+                        buffer[position:position + len(chunk)] = chunk
+                        position += len(chunk)
+                arrays[name] = array
+        return arrays, header["metadata"]
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def list_array_artefact_parts(path: str) -> List[str]:
+    """
+    List the files of an array artefact, written whole or chunk by chunk.
+
+    Args:
+        path (str): An artefact file, or a directory of artefact files, one per chunk.
+
+    Returns:
+        List[str]: The artefact files, in chunk order.
+    """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.arr")))
+    return [path]
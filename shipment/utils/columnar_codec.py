@@ -0,0 +1,104 @@
+import sys
+from typing import Dict
+
+import numpy as np
+
+from shipment.exception import ShipmentException
+from shipment.constant import ARROW_STREAM_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, PREDICTION_COLUMN
+
+# Request formats of /predict/batch, the responses use the same
+COLUMNAR_MEDIA_TYPES = (ARROW_STREAM_MEDIA_TYPE, MSGPACK_MEDIA_TYPE)
+
+
+def arrow_column_to_numpy(column: object) -> np.ndarray:
+    """
+    Get a column of an Arrow table as a numpy array. A numerical column without
+    nulls in a single chunk is a read-only view of the Arrow buffer, a dictionary
+    encoded column is decoded with a take of its dictionary.
+
+    Args:
+        column (pyarrow.ChunkedArray): The column.
+
+    Returns:
+        np.ndarray: The values, with None for the nulls of the string columns and NaN for the numerical ones.
+    """
+    import pyarrow as pa
+
+    array = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+    if pa.types.is_dictionary(array.type):
+        dictionary = array.dictionary.to_numpy(zero_copy_only=False)
+        indices = array.indices.to_numpy(zero_copy_only=False)
+        if array.null_count:
+            dictionary = np.append(dictionary.astype(object), None)
+            indices = np.where(array.is_null().to_numpy(zero_copy_only=False), len(dictionary) - 1, indices)
+        return dictionary[indices.astype(np.intp)]
+    if (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)) and array.null_count:
+        # A float array with NaN in place of the nulls, the integer ones would become object arrays
+        return array.cast(pa.float64()).fill_null(np.nan).to_numpy(zero_copy_only=False)
+    return array.to_numpy(zero_copy_only=False)
+
+
+def msgpack_values_to_numpy(values: list) -> np.ndarray:
+    # Numbers give a numerical array, anything else, strings and nulls included, an object one
+    array = np.asarray(values)
+    return array if array.dtype.kind in "fiu" else np.asarray(values, dtype=object)
+
+
+def read_columns(body: bytes, media_type: str) -> Dict[str, np.ndarray]:
+    """
+    Decode the columns of a /predict/batch request.
+
+    Args:
+        body (bytes): The request body, an Arrow IPC stream or a MessagePack map of column name to values.
+        media_type (str): The media type of the body, one of COLUMNAR_MEDIA_TYPES.
+
+    Returns:
+        Dict[str, np.ndarray]: The values by column name.
+    """
+    try:
+        if media_type == ARROW_STREAM_MEDIA_TYPE:
+            import pyarrow as pa
+
+            table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+            return {name: arrow_column_to_numpy(table.column(name)) for name in table.column_names}
+        if media_type == MSGPACK_MEDIA_TYPE:
+            import msgpack
+
+            columns = msgpack.unpackb(body, raw=False)
+            if not isinstance(columns, dict):
+                raise ValueError("The MessagePack body must be a map of column name to values")
+            return {name: msgpack_values_to_numpy(values) for name, values in columns.items()}
+        raise ValueError(f"Unsupported media type {media_type}, expected one of {COLUMNAR_MEDIA_TYPES}")
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def write_predictions(predictions: np.ndarray, media_type: str) -> bytes:
+    """
+    Encode the predictions of a /predict/batch request as a float32 column.
+
+    Args:
+        predictions (np.ndarray): The predictions.
+        media_type (str): The media type of the response, one of COLUMNAR_MEDIA_TYPES.
+
+    Returns:
+        bytes: An Arrow IPC stream of a single float32 column, or a MessagePack map with
+            the column as a list of float32 values.
+    """
+    try:
+        predictions = np.asarray(predictions, dtype=np.float32)
+        if media_type == ARROW_STREAM_MEDIA_TYPE:
+            import pyarrow as pa
+
+            batch = pa.RecordBatch.from_arrays([pa.array(predictions)], names=[PREDICTION_COLUMN])
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, batch.schema) as writer:
+                writer.write_batch(batch)
+            return sink.getvalue().to_pybytes()
+        if media_type == MSGPACK_MEDIA_TYPE:
+            import msgpack
+
+            return msgpack.packb({PREDICTION_COLUMN: predictions.tolist()}, use_single_float=True)
+        raise ValueError(f"Unsupported media type {media_type}, expected one of {COLUMNAR_MEDIA_TYPES}")
+    except Exception as e:
+        raise ShipmentException(e, sys)
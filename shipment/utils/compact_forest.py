@@ -0,0 +1,261 @@
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.constant import COMPACT_FOREST_BLOCK_ROWS, COMPACT_FOREST_PRUNE_SAMPLE_ROWS, FEATURE_DTYPE
+from shipment.utils.main_utils import MainUtils
+
+
+def is_forest(model: object) -> bool:
+    """Whether a model is a forest regressor CompactForest can export."""
+    return isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)) and model.n_outputs_ == 1
+
+
+def round_thresholds_down(thresholds: np.ndarray) -> np.ndarray:
+    """
+    Cast the float64 split thresholds of sklearn trees to float32 without
+    changing any split.
+
+    sklearn casts the features to float32 and sends x left when x <= threshold.
+    The largest float32 not above the threshold keeps every float32 x on the
+    same side, where a rounding to nearest may move the threshold onto a value
+    which used to go right.
+
+    Args:
+        thresholds (np.ndarray): The float64 thresholds.
+
+    Returns:
+        np.ndarray: The float32 thresholds.
+    """
+    rounded = thresholds.astype(np.float32)
+    above = rounded.astype(np.float64) > thresholds
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class CompactForest(RegressorMixin, BaseEstimator):
+    """
+    Serving-only copy of a fitted sklearn forest regressor, with the nodes of all
+    the trees in a few flat arrays: the split feature, the float32 threshold,
+    the global indices of both children, the side of the missing values and the
+    float32 node value. The leaves point to themselves, so every tree is
+    traversed by max_depth vectorised steps over a block of rows. The float32
+    training sample weight of every node is kept for the explanations.
+
+    Predictions match the forest's up to the float32 rounding of the leaf
+    values. The compact forest cannot be trained further.
+
+    Usage:
+        compact_forest = CompactForest.from_forest(forest)
+        preds = compact_forest.predict(X)
+    """
+
+    @classmethod
+    def from_forest(cls, forest: object, tree_indices: List[int] = None) -> "CompactForest":
+        """
+        Export the trees of a fitted forest.
+
+        Args:
+            forest (object): A fitted single output forest regressor, such as RandomForestRegressor.
+            tree_indices (List[int], optional): The trees kept, all of them by default.
+
+        Returns:
+            CompactForest: The compact forest.
+        """
+        try:
+            estimators = forest.estimators_
+            if tree_indices is not None:
+                estimators = [estimators[index] for index in tree_indices]
+
+            features, thresholds, lefts, rights, missing_lefts, values, covers, roots = [], [], [], [], [], [], [], []
+            offset, max_depth = 0, 0
+            for estimator in estimators:
+                tree = estimator.tree_
+                nodes = np.arange(tree.node_count)
+                is_leaf = tree.children_left == -1
+                roots.append(offset)
+                # Leaves loop on themselves, the extra steps of the shallow paths leave them in place
+                lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+                rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+                features.append(np.where(is_leaf, 0, tree.feature))
+                thresholds.append(round_thresholds_down(tree.threshold))
+                missing_left = getattr(tree, "missing_go_to_left", None)
+                missing_lefts.append(
+                    np.zeros(tree.node_count, dtype=bool) if missing_left is None else missing_left.astype(bool)
+                )
+                values.append(tree.value[:, 0, 0])
+                covers.append(tree.weighted_n_node_samples)
+                offset += tree.node_count
+                max_depth = max(max_depth, tree.max_depth)
+
+            compact_forest = cls()
+            compact_forest.n_features_in_ = forest.n_features_in_
+            feature_dtype = np.int16 if forest.n_features_in_ <= np.iinfo(np.int16).max else np.int32
+            compact_forest.feature_ = np.concatenate(features).astype(feature_dtype)
+            compact_forest.threshold_ = np.concatenate(thresholds)
+            compact_forest.left_ = np.concatenate(lefts).astype(np.int32)
+            compact_forest.right_ = np.concatenate(rights).astype(np.int32)
+            compact_forest.missing_go_to_left_ = np.concatenate(missing_lefts)
+            compact_forest.value_ = np.concatenate(values).astype(np.float32)
+            compact_forest.cover_ = np.concatenate(covers).astype(np.float32)
+            compact_forest.roots_ = np.asarray(roots, dtype=np.int32)
+            compact_forest.max_depth_ = int(max_depth)
+            return compact_forest
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots_)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the node arrays."""
+        return sum(
+            array.nbytes for array in (
+                self.feature_, self.threshold_, self.left_, self.right_,
+                self.missing_go_to_left_, self.value_, self.roots_,
+            ) + ((self.cover_,) if hasattr(self, "cover_") else ())
+        )
+
+    def __sklearn_tags__(self):
+        tags = super().__sklearn_tags__()
+        tags.input_tags.sparse = True
+        tags.input_tags.allow_nan = True
+        return tags
+
+    def predict_leaves(self, X: object) -> np.ndarray:
+        """
+        Get the leaf value of every tree for every row.
+
+        Args:
+            X (object): The features, a dense array or a sparse matrix, densified block by block.
+
+        Returns:
+            np.ndarray: The (rows, trees) float32 leaf values.
+        """
+        try:
+            n_rows = X.shape[0]
+            leaf_values = np.empty((n_rows, self.n_trees), dtype=np.float32)
+            for start in range(0, n_rows, COMPACT_FOREST_BLOCK_ROWS):
+                block = X[start:start + COMPACT_FOREST_BLOCK_ROWS]
+                block = block.toarray() if sparse.issparse(block) else np.asarray(block)
+                block = block.astype(FEATURE_DTYPE, copy=False)
+
+                rows = np.arange(len(block))[:, None]
+                nodes = np.broadcast_to(self.roots_, (len(block), self.n_trees)).copy()
+                for _ in range(self.max_depth_):
+                    x = block[rows, self.feature_[nodes]]
+                    go_left = np.where(np.isnan(x), self.missing_go_to_left_[nodes], x <= self.threshold_[nodes])
+                    nodes = np.where(go_left, self.left_[nodes], self.right_[nodes])
+                leaf_values[start:start + len(block)] = self.value_[nodes]
+            return leaf_values
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def predict(self, X: object) -> np.ndarray:
+        """
+        Predict the mean of the trees, like the forest does.
+
+        Args:
+            X (object): The features, a dense array or a sparse matrix.
+
+        Returns:
+            np.ndarray: The predictions.
+        """
+        return self.predict_leaves(X).mean(axis=1, dtype=np.float64)
+
+
+def select_trees(tree_predictions: np.ndarray, tolerance: float) -> List[int]:
+    """
+    Pick the fewest trees whose mean stays within tolerance of the whole forest.
+
+    Trees are added greedily, each time the one bringing the mean of the
+    selected trees closest to the mean of all of them, until the RMS deviation
+    from the forest is at most tolerance times the standard deviation of the
+    forest's predictions. The trees left out are redundant with the others.
+
+    Args:
+        tree_predictions (np.ndarray): The (rows, trees) predictions of every tree on a sample.
+        tolerance (float): The allowed deviation, relative to the spread of the predictions.
+
+    Returns:
+        List[int]: The indices of the selected trees, in selection order.
+    """
+    predictions = np.asarray(tree_predictions, dtype=np.float64).T
+    forest_prediction = predictions.mean(axis=0)
+    max_error = (tolerance * forest_prediction.std()) ** 2
+
+    selected, remaining = [], list(range(len(predictions)))
+    selected_sum = np.zeros_like(forest_prediction)
+    while remaining:
+        candidates = predictions[remaining]
+        errors = (
+            ((selected_sum + candidates) / (len(selected) + 1) - forest_prediction) ** 2
+        ).mean(axis=1)
+        best = int(np.argmin(errors))
+        selected_sum += candidates[best]
+        selected.append(remaining.pop(best))
+        if errors[best] <= max_error:
+            break
+    return selected
+
+
+def compact_forest_with_report(
+        forest: object,
+        X_test: object,
+        y_test: np.ndarray,
+        prune_tolerance: float = 0.0,
+) -> Tuple[CompactForest, Dict]:
+    """
+    Export a forest to a CompactForest, optionally pruned, and measure what it costs.
+
+    Args:
+        forest (object): The fitted forest regressor.
+        X_test (object): The test features, as accepted by the forest.
+        y_test (np.ndarray): The test target.
+        prune_tolerance (float, optional): The deviation allowed by select_trees on the first
+            COMPACT_FOREST_PRUNE_SAMPLE_ROWS test rows, 0 keeps every tree. Defaults to 0.0.
+
+    Returns:
+        Tuple[CompactForest, Dict]: The compact forest and the report of its size and accuracy against the forest.
+    """
+    logging.info("Entered the compact_forest_with_report function.")
+    try:
+        tree_indices = None
+        if prune_tolerance > 0:
+            all_trees = CompactForest.from_forest(forest)
+            tree_indices = sorted(select_trees(
+                all_trees.predict_leaves(X_test[:COMPACT_FOREST_PRUNE_SAMPLE_ROWS]), prune_tolerance
+            ))
+        compact_forest = CompactForest.from_forest(forest, tree_indices)
+
+        forest_preds = forest.predict(X_test)
+        compact_preds = compact_forest.predict(X_test)
+        forest_score = float(MainUtils.get_model_score(y_test, forest_preds))
+        compact_score = float(MainUtils.get_model_score(y_test, compact_preds))
+        node_count = sum(estimator.tree_.node_count for estimator in forest.estimators_)
+        report = {
+            "estimator": type(forest).__name__,
+            "n_trees": len(forest.estimators_),
+            "n_trees_kept": compact_forest.n_trees,
+            "prune_tolerance": float(prune_tolerance),
+            # sklearn stores 64 bytes of node struct and a float64 value per node
+            "forest_node_bytes": int(node_count * (64 + 8)),
+            "compact_node_bytes": int(compact_forest.nbytes),
+            "forest_r2_score": forest_score,
+            "compact_r2_score": compact_score,
+            "r2_score_delta": compact_score - forest_score,
+            "max_abs_prediction_delta": float(np.abs(compact_preds - forest_preds).max(initial=0.0)),
+        }
+        logging.info(f"Exported the forest to a compact forest: {report}")
+        logging.info("Exited the compact_forest_with_report function.")
+        return compact_forest, report
+    except Exception as e:
+        raise ShipmentException(e, sys)
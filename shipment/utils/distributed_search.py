@@ -0,0 +1,367 @@
+"""
+Model selection spread over worker processes, local or on other hosts.
+
+The coordinator serves a TaskBoard through a multiprocessing manager. Each
+search publishes its dataset and cross validation folds once, then one task
+per (candidate, fold). Workers fetch a dataset the first time one of its
+tasks comes up and keep it for the following tasks.
+
+Start a worker on another host with:
+    SEARCH_AUTHKEY=<key> python -m shipment.utils.distributed_search --address <coordinator host>:<port>
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import GridSearchCV, ParameterGrid, check_cv
+
+from shipment.logger import configure_logging, logging
+from shipment.exception import ShipmentException
+from shipment.constant import (
+    SEARCH_AUTHKEY_ENV_KEY,
+    SEARCH_DEFAULT_AUTHKEY,
+    SEARCH_POLL_INTERVAL,
+    SEARCH_WORKER_RECONNECT_INTERVAL,
+)
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def get_search_authkey() -> bytes:
+    """The key of the searches set in the environment, or the default loopback one."""
+    return os.environ.get(SEARCH_AUTHKEY_ENV_KEY, "").encode() or SEARCH_DEFAULT_AUTHKEY
+
+
+class TaskBoard:
+    """
+    Shared state of the searches, living in the coordinator's manager process.
+
+    Tasks are leased to the workers rather than removed: a task whose result
+    has not come back within the lease is handed out again, so a worker lost
+    mid-task only delays the search.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datasets: Dict[str, bytes] = {}
+        self._pending = deque()
+        self._leased: Dict[str, Tuple[Dict, float]] = {}
+        self._results: Dict[str, Dict] = {}
+        self._closed = False
+
+    def add_dataset(self, dataset_id: str, payload: bytes) -> None:
+        with self._lock:
+            self._datasets[dataset_id] = payload
+
+    def get_dataset(self, dataset_id: str) -> bytes:
+        with self._lock:
+            return self._datasets[dataset_id]
+
+    def add_tasks(self, tasks: List[Dict]) -> None:
+        with self._lock:
+            self._pending.extend(tasks)
+
+    def get_task(self) -> Optional[Dict]:
+        with self._lock:
+            while self._pending:
+                task = self._pending.popleft()
+                if task["task_id"] in self._results:
+                    continue
+                self._leased[task["task_id"]] = (task, time.monotonic())
+                return task
+            return None
+
+    def put_result(self, task_id: str, result: Dict) -> None:
+        with self._lock:
+            self._leased.pop(task_id, None)
+            self._results.setdefault(task_id, result)
+
+    def pop_results(self, task_ids: List[str]) -> Dict[str, Dict]:
+        with self._lock:
+            return {task_id: self._results.pop(task_id) for task_id in task_ids if task_id in self._results}
+
+    def requeue_expired(self, lease_seconds: float) -> int:
+        with self._lock:
+            now = time.monotonic()
+            expired = [task_id for task_id, (_, leased_at) in self._leased.items() if now - leased_at > lease_seconds]
+            for task_id in expired:
+                task, _ = self._leased.pop(task_id)
+                self._pending.appendleft(task)
+            return len(expired)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+
+    def is_closed(self) -> bool:
+        with self._lock:
+            return self._closed
+
+
+_task_board = None
+
+
+def _get_task_board() -> TaskBoard:
+    # Called in the manager process, every connection shares the same board
+    global _task_board
+    if _task_board is None:
+        _task_board = TaskBoard()
+    return _task_board
+
+
+class SearchManager(BaseManager):
+    pass
+
+
+SearchManager.register("get_board", callable=_get_task_board)
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def _evaluate(task: Dict, dataset: Tuple) -> Dict:
+    X, y, folds = dataset
+    train_index, test_index = folds[task["fold"]]
+    start = time.perf_counter()
+    try:
+        estimator = clone(pickle.loads(task["estimator"])).set_params(**task["params"])
+        estimator.fit(X[train_index], y[train_index])
+        score = float(estimator.score(X[test_index], y[test_index]))
+    except Exception as e:
+        # Scored like GridSearchCV's default error_score, the search goes on without the candidate
+        logging.warning(f"Task {task['task_id']} with {task['params']} failed: {e}")
+        score = float("nan")
+    return {"score": score, "fit_seconds": time.perf_counter() - start}
+
+
+def run_worker(address: str, authkey: bytes, persistent: bool = False) -> int:
+    """
+    Run tasks of the coordinator at address until the board is closed.
+
+    Args:
+        address (str): The coordinator address, host:port.
+        authkey (bytes): The authentication key of the coordinator.
+        persistent (bool, optional): Whether to wait for the next coordinator when the
+            current one goes away, instead of exiting. Defaults to False.
+
+    Returns:
+        int: The number of tasks run.
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    datasets: Dict[str, Tuple] = {}
+    n_tasks = 0
+    while True:
+        try:
+            manager = SearchManager(address=parse_address(address), authkey=authkey)
+            manager.connect()
+            board = manager.get_board()
+            logging.info(f"Search worker {worker_id} connected to {address}")
+            while not board.is_closed():
+                task = board.get_task()
+                if task is None:
+                    time.sleep(SEARCH_POLL_INTERVAL)
+                    continue
+                if task["dataset_id"] not in datasets:
+                    # Each dataset crosses the network once per worker, the last one is kept
+                    datasets = {task["dataset_id"]: pickle.loads(board.get_dataset(task["dataset_id"]))}
+                result = _evaluate(task, datasets[task["dataset_id"]])
+                board.put_result(task["task_id"], dict(result, worker_id=worker_id))
+                n_tasks += 1
+            if not persistent:
+                return n_tasks
+        except (ConnectionError, EOFError, OSError) as e:
+            if not persistent:
+                return n_tasks
+            logging.debug(f"Search worker {worker_id} waiting for a coordinator at {address}: {e}")
+        time.sleep(SEARCH_WORKER_RECONNECT_INTERVAL)
+
+
+class JoblibSearchBackend:
+    """Exhaustive search of GridSearchCV, parallel on the local machine through joblib."""
+
+    def __init__(self, n_jobs: int = -1, verbose: int = 3):
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+
+    def get_best_params(self, estimator: object, param_grid: Dict, X: object, y: object, cv: int) -> Dict:
+        model_grid = GridSearchCV(estimator, param_grid, verbose=self.verbose, cv=cv, n_jobs=self.n_jobs)
+        model_grid.fit(X, y)
+        return model_grid.best_params_
+
+
+class DistributedSearchBackend:
+    """
+    Exhaustive search run by the workers of a coordinator started for the search.
+
+    The coordinator listens on address. n_local_workers worker processes are
+    started on this machine and exit with the search. Workers started on other
+    hosts with `persistent` join every search run at that address.
+
+    Usage:
+        backend = DistributedSearchBackend(address="0.0.0.0:50000", n_local_workers=2)
+        best_params = backend.get_best_params(estimator, param_grid, X, y, cv=2)
+    """
+
+    def __init__(
+            self,
+            address: str = "127.0.0.1:0",
+            n_local_workers: int = 2,
+            task_timeout: float = 600.0,
+            authkey: Optional[bytes] = None,
+    ):
+        # Read from the environment when the backend is created rather than when the module is imported
+        authkey = authkey or get_search_authkey()
+        host, _ = parse_address(address)
+        if host not in LOOPBACK_HOSTS and authkey == SEARCH_DEFAULT_AUTHKEY:
+            raise ValueError("Set SEARCH_AUTHKEY before serving a search beyond the loopback interface")
+        if n_local_workers < 1 and host in LOOPBACK_HOSTS:
+            raise ValueError("A search on the loopback interface needs at least one local worker")
+        self.address = address
+        self.n_local_workers = n_local_workers
+        self.task_timeout = task_timeout
+        self.authkey = authkey
+
+    def get_best_params(self, estimator: object, param_grid: Dict, X: object, y: object, cv: int) -> Dict:
+        """
+        Score every candidate of param_grid on every fold and return the best one.
+
+        The folds are those of GridSearchCV for a regressor, so both backends
+        select the same parameters for the same scores.
+
+        Args:
+            estimator (object): The unfitted estimator.
+            param_grid (Dict): The parameter grid.
+            X (object): The features.
+            y (object): The target.
+            cv (int): The number of folds.
+
+        Returns:
+            Dict: The parameters with the best mean score.
+        """
+        logging.info("Entered the get_best_params method of DistributedSearchBackend class")
+        try:
+            candidates = list(ParameterGrid(param_grid))
+            folds = list(check_cv(cv, y, classifier=False).split(X, y))
+            payload = pickle.dumps((X, np.asarray(y), folds), protocol=pickle.HIGHEST_PROTOCOL)
+            dataset_id = hashlib.sha1(payload).hexdigest()
+            estimator_payload = pickle.dumps(clone(estimator), protocol=pickle.HIGHEST_PROTOCOL)
+            tasks = [
+                {
+                    "task_id": uuid.uuid4().hex,
+                    "dataset_id": dataset_id,
+                    "estimator": estimator_payload,
+                    "params": params,
+                    "candidate": candidate,
+                    "fold": fold,
+                }
+                for candidate, params in enumerate(candidates)
+                for fold in range(len(folds))
+            ]
+
+            manager = SearchManager(address=parse_address(self.address), authkey=self.authkey)
+            manager.start()
+            workers = []
+            try:
+                board = manager.get_board()
+                board.add_dataset(dataset_id, payload)
+                board.add_tasks(tasks)
+                address = f"{LOOPBACK_HOSTS[0]}:{manager.address[1]}"
+                for _ in range(self.n_local_workers):
+                    workers.append(self._start_local_worker(address))
+                logging.info(
+                    f"Serving {len(tasks)} tasks of {type(estimator).__name__} on port {manager.address[1]} "
+                    f"with {len(workers)} local workers"
+                )
+
+                results = {}
+                task_ids = [task["task_id"] for task in tasks]
+                while len(results) < len(tasks):
+                    time.sleep(SEARCH_POLL_INTERVAL)
+                    results.update(board.pop_results([task_id for task_id in task_ids if task_id not in results]))
+                    n_requeued = board.requeue_expired(self.task_timeout)
+                    if n_requeued:
+                        logging.warning(f"Requeued {n_requeued} tasks not completed within {self.task_timeout}s")
+                    if workers and all(worker.poll() is not None for worker in workers) and self._is_loopback():
+                        raise RuntimeError("All the local search workers exited before the search completed")
+                board.close()
+            finally:
+                for worker in workers:
+                    try:
+                        worker.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        worker.kill()
+                manager.shutdown()
+
+            scores = np.full((len(candidates), len(folds)), np.nan)
+            for task in tasks:
+                scores[task["candidate"], task["fold"]] = results[task["task_id"]]["score"]
+            # A candidate with a failed fold ranks last, as in GridSearchCV
+            mean_scores = np.nan_to_num(scores.mean(axis=1), nan=-np.inf)
+            best_params = candidates[int(np.argmax(mean_scores))]
+            n_workers = len({result["worker_id"] for result in results.values()})
+            logging.info(f"Best parameters {best_params} out of {len(candidates)} candidates, run by {n_workers} workers")
+            logging.info("Exited the get_best_params method of DistributedSearchBackend class")
+            return best_params
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def _start_local_worker(self, address: str) -> subprocess.Popen:
+        # Started like a remote worker rather than forked or spawned, which would
+        # copy or re-import whatever the coordinating process is running
+        package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(
+            os.environ,
+            **{SEARCH_AUTHKEY_ENV_KEY: self.authkey.decode()},
+            PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])),
+        )
+        return subprocess.Popen(
+            [sys.executable, "-m", "shipment.utils.distributed_search", "--address", address, "--once"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+
+    def _is_loopback(self) -> bool:
+        return parse_address(self.address)[0] in LOOPBACK_HOSTS
+
+
+def get_search_backend(search_config: Dict = None) -> object:
+    """
+    Get the model selection backend configured by the search_backend section of config/model.yaml.
+
+    Args:
+        search_config (Dict, optional): The search_backend section. Defaults to None, the joblib backend.
+
+    Returns:
+        object: A backend with a get_best_params(estimator, param_grid, X, y, cv) method.
+    """
+    search_config = dict(search_config or {})
+    name = search_config.pop("name", "joblib")
+    if name == "joblib":
+        return JoblibSearchBackend(**search_config)
+    if name == "distributed":
+        return DistributedSearchBackend(**search_config)
+    raise ValueError(f"Unknown search backend {name}, expected joblib or distributed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", required=True, help="The coordinator address, host:port.")
+    parser.add_argument("--once", action="store_true", help="Exit when the current coordinator goes away.")
+    args = parser.parse_args()
+    configure_logging()
+    n_tasks = run_worker(args.address, get_search_authkey(), persistent=not args.once)
+    print(f"Ran {n_tasks} tasks")
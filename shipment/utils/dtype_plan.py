@@ -0,0 +1,189 @@
+import sys
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.constant import FEATURE_DTYPE
+
+NUMERIC_DTYPES = {"float64", "float32", "int64", "int32"}
+
+
+class DtypePlan:
+    """
+    Memory layout of the training data, compiled from the schema config.
+
+    The drop_columns are never loaded, numerical columns and the target are
+    stored as FEATURE_DTYPE and the remaining string columns, all of low
+    cardinality once the free-text ones are dropped, as pandas categoricals.
+    The same plan is applied to the Mongo chunks and to every CSV artefact
+    read back by the later stages, so the data keeps one layout end to end.
+
+    Usage:
+        dtype_plan = DtypePlan(schema_config)
+        df = dtype_plan.read_csv(file_path)
+    """
+
+    def __init__(self, schema_config: Dict):
+        self.drop_columns: List[str] = list(schema_config.get("drop_columns", []))
+        dropped = set(self.drop_columns)
+
+        self.dtypes: Dict[str, str] = {}
+        for column in schema_config["columns"]:
+            (name, dtype), = column.items()
+            if name in dropped:
+                continue
+            self.dtypes[name] = FEATURE_DTYPE if dtype in NUMERIC_DTYPES else "category"
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.dtypes)
+
+    @property
+    def categorical_columns(self) -> List[str]:
+        return [name for name, dtype in self.dtypes.items() if dtype == "category"]
+
+    @property
+    def projection(self) -> Dict[str, int]:
+        """Mongo projection leaving out _id and the drop_columns."""
+        return {"_id": 0, **{column: 0 for column in self.drop_columns}}
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Drop the unused columns and cast the others to the planned dtypes.
+
+        Args:
+            df (pd.DataFrame): The dataframe to be converted.
+
+        Returns:
+            pd.DataFrame: The converted dataframe, columns missing from df are left out.
+        """
+        try:
+            df = df.drop(columns=[column for column in self.drop_columns if column in df.columns])
+            return df.astype({name: dtype for name, dtype in self.dtypes.items() if name in df.columns})
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def concat(self, chunks: List[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Concatenate chunks converted with `apply`, keeping the categorical dtypes.
+
+        pd.concat turns categoricals with different categories into object
+        columns, so the categories of every chunk are first aligned on their union.
+
+        Args:
+            chunks (List[pd.DataFrame]): The converted chunks.
+
+        Returns:
+            pd.DataFrame: The concatenated dataframe.
+        """
+        try:
+            if len(chunks) > 1:
+                for column in self.categorical_columns:
+                    if column not in chunks[0].columns:
+                        continue
+                    categories = pd.api.types.union_categoricals(
+                        [chunk[column] for chunk in chunks], ignore_order=True
+                    ).categories
+                    for chunk in chunks:
+                        chunk[column] = chunk[column].cat.set_categories(categories)
+            return pd.concat(chunks, ignore_index=True)
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def read_csv(self, file_path: str) -> pd.DataFrame:
+        """
+        Read a CSV artefact straight into the planned dtypes, without the drop_columns.
+
+        Args:
+            file_path (str): The CSV file.
+
+        Returns:
+            pd.DataFrame: The dataframe.
+        """
+        try:
+            header = pd.read_csv(file_path, nrows=0).columns
+            return pd.read_csv(
+                file_path,
+                usecols=[column for column in header if column not in self.drop_columns],
+                dtype={name: dtype for name, dtype in self.dtypes.items() if name in header},
+            )
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def read_csv_chunks(self, file_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Read a CSV artefact chunk by chunk, with the planned dtypes.
+
+        The categories of a categorical column are those found in each chunk,
+        they differ from one chunk to the other.
+
+        Args:
+            file_path (str): The CSV file.
+            chunk_size (int): The number of rows per chunk.
+
+        Yields:
+            pd.DataFrame: The chunks.
+        """
+        try:
+            header = pd.read_csv(file_path, nrows=0).columns
+            yield from pd.read_csv(
+                file_path,
+                usecols=[column for column in header if column not in self.drop_columns],
+                dtype={name: dtype for name, dtype in self.dtypes.items() if name in header},
+                chunksize=chunk_size,
+            )
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def sample_csv(self, file_path: str, n_samples: int, chunk_size: int, random_state: int = 0) -> pd.DataFrame:
+        """
+        Read a uniform random sample of a CSV artefact chunk by chunk, with the planned dtypes.
+
+        Every chunk keeps the same share of its rows, so the sample spreads over
+        the whole file rather than its first rows.
+
+        Args:
+            file_path (str): The CSV file.
+            n_samples (int): The number of rows sampled, the whole file when it has fewer.
+            chunk_size (int): The number of rows read at a time.
+            random_state (int, optional): The seed of the first chunk, incremented per chunk. Defaults to 0.
+
+        Returns:
+            pd.DataFrame: The sampled rows.
+        """
+        try:
+            with open(file_path) as csv_file:
+                n_rows = sum(1 for _ in csv_file) - 1
+            fraction = min(1.0, n_samples / max(n_rows, 1))
+            samples = [
+                chunk.sample(frac=fraction, random_state=random_state + index)
+                for index, chunk in enumerate(self.read_csv_chunks(file_path, chunk_size))
+            ]
+            return self.concat(samples) if samples else self.read_csv(file_path)
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+
+def log_memory_usage(name: str, data: object) -> int:
+    """
+    Log the memory held by a dataframe or an array.
+
+    Args:
+        name (str): The name used in the log record.
+        data (object): A pandas DataFrame, a numpy array or a scipy sparse matrix.
+
+    Returns:
+        int: The number of bytes, object columns included.
+    """
+    if isinstance(data, pd.DataFrame):
+        n_bytes = int(data.memory_usage(deep=True).sum())
+    elif sparse.issparse(data):
+        n_bytes = int(data.data.nbytes + data.indices.nbytes + data.indptr.nbytes)
+    else:
+        n_bytes = int(np.asarray(data).nbytes)
+    logging.info(f"{name} holds {n_bytes / 2 ** 20:.1f} MiB")
+    return n_bytes
@@ -0,0 +1,299 @@
+import sys
+import threading
+from collections import OrderedDict
+from math import factorial
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.constant import EXPLAIN_BLOCK_ELEMENTS, EXPLAIN_CACHE_SIZE, FEATURE_DTYPE, SHIPPING_DATA_FIELDS
+from shipment.monitoring.metrics import EXPLAIN_CACHE_REQUESTS
+from shipment.utils.compact_forest import CompactForest, is_forest
+from shipment.utils.onnx_export import get_column_tables
+from shipment.utils.sparse_matrix import estimator_input
+from shipment.utils.template_encoder import TemplateEncoder
+
+
+class ForestTreeShap:
+    """
+    Path dependent TreeSHAP values of a forest, vectorised over all the root to
+    leaf paths of its trees.
+
+    Each path is reduced to its distinct split features. A feature has a zero
+    fraction, the share of the training samples its splits send down the path,
+    and a one fraction, whether the row satisfies all its splits. The SHAP value
+    of a feature on the path is the leaf value times (one - zero) times the
+    Shapley weighted sum of the products of the fractions of the other features,
+    read from the coefficients of the polynomial prod(zero + one * t). The paths
+    are padded to the forest depth with features of fractions one, null players
+    which leave the values of the others unchanged.
+
+    Usage:
+        tree_shap = ForestTreeShap(CompactForest.from_forest(forest))
+        contributions, expected_value = tree_shap.shap_values(X)
+    """
+
+    def __init__(self, compact_forest: CompactForest):
+        try:
+            if not hasattr(compact_forest, "cover_"):
+                raise TypeError("The compact forest was exported without its node covers")
+            self.forest = compact_forest
+            self.depth = max(compact_forest.max_depth_, 1)
+            self.build_paths()
+            # Shapley weight of a subset of s other features among the depth features of a path
+            self.weights = np.array(
+                [factorial(s) * factorial(self.depth - s - 1) / factorial(self.depth) for s in range(self.depth)]
+            )
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def build_paths(self) -> None:
+        forest, depth = self.forest, self.depth
+        edge_nodes, edge_lefts, edge_slots, path_lengths = [], [], [], []
+        slot_features, slot_zeros, leaf_values = [], [], []
+        for root in forest.roots_:
+            stack = [(int(root), [])]
+            while stack:
+                node, path = stack.pop()
+                if forest.left_[node] != node:
+                    stack.append((int(forest.left_[node]), path + [(node, True)]))
+                    stack.append((int(forest.right_[node]), path + [(node, False)]))
+                    continue
+
+                # The splits on a same feature share its slot, their fractions multiply
+                features, zeros, slots = [], [], []
+                children = [parent for parent, _ in path[1:]] + [node]
+                for (parent, _), child in zip(path, children):
+                    feature = int(forest.feature_[parent])
+                    if feature not in features:
+                        features.append(feature)
+                        zeros.append(1.0)
+                    slot = features.index(feature)
+                    zeros[slot] *= float(forest.cover_[child]) / float(forest.cover_[parent])
+                    slots.append(slot)
+                padding = depth - len(path)
+                edge_nodes.append([parent for parent, _ in path] + [0] * padding)
+                edge_lefts.append([went_left for _, went_left in path] + [True] * padding)
+                edge_slots.append(slots + [0] * padding)
+                path_lengths.append(len(path))
+                slot_features.append(features + [0] * (depth - len(features)))
+                slot_zeros.append(zeros + [1.0] * (depth - len(features)))
+                leaf_values.append(float(forest.value_[node]))
+
+        # Stored slot major, (depth, leaves), the leaves are the contiguous axis of the blocks
+        self.edge_nodes = np.asarray(edge_nodes, dtype=np.intp).T.copy()
+        self.edge_lefts = np.asarray(edge_lefts, dtype=bool).T.copy()
+        self.edge_slots = np.asarray(edge_slots, dtype=np.intp).T.copy()
+        self.edge_valid = np.arange(depth).reshape(-1, 1) < np.asarray(path_lengths)
+        self.slot_zeros = np.asarray(slot_zeros, dtype=np.float64).T.copy()
+        self.leaf_values = np.asarray(leaf_values, dtype=np.float64)
+        n_slots = self.slot_zeros.size
+        # Sums the (slot, leaf) contributions into the features
+        self.slot_to_feature = sparse.csr_matrix(
+            (np.ones(n_slots), (np.arange(n_slots), np.asarray(slot_features).T.ravel())),
+            shape=(n_slots, forest.n_features_in_),
+        )
+        self.expected_value = float((self.leaf_values * self.slot_zeros.prod(axis=0)).sum() / forest.n_trees)
+        self.block_rows = max(1, EXPLAIN_BLOCK_ELEMENTS // n_slots)
+
+    def one_fractions(self, X: np.ndarray) -> np.ndarray:
+        forest = self.forest
+        x = X[:, forest.feature_[self.edge_nodes]]
+        went_left = np.where(
+            np.isnan(x), forest.missing_go_to_left_[self.edge_nodes], x <= forest.threshold_[self.edge_nodes]
+        )
+        failed = (went_left != self.edge_lefts) & self.edge_valid
+        failures = np.zeros(failed.shape, dtype=np.int16)
+        leaves = np.arange(failed.shape[2])
+        for edge in range(self.depth):
+            failures[:, self.edge_slots[edge], leaves] += failed[:, edge]
+        return (failures == 0).astype(np.float64)
+
+    def shap_block(self, X: np.ndarray) -> np.ndarray:
+        depth, weights, zeros = self.depth, self.weights, self.slot_zeros
+        ones = self.one_fractions(X)
+
+        # Coefficients of prod over the slots of (zero + one * t), by power
+        coefficients = np.zeros((len(X), depth + 1, len(self.leaf_values)))
+        coefficients[:, 0] = 1.0
+        for slot in range(depth):
+            shifted = ones[:, slot, None] * coefficients[:, :slot + 1]
+            coefficients[:, :slot + 2] *= zeros[slot]
+            coefficients[:, 1:slot + 2] += shifted
+        weighted_all = np.einsum("s,nsl->nl", weights, coefficients[:, :depth])
+
+        contributions = np.empty(ones.shape)
+        scratch = np.empty(ones.shape[::2])
+        for slot in range(depth):
+            zero, one = zeros[slot], ones[:, slot]
+            # Dividing out the slot's factor: by its zero fraction when the row fails its
+            # splits, by (zero + t) with a synthetic division when it satisfies them
+            quotient = coefficients[:, depth].copy()
+            weighted_satisfied = weights[depth - 1] * quotient
+            for power in range(depth - 1, 0, -1):
+                quotient *= -zero
+                quotient += coefficients[:, power]
+                weighted_satisfied += np.multiply(quotient, weights[power - 1], out=scratch)
+            weighted = np.where(one > 0, weighted_satisfied, weighted_all / zero)
+            contributions[:, slot] = self.leaf_values * (one - zero) * weighted
+
+        return np.asarray(contributions.reshape(len(X), -1) @ self.slot_to_feature) / self.forest.n_trees
+
+    def shap_values(self, X: object) -> Tuple[np.ndarray, float]:
+        """
+        Get the SHAP values of the rows, in blocks of block_rows.
+
+        Args:
+            X (object): The encoded features, a dense array or a sparse matrix.
+
+        Returns:
+            Tuple[np.ndarray, float]: The (rows, features) SHAP values and the expected value,
+                which sum to the prediction of the forest.
+        """
+        try:
+            values = np.empty((X.shape[0], self.forest.n_features_in_))
+            for start in range(0, X.shape[0], self.block_rows):
+                block = X[start:start + self.block_rows]
+                block = block.toarray() if sparse.issparse(block) else np.asarray(block)
+                values[start:start + len(block)] = self.shap_block(block.astype(FEATURE_DTYPE, copy=False))
+            return values, self.expected_value
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+
+def get_contributions(estimator: object, X: object, tree_shap: ForestTreeShap = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the SHAP values of an estimator on encoded features, with the native
+    implementation of XGBoost, LightGBM and CatBoost, or ForestTreeShap for the forests.
+
+    Args:
+        estimator (object): The fitted estimator.
+        X (object): The encoded features.
+        tree_shap (ForestTreeShap, optional): The TreeSHAP of the forest, when the estimator is one.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (rows, features) contributions and the base value of every row.
+    """
+    package = type(estimator).__module__.split(".")[0]
+    if tree_shap is not None:
+        contributions, expected_value = tree_shap.shap_values(X)
+        return contributions, np.full(X.shape[0], expected_value)
+    if package == "xgboost":
+        import xgboost
+
+        booster = estimator.get_booster() if hasattr(estimator, "get_booster") else estimator
+        values = booster.predict(xgboost.DMatrix(estimator_input(estimator, X)), pred_contribs=True)
+    elif package == "lightgbm":
+        values = estimator.predict(estimator_input(estimator, X), pred_contrib=True)
+    elif package == "catboost":
+        from catboost import Pool
+
+        values = estimator.get_feature_importance(Pool(estimator_input(estimator, X)), type="ShapValues")
+    else:
+        raise TypeError(f"No SHAP values for {type(estimator).__name__}")
+    values = values.toarray() if sparse.issparse(values) else np.asarray(values, dtype=np.float64)
+    return values[:, :-1], values[:, -1]
+
+
+class CostExplainer:
+    """
+    Explanations of the predictions of a CostModel: the SHAP value of every
+    ShippingData field, the sum of the values of the features it is encoded into,
+    and the base value they add up from. The explanations are cached per model
+    version and input row.
+
+    Usage:
+        explainer = CostExplainer(cost_model, model_version)
+        explanations = explainer.explain(df)
+    """
+
+    def __init__(self, cost_model: object, model_version: str = None, cache_size: int = EXPLAIN_CACHE_SIZE):
+        try:
+            preprocessor = cost_model.preprocessing_object
+            if not TemplateEncoder.supports(preprocessor):
+                raise TypeError("The preprocessor layout is not supported by the explanations")
+            self.cost_model = cost_model
+            self.model_version = model_version
+            self.estimator = cost_model.trained_model_object
+            self.tree_shap = None
+            if is_forest(self.estimator):
+                self.tree_shap = ForestTreeShap(CompactForest.from_forest(self.estimator))
+            elif isinstance(self.estimator, CompactForest):
+                self.tree_shap = ForestTreeShap(self.estimator)
+
+            # The field of every encoded feature, as a (features, fields) summing matrix
+            self.fields = list(SHIPPING_DATA_FIELDS)
+            field_index = {column: index for index, column in enumerate(SHIPPING_DATA_FIELDS.values())}
+            n_features = len(preprocessor.get_feature_names_out())
+            feature_fields = np.empty(n_features, dtype=np.intp)
+            categorical_columns, tables = get_column_tables(preprocessor)
+            for column in categorical_columns:
+                feature_fields[tables[column][1]] = field_index[column]
+            numerical_columns, numerical_positions, _, _ = TemplateEncoder.get_numerical_layout(preprocessor)
+            feature_fields[numerical_positions] = [field_index[column] for column in numerical_columns]
+            self.feature_to_field = sparse.csr_matrix(
+                (np.ones(n_features), (np.arange(n_features), feature_fields)), shape=(n_features, len(self.fields))
+            )
+
+            self.cache_size = cache_size
+            self._cache: OrderedDict = OrderedDict()
+            self._lock = threading.Lock()
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def get_cache_key(self, row: tuple) -> tuple:
+        # Every missing value shares the key None, NaN is not equal to itself
+        return (self.model_version,) + tuple(TemplateEncoder.normalise(value) for value in row)
+
+    def explain(self, X: pd.DataFrame, transform: Callable = None) -> List[Dict]:
+        """
+        Explain the predictions of the rows, computing the rows missing from the cache together.
+
+        Args:
+            X (pd.DataFrame): The rows, with the columns of ShippingData.get_input_data_frame.
+            transform (Callable, optional): Encodes the rows missing from the cache, such as
+                TemplateEncoder.transform, the preprocessor by default.
+
+        Returns:
+            List[Dict]: Per row, the prediction, the base value and the contribution of every field.
+        """
+        try:
+            keys = [
+                self.get_cache_key(row)
+                for row in zip(*[X[column].to_numpy() for column in SHIPPING_DATA_FIELDS.values()])
+            ]
+            with self._lock:
+                explanations = [self._cache.get(key) for key in keys]
+                for key, explanation in zip(keys, explanations):
+                    if explanation is not None:
+                        self._cache.move_to_end(key)
+            missing = [index for index, explanation in enumerate(explanations) if explanation is None]
+            EXPLAIN_CACHE_REQUESTS.labels(result="hit").inc(len(keys) - len(missing))
+            EXPLAIN_CACHE_REQUESTS.labels(result="miss").inc(len(missing))
+            if not missing:
+                return explanations
+
+            transform = transform or self.cost_model.preprocessing_object.transform
+            transformed_feature = transform(X.iloc[missing])
+            contributions, base_values = get_contributions(self.estimator, transformed_feature, self.tree_shap)
+            field_contributions = np.asarray((self.feature_to_field.T @ contributions.T).T)
+
+            with self._lock:
+                for position, index in enumerate(missing):
+                    explanation = {
+                        "prediction": float(base_values[position] + field_contributions[position].sum()),
+                        "base_value": float(base_values[position]),
+                        "contributions": dict(zip(self.fields, field_contributions[position].tolist())),
+                    }
+                    explanations[index] = explanation
+                    self._cache[keys[index]] = explanation
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            logging.debug(f"Explained {len(missing)} rows, {len(keys) - len(missing)} found in the cache")
+            return explanations
+        except Exception as e:
+            raise ShipmentException(e, sys)
@@ -1,23 +1,26 @@
+import copy
+import os
 import shutil
 import sys
-from typing import Dict, Tuple, List
+from typing import Dict, Iterator, Tuple, List
 import dill
 import pandas as pd
 import numpy as np
 import yaml
+from scipy import sparse
 from yaml import safe_dump
 
-
-import xgboost
-from sklearn.metrics import r2_score
-from sklearn.model_selection import GridSearchCV
-from sklearn.utils import all_estimators
-
 from shipment.logger import logging
 from shipment.constant import *
 from shipment.exception import ShipmentException
+from shipment.utils.model_registry import get_model_spec, register_models_from_config
+from shipment.utils.array_artefact import list_array_artefact_parts, load_array_artefact, save_array_artefact
+from shipment.utils.sparse_matrix import estimator_input
 
 class MainUtils:
+    # Parsed yaml files by path, with the modification time and size they were read at
+    _yaml_cache: Dict[str, Tuple[int, int, Dict]] = {}
+
     def read_yaml_file(self, filename: str) -> Dict:
         logging.info("Entered the read_yaml_file method of MainUtils class.")
         try:
@@ -28,6 +31,26 @@ class MainUtils:
         except Exception as e:
             raise ShipmentException(e, sys)
         
+    def read_yaml_file_cached(self, filename: str) -> Dict:
+        """
+        Read a yaml file, parsed again only when it changed on disk.
+
+        Args:
+            filename (str): The yaml file.
+
+        Returns:
+            Dict: A copy of the data, free to be modified by the caller.
+        """
+        try:
+            stat = os.stat(filename)
+            cached = MainUtils._yaml_cache.get(filename)
+            if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+                cached = (stat.st_mtime_ns, stat.st_size, self.read_yaml_file(filename))
+                MainUtils._yaml_cache[filename] = cached
+            return copy.deepcopy(cached[2])
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
     def write_json_to_yaml(self, json_file: Dict,  yaml_file_path: str) -> yaml:
         logging.info("Entered the write_json_to_yaml method of MainUtils class.")
         try:
@@ -37,27 +60,95 @@ class MainUtils:
         except Exception as e:
             raise ShipmentException(e, sys)
         
-    def save_numpy_array_data(self, file_path: str, array: np.array) -> None:
-        logging.info("Entered the save_numpy_array_data method of MainUtils class.")
+    def save_sparse_matrix_data(
+            self,
+            file_path: str,
+            features: sparse.csr_matrix,
+            target: np.array,
+            feature_names: List[str] = None,
+            target_name: str = None,
+            compress: bool = False,
+    ) -> str:
+        """
+        Save a CSR feature matrix and its target vector as an array artefact.
+
+        The header keeps the names of the feature columns and of the target, so
+        the file describes itself without the fitted preprocessor.
+
+        Args:
+            file_path (str): The artefact file.
+            features (sparse.csr_matrix): The features.
+            target (np.array): The target, one value per row of features.
+            feature_names (List[str], optional): The names of the feature columns. Defaults to None.
+            target_name (str, optional): The name of the target. Defaults to None.
+            compress (bool, optional): Whether to compress the arrays, see save_array_artefact. Defaults to False.
+
+        Returns:
+            str: The file path.
+        """
+        logging.info("Entered the save_sparse_matrix_data method of MainUtils class.")
         try:
-            with open(file_path, "wb") as file_obj:
-                np.save(file_obj, array)
-            logging.info(f"Successfully saved the numpy array data to {file_path}")
+            save_array_artefact(
+                file_path,
+                arrays={
+                    "data": features.data,
+                    "indices": features.indices,
+                    "indptr": features.indptr,
+                    "target": target,
+                },
+                metadata={
+                    "format": "csr",
+                    "shape": list(features.shape),
+                    "feature_names": None if feature_names is None else [str(name) for name in feature_names],
+                    "target_name": target_name,
+                },
+                compress=compress,
+            )
+            logging.info(f"Successfully saved the sparse matrix data to {file_path}")
             return file_path
         except Exception as e:
             raise ShipmentException(e, sys)
-        
-    def load_numpy_array_data(self, file_path: str) -> np.array:
-        logging.info("Entered the load_numpy_array_data method of MainUtils class.")
+
+    def load_sparse_matrix_data(self, file_path: str, mmap: bool = True) -> Tuple[sparse.csr_matrix, np.array]:
+        """
+        Load the features and the target saved by save_sparse_matrix_data.
+
+        Args:
+            file_path (str): The artefact file.
+            mmap (bool, optional): Whether to map the file instead of reading it,
+                the arrays are then read only views of the file. Defaults to True.
+
+        Returns:
+            Tuple[sparse.csr_matrix, np.array]: The features and the target.
+        """
+        logging.info("Entered the load_sparse_matrix_data method of MainUtils class.")
         try:
-            with open(file_path, "rb") as file_obj:
-                array = np.load(file_obj, allow_pickle=True)
-            logging.info(f"Successfully loaded the numpy array data from {file_path}")
-            return array
+            arrays, metadata = load_array_artefact(file_path, mmap=mmap)
+            features = sparse.csr_matrix(
+                (arrays["data"], arrays["indices"], arrays["indptr"]),
+                shape=tuple(metadata["shape"]),
+                copy=False,
+            )
+            logging.info(f"Successfully loaded the sparse matrix data from {file_path}")
+            return features, arrays["target"]
         except Exception as e:
             raise ShipmentException(e, sys)
-            
-        
+
+    def iter_sparse_matrix_data(self, path: str, mmap: bool = True) -> Iterator[Tuple[sparse.csr_matrix, np.array]]:
+        """
+        Iterate over the chunks of sparse matrix data, saved in one file or in a
+        directory of files written chunk by chunk.
+
+        Args:
+            path (str): The artefact file or directory.
+            mmap (bool, optional): Whether to map the files instead of reading them. Defaults to True.
+
+        Yields:
+            Tuple[sparse.csr_matrix, np.array]: The features and the target of each chunk.
+        """
+        for file_path in list_array_artefact_parts(path):
+            yield self.load_sparse_matrix_data(file_path, mmap=mmap)
+
     def get_tuned_model(
             self,
             model_name: str,
@@ -68,8 +159,13 @@ class MainUtils:
     ) -> Tuple[float, object, str]:
         logging.info("Entered the get_tuned_model method of MainUtils class")
         try:
-            model = self.get_base_model(model_name)
-            model_best_params = self.get_model_params(model, train_x, train_y)
+            model_config = self.read_yaml_file_cached(MODEL_CONFIG_FILE)
+            register_models_from_config(model_config)
+            model = self.get_base_model(model_name, model_config.get("model_threads"))
+            # CSR features are passed as they are to the estimators reading sparse input
+            train_x = estimator_input(model, train_x)
+            test_x = estimator_input(model, test_x)
+            model_best_params = self.get_model_params(model, train_x, train_y, model_name)
             model.set_params(**model_best_params)
             model.fit(train_x, train_y)
             preds = model.predict(test_x)
@@ -83,6 +179,8 @@ class MainUtils:
     def get_model_score(test_y: pd.DataFrame, preds: pd.DataFrame) -> float:
         logging.info("Entered the get_model_score method of MainUtils class")
         try:
+            from sklearn.metrics import r2_score
+
             model_score = r2_score(test_y, preds)
             logging.info(f"Model score: r2_score is {model_score}")
             logging.info("Exited the get_model_score method of MainUntils class")
@@ -91,14 +189,11 @@ class MainUtils:
             raise ShipmentException(e, sys)
         
     @staticmethod
-    def get_base_model(model_name: str) -> object:
+    def get_base_model(model_name: str, n_threads: int = None) -> object:
         logging.info("Entered the get_base_model method of MainUtils class")
         try:
-            if model_name.lower().startswith("xgb") is True:
-                model = xgboost.__dict__[model_name]()
-            else:
-                model_idx = [model[0] for model in all_estimators()].index(model_name)
-                model = all_estimators().__getitem__(model_idx)[1]()
+            # The estimator package is imported on first use, see shipment/utils/model_registry.py
+            model = get_model_spec(model_name).create(n_threads=n_threads)
             logging.info(f"Successfully loaded the {model_name} model.")
             logging.info("Exited the get_base_model method of MainUtils class")
             return model
@@ -106,27 +201,25 @@ class MainUtils:
             raise ShipmentException(e, sys)
         
     
-    def get_model_params(self, model: object, X_train: pd.DataFrame, y_train: pd.DataFrame) -> Dict:
+    def get_model_params(
+            self, model: object, X_train: pd.DataFrame, y_train: pd.DataFrame, model_name: str = None
+    ) -> Dict:
         logging.info("Entered the get_model_params method of MainUtils class")
         try:
-            VERBOSE = 3
             CV = 2
-            N_JOBD = -1
 
-            model_name = model.__class__.__name__
-            model_config = self.read_yaml_file(filename=MODEL_CONFIG_FILE)
-            model_param_grid = model_config["train_model"][model_name]
-            model_grid = GridSearchCV(
-                model,
-                model_param_grid,
-                verbose=VERBOSE,
-                cv=CV,                
-                n_jobs=N_JOBD,
-            )
-            model_grid.fit(X_train, y_train)
+            model_name = model_name or model.__class__.__name__
+            model_config = self.read_yaml_file_cached(MODEL_CONFIG_FILE)
+            # The grid of model.yaml, or the search space of the registry when the entry is empty
+            model_param_grid = model_config["train_model"][model_name] or get_model_spec(model_name).search_space
+            # GridSearchCV on this machine by default, or the workers of a distributed search
+            from shipment.utils.distributed_search import get_search_backend
+
+            search_backend = get_search_backend(model_config.get("search_backend"))
+            best_params = search_backend.get_best_params(model, model_param_grid, X_train, y_train, cv=CV)
             logging.info(f"Successfully tuned the {model.__class__.__name__} model.")
             logging.info("Exited the get_model_params method of MainUtils class")
-            return model_grid.best_params_
+            return best_params
         except Exception as e:
             raise ShipmentException(e, sys)
         
@@ -0,0 +1,121 @@
+import importlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """
+    How to build an estimator named in config/model.yaml.
+
+    Attributes:
+        import_path (str): "module:ClassName", imported on first use only.
+        default_params (Dict): Parameters set on every instance, overridden by the tuned ones.
+        thread_param (Optional[str]): The parameter setting the number of threads, if any.
+        search_space (Dict[str, List]): Grid searched when the model.yaml entry gives none.
+    """
+    import_path: str
+    default_params: Dict = field(default_factory=dict)
+    thread_param: Optional[str] = None
+    search_space: Dict[str, List] = field(default_factory=dict)
+
+    def load_class(self) -> type:
+        module_name, _, class_name = self.import_path.partition(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def create(self, n_threads: int = None, **params) -> object:
+        """
+        Build an estimator.
+
+        Args:
+            n_threads (int, optional): The threads of the estimator, its library default when None.
+            **params: Parameters overriding the default ones.
+
+        Returns:
+            object: The estimator.
+        """
+        params = {**self.default_params, **params}
+        if n_threads is not None and self.thread_param is not None:
+            params[self.thread_param] = n_threads
+        return self.load_class()(**params)
+
+
+MODEL_REGISTRY: Dict[str, ModelSpec] = {
+    "RandomForestRegressor": ModelSpec(
+        import_path="sklearn.ensemble:RandomForestRegressor",
+        thread_param="n_jobs",
+        search_space={"max_depth": [5, 8], "max_features": [5, 7], "n_estimators": [50, 100, 150]},
+    ),
+    "ExtraTreesRegressor": ModelSpec(
+        import_path="sklearn.ensemble:ExtraTreesRegressor",
+        thread_param="n_jobs",
+        search_space={"max_depth": [5, 8], "max_features": [5, 7], "n_estimators": [50, 100, 150]},
+    ),
+    "GradientBoostingRegressor": ModelSpec(
+        import_path="sklearn.ensemble:GradientBoostingRegressor",
+        search_space={"learning_rate": [0.05, 0.1], "max_depth": [3, 5], "n_estimators": [100, 200]},
+    ),
+    "HistGradientBoostingRegressor": ModelSpec(
+        import_path="sklearn.ensemble:HistGradientBoostingRegressor",
+        search_space={"learning_rate": [0.05, 0.1], "max_depth": [None, 8], "max_iter": [100, 200]},
+    ),
+    "XGBRegressor": ModelSpec(
+        import_path="xgboost:XGBRegressor",
+        thread_param="n_jobs",
+        search_space={"learning_rate": [0.01, 0.1], "max_depth": [5, 6, 8], "n_estimators": [100, 200]},
+    ),
+    "CatBoostRegressor": ModelSpec(
+        import_path="catboost:CatBoostRegressor",
+        # No per-iteration output and no catboost_info directory in the working directory
+        default_params={"verbose": 0, "allow_writing_files": False},
+        thread_param="thread_count",
+        search_space={"depth": [6, 8], "learning_rate": [0.05, 0.1], "iterations": [500]},
+    ),
+    "LGBMRegressor": ModelSpec(
+        import_path="lightgbm:LGBMRegressor",
+        default_params={"verbose": -1},
+        thread_param="n_jobs",
+        search_space={"learning_rate": [0.05, 0.1], "num_leaves": [31, 63], "n_estimators": [100, 200]},
+    ),
+}
+
+
+def register_model(name: str, spec: ModelSpec) -> None:
+    """
+    Add an estimator to the registry, or replace the one of the same name.
+
+    Args:
+        name (str): The name used in the train_model section of config/model.yaml.
+        spec (ModelSpec): How to build it.
+    """
+    MODEL_REGISTRY[name] = spec
+
+
+def register_models_from_config(model_config: Dict) -> None:
+    """
+    Register the estimators of the model_registry section of config/model.yaml,
+    each one given by the fields of ModelSpec.
+
+    Args:
+        model_config (Dict): The model config.
+    """
+    for name, entry in (model_config.get("model_registry") or {}).items():
+        register_model(name, ModelSpec(**entry))
+
+
+def get_model_spec(name: str) -> ModelSpec:
+    """
+    Get the registry entry of an estimator.
+
+    Args:
+        name (str): The estimator name.
+
+    Returns:
+        ModelSpec: Its registry entry.
+    """
+    if name not in MODEL_REGISTRY:
+        raise KeyError(
+            f"Unknown model {name}, expected one of {sorted(MODEL_REGISTRY)} "
+            f"or an entry of the model_registry section of config/model.yaml"
+        )
+    return MODEL_REGISTRY[name]
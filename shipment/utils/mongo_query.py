@@ -0,0 +1,126 @@
+import sys
+from datetime import date, datetime, timezone
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from shipment.exception import ShipmentException
+
+# Operators accepted in the filters of the data_ingestion config, anything else such as
+# $where or $expr would run code or skip the indexes on the server
+FILTER_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$exists")
+# Operators selecting exact values, their fields lead the supporting index
+EQUALITY_OPERATORS = ("$eq", "$in")
+
+
+def to_bson_value(value: object) -> object:
+    # YAML reads 2017-01-01 as a date, which BSON cannot encode, and the collection stores datetimes
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, list):
+        return [to_bson_value(item) for item in value]
+    return value
+
+
+def get_window_bounds(window: Dict, now: datetime = None) -> Tuple[datetime, datetime]:
+    """
+    Get the dates of a training window: the last `months` months up to `end`.
+
+    Args:
+        window (Dict): The window section of the data_ingestion config, with date_column,
+            months and end, a date or None for now.
+        now (datetime, optional): The current time. Defaults to the UTC time.
+
+    Returns:
+        Tuple[datetime, datetime]: The first date included and the first date excluded, in UTC
+            without a timezone, as pymongo reads and writes them.
+    """
+    end = window.get("end")
+    if end is None:
+        end = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    end = pd.Timestamp(end)
+    start = end - pd.DateOffset(months=int(window["months"]))
+    return start.to_pydatetime(), end.to_pydatetime()
+
+
+def get_filter_condition(column: str, condition: object) -> Dict:
+    # A scalar is an equality, a list a $in, a mapping a set of comparison operators
+    if isinstance(condition, dict):
+        unknown = [operator for operator in condition if operator not in FILTER_OPERATORS]
+        if unknown:
+            raise ValueError(f"Unsupported operators {unknown} in the filter of {column}, expected {FILTER_OPERATORS}")
+        return {operator: to_bson_value(value) for operator, value in condition.items()}
+    if isinstance(condition, list):
+        return {"$in": to_bson_value(condition)}
+    return {"$eq": to_bson_value(condition)}
+
+
+def build_ingestion_query(ingestion_config: Dict, now: datetime = None) -> Dict:
+    """
+    Build the Mongo query of the documents pulled for training from the data_ingestion
+    config: the window on its date column and the filters, by column.
+
+    Args:
+        ingestion_config (Dict): The data_ingestion section of the model config file.
+        now (datetime, optional): The current time, the end of a window without one.
+
+    Returns:
+        Dict: The query, empty when the whole collection is pulled.
+    """
+    try:
+        query = {}
+        window = ingestion_config.get("window") or {}
+        if window.get("date_column") and window.get("months"):
+            # First of the range fields, the window bounds the index scan
+            start, end = get_window_bounds(window, now)
+            query[window["date_column"]] = {"$gte": start, "$lt": end}
+        for column, condition in (ingestion_config.get("filters") or {}).items():
+            condition = get_filter_condition(column, condition)
+            overlap = [operator for operator in condition if operator in query.get(column, {})]
+            if overlap:
+                raise ValueError(f"The filter of {column} sets {overlap}, already set by the window")
+            query.setdefault(column, {}).update(condition)
+        return query
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def get_index_keys(query: Dict) -> List[Tuple[str, int]]:
+    """
+    Get the keys of the compound index supporting a query: the fields matched on exact
+    values first, then those matched on ranges, so the index bounds narrow the scan to the
+    documents returned.
+
+    Args:
+        query (Dict): A query of build_ingestion_query.
+
+    Returns:
+        List[Tuple[str, int]]: The ascending index keys.
+    """
+    equality = [column for column, condition in query.items() if set(condition) <= set(EQUALITY_OPERATORS)]
+    ranges = [column for column in query if column not in equality]
+    return [(column, 1) for column in equality + ranges]
+
+
+def get_plan_stages(explain: Dict) -> List[str]:
+    """
+    Get the stages of the winning plan of an explain command, such as IXSCAN or COLLSCAN.
+
+    Args:
+        explain (Dict): The output of the explain command, in queryPlanner verbosity.
+
+    Returns:
+        List[str]: The stages, from the root of the plan to its leaves.
+    """
+    stages = []
+    nodes = [explain["queryPlanner"]["winningPlan"]]
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, list):
+            nodes.extend(node)
+        elif isinstance(node, dict):
+            if isinstance(node.get("stage"), str):
+                stages.append(node["stage"])
+            # The classic plans nest inputStage(s), those of the slot based engine a queryPlan
+            nodes.extend(node[key] for key in ("queryPlan", "inputStage", "inputStages") if key in node)
+    return stages
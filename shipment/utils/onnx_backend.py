@@ -0,0 +1,81 @@
+import json
+import sys
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from shipment.exception import ShipmentException
+from shipment.constant import ONNX_CATEGORICAL_INPUT, ONNX_MISSING_CATEGORY, ONNX_NUMERICAL_INPUT
+
+
+def get_onnx_inputs(X: pd.DataFrame, categorical_columns: List[str], numerical_columns: List[str]) -> Dict:
+    """
+    Get the inputs of the exported graph from rows of the input data frame.
+
+    Args:
+        X (pd.DataFrame): The rows, with the columns of ShippingData.get_input_data_frame.
+        categorical_columns (List[str]): The columns of the string input, in order.
+        numerical_columns (List[str]): The columns of the double input, in order.
+
+    Returns:
+        Dict: The string and double input arrays by input name.
+    """
+    categorical = np.empty((len(X), len(categorical_columns)), dtype=object)
+    for position, column in enumerate(categorical_columns):
+        values = X[column].to_numpy(dtype=object)
+        missing = pd.isna(values)
+        categorical[:, position] = values.astype(str)
+        categorical[missing, position] = ONNX_MISSING_CATEGORY
+    numerical = np.column_stack(
+        [X[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in numerical_columns]
+    ).reshape(len(X), len(numerical_columns))
+    return {ONNX_CATEGORICAL_INPUT: categorical, ONNX_NUMERICAL_INPUT: numerical}
+
+
+class OnnxCostModel:
+    """
+    Serving backend running the ONNX export of a CostModel, the preprocessor and
+    the estimator fused into one graph, with onnxruntime on CPU.
+
+    Usage:
+        onnx_cost_model = OnnxCostModel(cost_model.onnx_model, intra_op_threads=1)
+        preds = onnx_cost_model.predict(df)
+    """
+
+    def __init__(self, onnx_model: bytes, intra_op_threads: int = 1):
+        try:
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = intra_op_threads
+            session_options.inter_op_num_threads = 1
+            # Only the errors, the merged graphs warn about the output shapes they reconcile
+            session_options.log_severity_level = 3
+            session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = onnxruntime.InferenceSession(
+                onnx_model, sess_options=session_options, providers=["CPUExecutionProvider"]
+            )
+            # The input columns are stored with the graph by the exporter
+            metadata = self.session.get_modelmeta().custom_metadata_map
+            self.categorical_columns = json.loads(metadata["categorical_columns"])
+            self.numerical_columns = json.loads(metadata["numerical_columns"])
+            self.output_name = self.session.get_outputs()[0].name
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Predict the cost of the rows, like CostModel.predict does.
+
+        Args:
+            X (pd.DataFrame): The rows, with the columns of ShippingData.get_input_data_frame.
+
+        Returns:
+            np.ndarray: The predictions.
+        """
+        try:
+            inputs = get_onnx_inputs(X, self.categorical_columns, self.numerical_columns)
+            return self.session.run([self.output_name], inputs)[0].ravel()
+        except Exception as e:
+            raise ShipmentException(e, sys)
@@ -0,0 +1,396 @@
+import json
+import os
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.constant import (
+    ONNX_CATEGORICAL_INPUT,
+    ONNX_IR_VERSION,
+    ONNX_MISSING_CATEGORY,
+    ONNX_NUMERICAL_INPUT,
+    ONNX_TARGET_OPSET,
+    ONNX_UNKNOWN_CATEGORY,
+    SPARSE_ABSENT_AS_MISSING_PACKAGES,
+)
+from shipment.utils.compact_forest import CompactForest, is_forest
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.onnx_backend import OnnxCostModel
+from shipment.utils.template_encoder import TemplateEncoder
+
+# Name of the features passed from the preprocessing graph to the estimator graph
+ONNX_FEATURES = "features"
+
+
+def get_package(estimator: object) -> str:
+    return type(estimator).__module__.split(".")[0]
+
+
+def get_column_tables(preprocessor: object) -> Tuple[List[str], Dict[str, Tuple[List[str], np.ndarray, np.ndarray]]]:
+    """
+    Tabulate the encoding of every categorical column by the fitted preprocessor.
+
+    Every learned category of a column is encoded, followed by a missing and an
+    unknown value, with the other columns at a fixed base value. The output
+    positions changing with the column are the ones it owns. The tables are only
+    exact when each output position depends on a single column, which is checked.
+
+    Args:
+        preprocessor (object): The fitted ColumnTransformer, as accepted by TemplateEncoder.supports.
+
+    Returns:
+        Tuple: The categorical columns, and for each one its category keys, the output
+            positions it owns and the (categories + 2, positions) table of their values.
+    """
+    categorical_columns = TemplateEncoder.get_categorical_columns(preprocessor)
+    numerical_columns, numerical_positions, _, _ = TemplateEncoder.get_numerical_layout(preprocessor)
+
+    learned_categories = {}
+    for _, transformer, columns in preprocessor.transformers_:
+        for column, categories in zip(columns, getattr(transformer, "categories_", [])):
+            known = learned_categories.setdefault(column, {})
+            for category in categories:
+                if TemplateEncoder.normalise(category) is not None:
+                    known.setdefault(str(category), category)
+    unlearned = [column for column in categorical_columns if not learned_categories.get(column)]
+    if unlearned:
+        raise ValueError(f"No learned categories for the columns {unlearned}")
+
+    base_row = {column: next(iter(learned_categories[column].values())) for column in categorical_columns}
+    base_row.update({column: 0.0 for column in numerical_columns})
+    n_features = len(preprocessor.get_feature_names_out())
+    is_numerical = np.zeros(n_features, dtype=bool)
+    is_numerical[numerical_positions] = True
+
+    owners = np.full(n_features, -1)
+    encodings = {}
+    for index, column in enumerate(categorical_columns):
+        values = list(learned_categories[column].values()) + [np.nan, ONNX_UNKNOWN_CATEGORY]
+        frame = pd.DataFrame([base_row] * len(values), dtype=object)
+        frame[column] = pd.Series(values, dtype=object)
+        for numerical_column in numerical_columns:
+            frame[numerical_column] = 0.0
+        encoded = preprocessor.transform(frame)
+        encoded = encoded.toarray() if sparse.issparse(encoded) else np.asarray(encoded, dtype=np.float64)
+        owned = (np.ptp(encoded, axis=0) > 0) & ~is_numerical
+        if (owners[owned] >= 0).any():
+            raise ValueError(f"The encoding of {column} is not independent of the other columns")
+        owners[owned] = index
+        encodings[column] = encoded
+
+    # The positions no column changes are constant, they are stored with the first column
+    owners[(owners < 0) & ~is_numerical] = 0
+    tables = {}
+    for index, column in enumerate(categorical_columns):
+        positions = np.flatnonzero(owners == index)
+        tables[column] = (list(learned_categories[column]), positions, encodings[column][:, positions])
+    return categorical_columns, tables
+
+
+def build_preprocessor_graph(preprocessor: object, absent_as_missing: bool = False) -> object:
+    """
+    Build the ONNX graph of the fitted preprocessor: a LabelEncoder and a table
+    lookup per categorical column, the standard scaling of the numerical columns
+    and the reordering of the encoded blocks into the preprocessor's output layout.
+
+    Args:
+        preprocessor (object): The fitted ColumnTransformer, as accepted by TemplateEncoder.supports.
+        absent_as_missing (bool, optional): Whether the zeros are passed on as missing values, like
+            the entries absent from the sparse output for the estimators of
+            SPARSE_ABSENT_AS_MISSING_PACKAGES. Defaults to False.
+
+    Returns:
+        onnx.ModelProto: The graph, from the categorical and numerical inputs to the float features.
+    """
+    from onnx import TensorProto, helper, numpy_helper
+
+    categorical_columns, tables = get_column_tables(preprocessor)
+    numerical_columns, numerical_positions, mean, scale = TemplateEncoder.get_numerical_layout(preprocessor)
+    n_features = len(preprocessor.get_feature_names_out())
+
+    nodes, initializers, blocks, block_positions = [], [], [], []
+
+    def add_constant(name: str, value: np.ndarray) -> str:
+        initializers.append(numpy_helper.from_array(np.asarray(value), name=name))
+        return name
+
+    for index, column in enumerate(categorical_columns):
+        keys, positions, table = tables[column]
+        # Rows of the table: the learned categories, then the missing and the unknown values
+        nodes.append(helper.make_node(
+            "Gather",
+            [ONNX_CATEGORICAL_INPUT, add_constant(f"column_{index}", np.array(index, dtype=np.int64))],
+            [f"category_{index}"],
+            axis=1,
+        ))
+        nodes.append(helper.make_node(
+            "LabelEncoder",
+            [f"category_{index}"],
+            [f"category_index_{index}"],
+            domain="ai.onnx.ml",
+            keys_strings=keys + [ONNX_MISSING_CATEGORY],
+            values_int64s=list(range(len(keys) + 1)),
+            default_int64=len(keys) + 1,
+        ))
+        nodes.append(helper.make_node(
+            "Gather",
+            [add_constant(f"table_{index}", table), f"category_index_{index}"],
+            [f"encoded_{index}"],
+            axis=0,
+        ))
+        blocks.append(f"encoded_{index}")
+        block_positions.append(positions)
+
+    numerical = ONNX_NUMERICAL_INPUT
+    if mean is not None:
+        nodes.append(helper.make_node("Sub", [numerical, add_constant("mean", mean)], ["centred"]))
+        numerical = "centred"
+    if scale is not None:
+        nodes.append(helper.make_node("Div", [numerical, add_constant("scale", scale)], ["scaled"]))
+        numerical = "scaled"
+    blocks.append(numerical)
+    block_positions.append(np.arange(n_features)[numerical_positions])
+
+    # Gathering the columns of the stacked blocks back into the output order of the preprocessor
+    order = np.argsort(np.concatenate(block_positions)).astype(np.int64)
+    nodes.append(helper.make_node("Concat", blocks, ["stacked"], axis=1))
+    nodes.append(helper.make_node("Gather", ["stacked", add_constant("order", order)], ["encoded"], axis=1))
+    encoded = "encoded"
+    if absent_as_missing:
+        nodes.append(helper.make_node("Equal", [encoded, add_constant("zero", np.array(0.0))], ["is_zero"]))
+        nodes.append(helper.make_node(
+            "Where", ["is_zero", add_constant("missing", np.array(np.nan)), encoded], ["encoded_missing"]
+        ))
+        encoded = "encoded_missing"
+    nodes.append(helper.make_node("Cast", [encoded], [ONNX_FEATURES], to=TensorProto.FLOAT))
+
+    graph = helper.make_graph(
+        nodes,
+        "preprocessor",
+        inputs=[
+            helper.make_tensor_value_info(ONNX_CATEGORICAL_INPUT, TensorProto.STRING, [None, len(categorical_columns)]),
+            helper.make_tensor_value_info(ONNX_NUMERICAL_INPUT, TensorProto.DOUBLE, [None, len(numerical_columns)]),
+        ],
+        outputs=[helper.make_tensor_value_info(ONNX_FEATURES, TensorProto.FLOAT, [None, n_features])],
+        initializer=initializers,
+    )
+    model = helper.make_model(
+        graph,
+        opset_imports=[helper.make_opsetid(domain, version) for domain, version in ONNX_TARGET_OPSET.items()],
+        ir_version=ONNX_IR_VERSION,
+    )
+    helper.set_model_props(model, {
+        "categorical_columns": json.dumps(categorical_columns),
+        "numerical_columns": json.dumps(numerical_columns),
+    })
+    return model
+
+
+def convert_compact_forest(compact_forest: CompactForest) -> object:
+    """
+    Convert a CompactForest to an ONNX TreeEnsembleRegressor. Its float32
+    thresholds and missing value sides reproduce the splits of the sklearn forest,
+    which the nearest float32 thresholds of skl2onnx do not.
+
+    Args:
+        compact_forest (CompactForest): The compact forest.
+
+    Returns:
+        onnx.ModelProto: The graph, from the float features to the prediction.
+    """
+    from onnx import TensorProto, helper
+
+    n_nodes = len(compact_forest.feature_)
+    ends = np.append(compact_forest.roots_[1:], n_nodes)
+    tree_ids = np.repeat(np.arange(compact_forest.n_trees), ends - compact_forest.roots_)
+    roots = compact_forest.roots_[tree_ids]
+    node_ids = np.arange(n_nodes) - roots
+    is_leaf = compact_forest.left_ == np.arange(n_nodes)
+    leaves = np.flatnonzero(is_leaf)
+
+    tree_ensemble = helper.make_node(
+        "TreeEnsembleRegressor",
+        [ONNX_FEATURES],
+        ["prediction"],
+        domain="ai.onnx.ml",
+        n_targets=1,
+        aggregate_function="AVERAGE",
+        nodes_treeids=tree_ids.tolist(),
+        nodes_nodeids=node_ids.tolist(),
+        nodes_featureids=compact_forest.feature_.astype(np.int64).tolist(),
+        nodes_values=compact_forest.threshold_.tolist(),
+        nodes_modes=np.where(is_leaf, "LEAF", "BRANCH_LEQ").tolist(),
+        nodes_truenodeids=(compact_forest.left_ - roots).tolist(),
+        nodes_falsenodeids=(compact_forest.right_ - roots).tolist(),
+        nodes_missing_value_tracks_true=compact_forest.missing_go_to_left_.astype(np.int64).tolist(),
+        target_treeids=tree_ids[leaves].tolist(),
+        target_nodeids=node_ids[leaves].tolist(),
+        target_ids=[0] * len(leaves),
+        target_weights=compact_forest.value_[leaves].tolist(),
+    )
+    graph = helper.make_graph(
+        [tree_ensemble],
+        "compact_forest",
+        inputs=[helper.make_tensor_value_info(ONNX_FEATURES, TensorProto.FLOAT, [None, compact_forest.n_features_in_])],
+        outputs=[helper.make_tensor_value_info("prediction", TensorProto.FLOAT, [None, 1])],
+    )
+    return helper.make_model(
+        graph,
+        opset_imports=[helper.make_opsetid(domain, version) for domain, version in ONNX_TARGET_OPSET.items()],
+        ir_version=ONNX_IR_VERSION,
+    )
+
+
+def convert_estimator(estimator: object, n_features: int) -> object:
+    """
+    Convert a fitted estimator to ONNX: the forests through CompactForest, the other
+    scikit-learn estimators with skl2onnx, XGBoost and LightGBM with onnxmltools and
+    CatBoost with its own exporter.
+
+    Args:
+        estimator (object): The fitted estimator.
+        n_features (int): The number of features it reads.
+
+    Returns:
+        onnx.ModelProto: The graph, from the float features to the prediction.
+    """
+    import onnx
+
+    if is_forest(estimator):
+        estimator = CompactForest.from_forest(estimator)
+    if isinstance(estimator, CompactForest):
+        return convert_compact_forest(estimator)
+    package = get_package(estimator)
+    if package == "catboost":
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "model.onnx")
+            estimator.save_model(file_path, format="onnx")
+            return onnx.load(file_path)
+
+    from skl2onnx.common.data_types import FloatTensorType
+
+    initial_types = [(ONNX_FEATURES, FloatTensorType([None, n_features]))]
+    if package == "xgboost":
+        from onnxmltools import convert_xgboost
+
+        return convert_xgboost(estimator, initial_types=initial_types, target_opset=ONNX_TARGET_OPSET[""])
+    if package == "lightgbm":
+        from onnxmltools import convert_lightgbm
+
+        return convert_lightgbm(estimator, initial_types=initial_types, target_opset=ONNX_TARGET_OPSET[""])
+    if package == "sklearn":
+        from skl2onnx import convert_sklearn
+
+        return convert_sklearn(estimator, initial_types=initial_types, target_opset=ONNX_TARGET_OPSET)
+    raise TypeError(f"No ONNX converter for {type(estimator).__name__}")
+
+
+def export_cost_model(cost_model: object) -> object:
+    """
+    Export a CostModel, its preprocessor and its estimator, to a single ONNX graph
+    run by OnnxCostModel.
+
+    Args:
+        cost_model (object): The CostModel.
+
+    Returns:
+        onnx.ModelProto: The fused graph.
+    """
+    from onnx import compose, helper
+
+    preprocessor = cost_model.preprocessing_object
+    estimator = cost_model.trained_model_object
+    if not TemplateEncoder.supports(preprocessor):
+        raise TypeError("The preprocessor layout is not supported by the ONNX export")
+
+    preprocessor_graph = build_preprocessor_graph(
+        preprocessor,
+        absent_as_missing=(
+            preprocessor.sparse_output_ and get_package(estimator) in SPARSE_ABSENT_AS_MISSING_PACKAGES
+        ),
+    )
+    estimator_graph = compose.add_prefix(
+        convert_estimator(estimator, len(preprocessor.get_feature_names_out())), "estimator_"
+    )
+    estimator_input = estimator_graph.graph.input[0].name
+    # Both graphs are merged under the opsets of the preprocessing graph
+    estimator_graph.ir_version = preprocessor_graph.ir_version
+    for opset in estimator_graph.opset_import:
+        if opset.domain in ONNX_TARGET_OPSET:
+            opset.version = ONNX_TARGET_OPSET[opset.domain]
+
+    model = compose.merge_models(
+        preprocessor_graph,
+        estimator_graph,
+        io_map=[(ONNX_FEATURES, estimator_input)],
+        outputs=[estimator_graph.graph.output[0].name],
+    )
+    metadata = {prop.key: prop.value for prop in preprocessor_graph.metadata_props}
+    metadata["estimator"] = type(estimator).__name__
+    helper.set_model_props(model, metadata)
+    return model
+
+
+def onnx_export_with_report(
+        cost_model: object,
+        X_test: pd.DataFrame,
+        y_test: np.ndarray,
+        parity_tolerance: float = 1e-4,
+) -> Tuple[bytes, Dict]:
+    """
+    Export a CostModel to ONNX and check its predictions on the test set against
+    the cost model's.
+
+    Args:
+        cost_model (object): The CostModel.
+        X_test (pd.DataFrame): The test rows, with the columns of ShippingData.get_input_data_frame.
+        y_test (np.ndarray): The test target.
+        parity_tolerance (float, optional): The largest prediction difference accepted, relative
+            to the standard deviation of the cost model's predictions. Defaults to 1e-4.
+
+    Returns:
+        Tuple[bytes, Dict]: The serialised graph, None when the export failed or its predictions
+            differ, and the report of the export.
+    """
+    logging.info("Entered the onnx_export_with_report function.")
+    try:
+        report = {
+            "estimator": type(cost_model.trained_model_object).__name__,
+            "exported": False,
+            "parity_tolerance": float(parity_tolerance),
+        }
+        try:
+            onnx_model = export_cost_model(cost_model).SerializeToString()
+        except Exception as e:
+            report["error"] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+            logging.warning(f"Could not export the cost model to ONNX: {report['error']}")
+            return None, report
+
+        # Object columns like the frames of the prediction requests, the preprocessor
+        # would scale the float32 columns of the test set in float32
+        X_test = X_test.astype(object)
+        model_preds = np.asarray(cost_model.predict(X_test), dtype=np.float64).ravel()
+        onnx_preds = OnnxCostModel(onnx_model).predict(X_test).astype(np.float64)
+        max_abs_delta = float(np.abs(onnx_preds - model_preds).max(initial=0.0))
+        max_delta = parity_tolerance * model_preds.std()
+        report.update({
+            "exported": True,
+            "onnx_bytes": len(onnx_model),
+            "n_test_rows": int(len(X_test)),
+            "max_abs_prediction_delta": max_abs_delta,
+            "max_accepted_prediction_delta": float(max_delta),
+            "model_r2_score": float(MainUtils.get_model_score(y_test, model_preds)),
+            "onnx_r2_score": float(MainUtils.get_model_score(y_test, onnx_preds)),
+            "parity": bool(max_abs_delta <= max_delta),
+        })
+        logging.info(f"Exported the cost model to ONNX: {report}")
+        logging.info("Exited the onnx_export_with_report function.")
+        return (onnx_model if report["parity"] else None), report
+    except Exception as e:
+        raise ShipmentException(e, sys)
@@ -0,0 +1,505 @@
+import sys
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.constant import REQUEST_ERROR_MAX_ROWS, SHIPPING_DATA_FIELDS
+
+NUMERIC_DTYPES = {"float64", "float32", "int64", "int32"}
+
+
+@dataclass
+class ColumnRule:
+    name: str
+    dtype: str
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    domain: Optional[List[str]] = None
+    max_null_rate: float = 1.0
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.dtype in NUMERIC_DTYPES
+
+
+@dataclass
+class ColumnReport:
+    column: str
+    expected_dtype: str
+    present: bool = True
+    n_rows: int = 0
+    n_null: int = 0
+    n_invalid_type: int = 0
+    n_out_of_range: int = 0
+    n_out_of_domain: int = 0
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def null_rate(self) -> float:
+        return self.n_null / self.n_rows if self.n_rows else 0.0
+
+
+@dataclass
+class SchemaValidationReport:
+    n_rows: int = 0
+    n_chunks: int = 0
+    columns: Dict[str, ColumnReport] = field(default_factory=dict)
+    unexpected_columns: List[str] = field(default_factory=list)
+    validation_status: bool = True
+
+    @property
+    def failed_columns(self) -> List[str]:
+        return [name for name, report in self.columns.items() if report.errors]
+
+    def to_dict(self) -> Dict:
+        """Plain python representation of the report, suitable for a yaml artefact."""
+        report = asdict(self)
+        for name, column_report in self.columns.items():
+            report["columns"][name]["null_rate"] = round(column_report.null_rate, 6)
+        report["failed_columns"] = self.failed_columns
+        return report
+
+
+class SchemaValidator:
+    """
+    Validation engine compiled from the schema config.
+
+    Every rule of a column (presence, dtype, null rate, numeric range and
+    category domain) is evaluated with vectorized pandas operations, once per
+    chunk. Counts are accumulated in a SchemaValidationReport so the same
+    engine can validate a whole dataframe or a stream of ingestion chunks.
+
+    Usage:
+        validator = SchemaValidator(schema_config)
+        report = validator.validate(df)
+    """
+
+    def __init__(self, schema_config: Dict, exclude_columns: Iterable[str] = ()):
+        self.rules = self.compile_rules(schema_config, exclude_columns)
+
+    @staticmethod
+    def compile_rules(schema_config: Dict, exclude_columns: Iterable[str] = ()) -> Dict[str, ColumnRule]:
+        """
+        Compile the column rules from the schema config.
+
+        Args:
+            schema_config (Dict): The content of the schema file.
+            exclude_columns (Iterable[str], optional): Columns left out of the validation.
+
+        Returns:
+            Dict[str, ColumnRule]: The rules by column name.
+        """
+        logging.info("Entered the compile_rules method of SchemaValidator class")
+        try:
+            validation_config = schema_config.get("validation", {})
+            ranges = validation_config.get("ranges", {})
+            domains = validation_config.get("domains", {})
+            max_null_rate = validation_config.get("max_null_rate", 1.0)
+            excluded = set(exclude_columns)
+
+            rules = {}
+            for column in schema_config["columns"]:
+                (name, dtype), = column.items()
+                if name in excluded:
+                    continue
+                min_value, max_value = ranges.get(name, (None, None))
+                rules[name] = ColumnRule(
+                    name=name,
+                    dtype=dtype,
+                    min_value=min_value,
+                    max_value=max_value,
+                    domain=domains.get(name),
+                    max_null_rate=max_null_rate,
+                )
+            logging.info("Exited the compile_rules method of SchemaValidator class")
+            return rules
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def validate_chunk(
+            self, df: pd.DataFrame, report: SchemaValidationReport = None
+            ) -> SchemaValidationReport:
+        """
+        Validate one chunk of data and accumulate the counts in the report.
+
+        Args:
+            df (pd.DataFrame): The chunk to be validated.
+            report (SchemaValidationReport, optional): The report to update, a new one if None.
+
+        Returns:
+            SchemaValidationReport: The updated report, errors are only filled by `finalize`.
+        """
+        try:
+            if report is None:
+                report = SchemaValidationReport()
+            n_rows = len(df)
+            report.n_rows += n_rows
+            report.n_chunks += 1
+
+            for name, rule in self.rules.items():
+                column_report = report.columns.get(name)
+                if column_report is None:
+                    column_report = report.columns[name] = ColumnReport(column=name, expected_dtype=rule.dtype)
+
+                if name not in df.columns:
+                    column_report.present = False
+                    continue
+
+                series = df[name]
+                null_mask = series.isna().to_numpy()
+                column_report.n_rows += n_rows
+                column_report.n_null += int(null_mask.sum())
+
+                if rule.is_numeric:
+                    if pd.api.types.is_numeric_dtype(series.dtype):
+                        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+                    else:
+                        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                        column_report.n_invalid_type += int((np.isnan(values) & ~null_mask).sum())
+
+                    valid = values[~np.isnan(values)]
+                    if len(valid):
+                        chunk_min, chunk_max = float(valid.min()), float(valid.max())
+                        column_report.min_value = chunk_min if column_report.min_value is None else min(column_report.min_value, chunk_min)
+                        column_report.max_value = chunk_max if column_report.max_value is None else max(column_report.max_value, chunk_max)
+                        if rule.min_value is not None:
+                            column_report.n_out_of_range += int((valid < rule.min_value).sum())
+                        if rule.max_value is not None:
+                            column_report.n_out_of_range += int((valid > rule.max_value).sum())
+
+                elif pd.api.types.is_numeric_dtype(series.dtype) and not null_mask.all():
+                    column_report.n_invalid_type += int((~null_mask).sum())
+
+                if rule.domain is not None:
+                    column_report.n_out_of_domain += int((~series.isin(rule.domain).to_numpy() & ~null_mask).sum())
+
+            report.unexpected_columns = sorted(
+                set(report.unexpected_columns) | (set(df.columns) - set(self.rules) - {"_id"})
+            )
+            return report
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def has_structural_errors(self, report: SchemaValidationReport) -> bool:
+        """
+        Whether the report already shows errors that no later chunk can fix, i.e. missing
+        columns or values of the wrong type. Used to fail fast on streamed chunks.
+
+        Args:
+            report (SchemaValidationReport): The report being accumulated.
+
+        Returns:
+            bool: True if a column is missing or has values of the wrong type.
+        """
+        return any(
+            not column_report.present or column_report.n_invalid_type > 0
+            for column_report in report.columns.values()
+        )
+
+    def finalize(self, report: SchemaValidationReport) -> SchemaValidationReport:
+        """
+        Turn the accumulated counts into per-column errors and the overall status.
+
+        Args:
+            report (SchemaValidationReport): The accumulated report.
+
+        Returns:
+            SchemaValidationReport: The report with errors and validation status filled.
+        """
+        try:
+            for name, column_report in report.columns.items():
+                rule = self.rules[name]
+                errors = []
+                if not column_report.present:
+                    errors.append("column is missing")
+                else:
+                    if column_report.n_invalid_type:
+                        errors.append(f"{column_report.n_invalid_type} values are not of type {rule.dtype}")
+                    if column_report.null_rate > rule.max_null_rate:
+                        errors.append(f"null rate {column_report.null_rate:.3f} is above {rule.max_null_rate}")
+                    if column_report.n_out_of_range:
+                        errors.append(
+                            f"{column_report.n_out_of_range} values outside [{rule.min_value}, {rule.max_value}]"
+                        )
+                    if column_report.n_out_of_domain:
+                        errors.append(f"{column_report.n_out_of_domain} values outside {rule.domain}")
+                column_report.errors = errors
+
+            report.validation_status = not report.failed_columns
+            if report.unexpected_columns:
+                logging.info(f"Columns not described in the schema: {report.unexpected_columns}")
+            logging.info(f"Schema validation status is {report.validation_status}, failed columns: {report.failed_columns}")
+            return report
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def validate_profile(self, profile: Dict) -> SchemaValidationReport:
+        """
+        Validate a collection from its profile, computed inside MongoDB by profile_collection,
+        without reading its documents.
+
+        Args:
+            profile (Dict): The profile, its columns section holds the counts of validate_chunk.
+
+        Returns:
+            SchemaValidationReport: The final report.
+        """
+        try:
+            report = SchemaValidationReport(n_rows=profile["n_rows"], n_chunks=1)
+            for name, rule in self.rules.items():
+                stats = profile["columns"].get(name, {"present": False})
+                report.columns[name] = ColumnReport(
+                    column=name,
+                    expected_dtype=rule.dtype,
+                    **{key: stats[key] for key in (
+                        "present", "n_rows", "n_null", "n_invalid_type", "n_out_of_range",
+                        "n_out_of_domain", "min_value", "max_value",
+                    ) if key in stats},
+                )
+            return self.finalize(report)
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def validate(self, *dfs: pd.DataFrame) -> SchemaValidationReport:
+        """
+        Validate one or more dataframes as chunks of the same dataset.
+
+        Args:
+            dfs (pd.DataFrame): The dataframes to be validated.
+
+        Returns:
+            SchemaValidationReport: The final report.
+        """
+        report = SchemaValidationReport()
+        for df in dfs:
+            self.validate_chunk(df, report)
+        return self.finalize(report)
+
+
+class RequestValidator:
+    """
+    Validator of a single prediction request, run before any pandas or sklearn code.
+
+    The checks are compiled once from the schema config and from the categories
+    learned by the fitted OneHotEncoder, so validating a request is a float
+    conversion or a set lookup per field.
+
+    Usage:
+        validator = RequestValidator(schema_config, cost_model.preprocessing_object)
+        input_data, errors = validator.validate(form_data)
+    """
+
+    MISSING_VALUES = frozenset({"", "nan", "NaN", "None", "null"})
+    # Types of the raw values accepted, the lists and objects of a json body are rejected
+    SCALAR_TYPES = (str, int, float, bool)
+
+    def __init__(
+            self,
+            schema_config: Dict,
+            preprocessing_object: object = None,
+            fields: Dict[str, str] = SHIPPING_DATA_FIELDS,
+    ):
+        validation_config = schema_config.get("validation", {})
+        ranges = validation_config.get("ranges", {})
+        domains = validation_config.get("domains", {})
+        numerical_columns = set(schema_config["numerical_columns"])
+        learned_categories = self.get_learned_categories(preprocessing_object)
+
+        self.fields = fields
+        self.numeric_fields = []
+        self.categorical_fields = []
+        for field_name, column in fields.items():
+            if column in numerical_columns:
+                min_value, max_value = ranges.get(column, (None, None))
+                self.numeric_fields.append((field_name, column, min_value, max_value))
+            else:
+                categories, accepts_missing = learned_categories.get(
+                    column, (frozenset(domains.get(column, ())), False)
+                )
+                self.categorical_fields.append((field_name, column, categories, accepts_missing))
+
+    @staticmethod
+    def get_learned_categories(preprocessing_object: object) -> Dict[str, tuple]:
+        """
+        Get the categories learned by the OneHotEncoder of the fitted preprocessor.
+
+        Args:
+            preprocessing_object (object): The fitted ColumnTransformer.
+
+        Returns:
+            Dict[str, tuple]: Column name to (set of categories, whether a missing value was seen in training).
+        """
+        learned_categories = {}
+        for _, transformer, columns in getattr(preprocessing_object, "transformers_", []):
+            categories_list = getattr(transformer, "categories_", None)
+            if categories_list is None or isinstance(columns, str):
+                continue
+            for column, categories in zip(columns, categories_list):
+                learned_categories[column] = (
+                    frozenset(category for category in categories if isinstance(category, str)),
+                    any(category != category for category in categories),
+                )
+        return learned_categories
+
+    @classmethod
+    def is_scalar(cls, raw_value: object) -> bool:
+        return raw_value is None or isinstance(raw_value, cls.SCALAR_TYPES)
+
+    def validate(self, form_data: Dict[str, Optional[str]]) -> tuple:
+        """
+        Validate and convert the raw fields of a request.
+
+        Args:
+            form_data (Dict[str, Optional[str]]): Field name to raw value.
+
+        Returns:
+            tuple: The converted values by field name and the list of errors, empty if the request is valid.
+        """
+        input_data = {}
+        errors = []
+
+        for field_name, column, min_value, max_value in self.numeric_fields:
+            raw_value = form_data.get(field_name)
+            if not self.is_scalar(raw_value):
+                errors.append({"field": field_name, "column": column, "value": raw_value, "error": "value must be a scalar"})
+                continue
+            if raw_value is None or str(raw_value).strip() in self.MISSING_VALUES:
+                errors.append({"field": field_name, "column": column, "value": raw_value, "error": "value is required"})
+                continue
+            try:
+                value = float(raw_value)
+            except (TypeError, ValueError):
+                errors.append({"field": field_name, "column": column, "value": raw_value, "error": "value must be a number"})
+                continue
+            if value != value or value in (float("inf"), float("-inf")):
+                errors.append({"field": field_name, "column": column, "value": raw_value, "error": "value must be finite"})
+            elif (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+                errors.append({
+                    "field": field_name, "column": column, "value": raw_value,
+                    "error": f"value must be within [{min_value}, {max_value}]",
+                })
+            else:
+                input_data[field_name] = value
+
+        for field_name, column, categories, accepts_missing in self.categorical_fields:
+            raw_value = form_data.get(field_name)
+            if not self.is_scalar(raw_value):
+                errors.append({"field": field_name, "column": column, "value": raw_value, "error": "value must be a scalar"})
+            elif raw_value is None or raw_value in self.MISSING_VALUES:
+                if accepts_missing:
+                    input_data[field_name] = np.nan
+                else:
+                    errors.append({"field": field_name, "column": column, "value": raw_value, "error": "value is required"})
+            elif raw_value in categories:
+                input_data[field_name] = raw_value
+            else:
+                errors.append({
+                    "field": field_name, "column": column, "value": raw_value,
+                    "error": f"value must be one of {sorted(categories)}",
+                })
+
+        return input_data, errors
+
+    def validate_axis(self, input_data: Dict, field_name: str, values: Sequence) -> tuple:
+        """
+        Validate the values of a field swept around a validated request.
+
+        Args:
+            input_data (Dict): The converted values by field name, as returned by validate.
+            field_name (str): The swept field.
+            values (Sequence): The raw values of the field.
+
+        Returns:
+            tuple: The input data frame of the request repeated with the field set to each value,
+                None if a value is invalid, and the list of errors by column.
+        """
+        if field_name not in self.fields:
+            return None, [{"field": field_name, "error": f"field must be one of {list(self.fields)}"}]
+        if (
+            isinstance(values, (str, bytes)) or not isinstance(values, Sequence) or not len(values)
+            or any(isinstance(value, (list, dict)) for value in values)
+        ):
+            return None, [{"field": field_name, "error": "values must be a non-empty list of values"}]
+        columns = {
+            column: np.full(len(values), input_data[other_field], dtype=object)
+            for other_field, column in self.fields.items()
+        }
+        columns[self.fields[field_name]] = np.asarray(values, dtype=object)
+        # The numerical columns as float64, their fast path in validate_columns
+        for _, column, _, _ in self.numeric_fields:
+            if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in columns[column]):
+                columns[column] = columns[column].astype(np.float64)
+        axis, errors = self.validate_columns(columns)
+        return axis, [{"field": field_name, **error} for error in errors]
+
+    @staticmethod
+    def column_error(column: str, rows: np.ndarray, error: str) -> Dict:
+        rows = np.flatnonzero(rows)
+        return {"column": column, "n_rows": int(len(rows)), "rows": rows[:REQUEST_ERROR_MAX_ROWS].tolist(), "error": error}
+
+    def validate_columns(self, columns: Mapping[str, np.ndarray]) -> tuple:
+        """
+        Validate and convert a batch of requests given column by column, with the
+        checks of validate run as vectorised operations. The numerical columns
+        already stored as float64 are used without a copy.
+
+        Args:
+            columns (Mapping[str, np.ndarray]): Column name, as in the schema, to the values of the rows.
+
+        Returns:
+            tuple: The input data frame, with the columns of ShippingData.get_input_data_frame, and the
+                list of errors by column, empty if every row is valid.
+        """
+        errors = []
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            return None, [{"column": None, "error": f"columns of different lengths {sorted(lengths)}"}]
+        n_rows = lengths.pop() if lengths else 0
+        input_columns = {}
+
+        for field_name, column, min_value, max_value in self.numeric_fields:
+            if column not in columns:
+                errors.append({"column": column, "error": "column is required"})
+                continue
+            values = np.asarray(columns[column])
+            if values.dtype.kind in "fiu":
+                values = values.astype(np.float64, copy=False)
+            else:
+                values = pd.to_numeric(
+                    pd.Series(values, dtype=object).replace(list(self.MISSING_VALUES), np.nan), errors="coerce"
+                ).to_numpy(dtype=np.float64)
+            invalid = ~np.isfinite(values)
+            if invalid.any():
+                errors.append(self.column_error(column, invalid, "value is required and must be a finite number"))
+            out_of_range = np.zeros(n_rows, dtype=bool)
+            if min_value is not None:
+                out_of_range |= values < min_value
+            if max_value is not None:
+                out_of_range |= values > max_value
+            if out_of_range.any():
+                errors.append(self.column_error(column, out_of_range, f"value must be within [{min_value}, {max_value}]"))
+            input_columns[column] = values
+
+        for field_name, column, categories, accepts_missing in self.categorical_fields:
+            if column not in columns:
+                errors.append({"column": column, "error": "column is required"})
+                continue
+            values = pd.Series(columns[column], dtype=object)
+            missing = values.isna() | values.isin(self.MISSING_VALUES)
+            if missing.any() and not accepts_missing:
+                errors.append(self.column_error(column, missing.to_numpy(), "value is required"))
+            unknown = ~missing & ~values.isin(categories)
+            if unknown.any():
+                errors.append(self.column_error(column, unknown.to_numpy(), f"value must be one of {sorted(categories)}"))
+            input_columns[column] = values.mask(missing, np.nan).to_numpy(dtype=object)
+
+        if errors:
+            return None, errors
+        # In the column order of the request frames, without copying the arrays into a single block
+        return pd.DataFrame({column: input_columns[column] for column in self.fields.values()}, copy=False), errors
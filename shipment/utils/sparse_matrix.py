@@ -0,0 +1,83 @@
+import sys
+from typing import Dict
+
+import numpy as np
+from scipy import sparse
+
+from shipment.exception import ShipmentException
+from shipment.constant import FEATURE_DTYPE, SPARSE_MISSING_VALUE_PACKAGES, SPARSE_WRITABLE_INPUT_PACKAGES
+
+# Whether the estimators declare sparse support, by estimator type, so the tags
+# are read once rather than on every serving predict call
+_sparse_support: Dict[type, bool] = {}
+
+
+def to_feature_matrix(features: object) -> sparse.csr_matrix:
+    """
+    Convert the output of the preprocessor to a FEATURE_DTYPE CSR matrix.
+
+    Args:
+        features (object): A sparse matrix or a dense array.
+
+    Returns:
+        sparse.csr_matrix: The features, without explicit zeros.
+    """
+    try:
+        if sparse.issparse(features):
+            matrix = features.tocsr().astype(FEATURE_DTYPE, copy=False)
+        else:
+            matrix = sparse.csr_matrix(np.asarray(features, dtype=FEATURE_DTYPE))
+        matrix.eliminate_zeros()
+        return matrix
+    except Exception as e:
+        raise ShipmentException(e, sys)
+
+
+def accepts_sparse_input(model: object, X: object) -> bool:
+    """
+    Whether an estimator can be fed the CSR matrix X as it is.
+
+    The estimator must declare sparse support, and when X holds missing values
+    it must also handle NaN in sparse input, which the sklearn trees do not
+    (they only handle NaN in dense input).
+
+    Args:
+        model (object): The estimator.
+        X (object): The sparse features.
+
+    Returns:
+        bool: True if X can be passed without densifying it.
+    """
+    supports_sparse = _sparse_support.get(type(model))
+    if supports_sparse is None:
+        from sklearn.utils import get_tags
+
+        supports_sparse = _sparse_support[type(model)] = bool(get_tags(model).input_tags.sparse)
+    if not supports_sparse:
+        return False
+    if not np.isnan(X.data).any():
+        return True
+    return type(model).__module__.split(".")[0] in SPARSE_MISSING_VALUE_PACKAGES
+
+
+def estimator_input(model: object, X: object) -> object:
+    """
+    Get the features in the layout accepted by the estimator: X itself, or a
+    dense array for the estimators that cannot read it sparse.
+
+    Args:
+        model (object): The estimator.
+        X (object): The features, sparse or dense.
+
+    Returns:
+        object: The features to pass to fit or predict.
+    """
+    if sparse.issparse(X) and not accepts_sparse_input(model, X):
+        return X.toarray()
+    if (
+        sparse.issparse(X)
+        and not X.data.flags.writeable
+        and type(model).__module__.split(".")[0] in SPARSE_WRITABLE_INPUT_PACKAGES
+    ):
+        return X.copy()
+    return X
@@ -0,0 +1,95 @@
+import sys
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from shipment.exception import ShipmentException
+from shipment.utils.onnx_export import get_column_tables
+from shipment.utils.template_encoder import TemplateEncoder
+
+
+def get_grid_indices(axes: Dict[str, pd.DataFrame]) -> List[np.ndarray]:
+    """Index of the value of every axis at each point of the grid, the last axis varying fastest."""
+    shape = [len(axis) for axis in axes.values()]
+    return list(np.unravel_index(np.arange(np.prod(shape)), shape))
+
+
+def get_grid_frame(base: pd.DataFrame, axes: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Get the rows of a what-if grid: the base row with the swept columns set to every
+    combination of their values.
+
+    Args:
+        base (pd.DataFrame): The base row, with the columns of ShippingData.get_input_data_frame.
+        axes (Dict[str, pd.DataFrame]): Swept column to the base row repeated with the column
+            set to each of its values, as returned by RequestValidator.validate_axis.
+
+    Returns:
+        pd.DataFrame: The rows of the grid.
+    """
+    indices = get_grid_indices(axes)
+    grid = base.iloc[np.zeros(len(indices[0]), dtype=np.intp)].reset_index(drop=True)
+    for (column, axis), index in zip(axes.items(), indices):
+        grid[column] = axis[column].to_numpy()[index]
+    return grid
+
+
+class SweepEncoder:
+    """
+    Encoder of what-if grids for a preprocessor encoding each column independently.
+
+    The base row and every value of the swept columns are encoded once, in one
+    call of the preprocessor, the grid is then assembled by copying the encoded
+    values into the output positions owned by each swept column. A 100 x 10 grid
+    costs 111 encoded rows instead of 1000.
+
+    Usage:
+        sweep_encoder = SweepEncoder(cost_model.preprocessing_object)
+        transformed_feature = sweep_encoder.transform(base, axes)
+    """
+
+    def __init__(self, preprocessor: object):
+        try:
+            if not TemplateEncoder.supports(preprocessor):
+                raise TypeError("The preprocessor layout is not supported by SweepEncoder")
+            self.preprocessor = preprocessor
+            categorical_columns, tables = get_column_tables(preprocessor)
+            self.positions = {column: tables[column][1] for column in categorical_columns}
+            numerical_columns, numerical_positions, _, _ = TemplateEncoder.get_numerical_layout(preprocessor)
+            n_features = len(preprocessor.get_feature_names_out())
+            for column, position in zip(numerical_columns, np.arange(n_features)[numerical_positions]):
+                self.positions[column] = np.array([position])
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    def transform(self, base: pd.DataFrame, axes: Dict[str, pd.DataFrame]) -> object:
+        """
+        Encode the rows of a what-if grid, in the order of get_grid_frame.
+
+        Args:
+            base (pd.DataFrame): The base row, with the columns of ShippingData.get_input_data_frame.
+            axes (Dict[str, pd.DataFrame]): Swept column to the base row repeated with the column
+                set to each of its values.
+
+        Returns:
+            object: The encoded grid, sparse when the preprocessor output is.
+        """
+        try:
+            # A single call of the preprocessor, whose overhead outweighs the rows it encodes
+            encoded = self.preprocessor.transform(pd.concat([base, *axes.values()], ignore_index=True))
+            is_sparse = sparse.issparse(encoded)
+            encoded = encoded.toarray() if is_sparse else np.asarray(encoded)
+
+            indices = get_grid_indices(axes)
+            grid = np.repeat(encoded[:1], len(indices[0]), axis=0)
+            offset = 1
+            for (column, axis), index in zip(axes.items(), indices):
+                positions = self.positions[column]
+                grid[:, positions] = encoded[offset:offset + len(axis), positions][index]
+                offset += len(axis)
+            # Without the zeros, as the preprocessor stores them, for the estimators reading absent entries as missing
+            return sparse.csr_matrix(grid) if is_sparse else grid
+        except Exception as e:
+            raise ShipmentException(e, sys)
@@ -0,0 +1,195 @@
+import itertools
+import sys
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import StandardScaler
+
+from shipment.logger import logging
+from shipment.exception import ShipmentException
+from shipment.constant import TEMPLATE_ENCODER_MAX_TEMPLATES
+
+
+class TemplateEncoder:
+    """
+    Serving shortcut for the fitted preprocessor, with the categorical part of the
+    encoded row precomputed.
+
+    The ColumnTransformer encodes every column on its own, so the one hot and
+    binary encoded part of a row only depends on the categorical values. One
+    encoded row template is built per combination of the categories learned by
+    the OneHotEncoder, with the numerical positions left at zero. Encoding a
+    request is then a dictionary lookup of its template and the write of the
+    standard scaled numerical values into a copy of it, with the same output as
+    preprocessor.transform. A combination seen for the first time, such as a
+    missing value the encoder ignores, goes through the preprocessor once and
+    its template is cached.
+
+    Usage:
+        if TemplateEncoder.supports(preprocessor):
+            encoder = TemplateEncoder(preprocessor)
+            features = encoder.transform(df)
+    """
+
+    def __init__(self, preprocessor: ColumnTransformer):
+        try:
+            self.preprocessor = preprocessor
+            self.numerical_columns, self.numerical_positions, self.mean, self.scale = (
+                self.get_numerical_layout(preprocessor)
+            )
+            self.categorical_columns = self.get_categorical_columns(preprocessor)
+            self.columns = self.categorical_columns + self.numerical_columns
+            self.n_features = len(preprocessor.get_feature_names_out())
+            self.dtype = None
+            self.templates = np.empty((0, self.n_features))
+            self.template_index: Dict[tuple, int] = {}
+            self._lock = threading.Lock()
+
+            combinations = self.get_learned_combinations(preprocessor)
+            if combinations and len(combinations) <= TEMPLATE_ENCODER_MAX_TEMPLATES:
+                self.add_templates(combinations)
+            logging.info(
+                f"Built {len(self.template_index)} encoded row templates for the columns {self.categorical_columns}"
+            )
+        except Exception as e:
+            raise ShipmentException(e, sys)
+
+    @staticmethod
+    def supports(preprocessor: object) -> bool:
+        """
+        Whether the templates reproduce the preprocessor: a fitted ColumnTransformer
+        with a single StandardScaler over the numerical columns, the other
+        transformers only reading other columns, and nothing passed through.
+
+        Args:
+            preprocessor (object): The fitted preprocessor.
+
+        Returns:
+            bool: True if TemplateEncoder can stand in for the preprocessor.
+        """
+        if not isinstance(preprocessor, ColumnTransformer) or not hasattr(preprocessor, "transformers_"):
+            return False
+        scalers = [
+            columns for name, transformer, columns in preprocessor.transformers_
+            if isinstance(transformer, StandardScaler)
+        ]
+        if len(scalers) != 1:
+            return False
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == "remainder":
+                if transformer != "drop" and len(columns):
+                    return False
+            elif not isinstance(transformer, StandardScaler) and set(columns) & set(scalers[0]):
+                return False
+        return True
+
+    @staticmethod
+    def get_numerical_layout(preprocessor: ColumnTransformer) -> Tuple[List[str], slice, np.ndarray, np.ndarray]:
+        for name, transformer, columns in preprocessor.transformers_:
+            if isinstance(transformer, StandardScaler):
+                mean = transformer.mean_ if transformer.with_mean else None
+                scale = transformer.scale_ if transformer.with_std else None
+                return list(columns), preprocessor.output_indices_[name], mean, scale
+        raise ValueError("The preprocessor has no StandardScaler")
+
+    @staticmethod
+    def get_categorical_columns(preprocessor: ColumnTransformer) -> List[str]:
+        categorical_columns = []
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == "remainder" or isinstance(transformer, StandardScaler):
+                continue
+            categorical_columns += [column for column in columns if column not in categorical_columns]
+        return categorical_columns
+
+    def get_learned_combinations(self, preprocessor: ColumnTransformer) -> List[tuple]:
+        """
+        Get the cross product of the categories learned by the OneHotEncoder, when
+        it learned every categorical column.
+
+        Returns:
+            List[tuple]: The combinations, in the order of categorical_columns.
+        """
+        learned_categories = {}
+        for _, transformer, columns in preprocessor.transformers_:
+            for column, categories in zip(columns, getattr(transformer, "categories_", [])):
+                learned_categories[column] = [self.normalise(category) for category in categories]
+        if any(column not in learned_categories for column in self.categorical_columns):
+            return []
+
+        n_combinations = np.prod([len(learned_categories[column]) for column in self.categorical_columns])
+        if n_combinations > TEMPLATE_ENCODER_MAX_TEMPLATES:
+            logging.warning(
+                f"{n_combinations} category combinations, more than {TEMPLATE_ENCODER_MAX_TEMPLATES}: "
+                f"the templates are built on first use"
+            )
+            return []
+        return list(itertools.product(*[learned_categories[column] for column in self.categorical_columns]))
+
+    @staticmethod
+    def normalise(value: object) -> object:
+        # Every missing value, None or NaN, shares the template key None
+        return None if value is None or value != value else value
+
+    def add_templates(self, combinations: List[tuple]) -> None:
+        """
+        Encode the combinations with the preprocessor and store their templates.
+
+        Args:
+            combinations (List[tuple]): New category combinations, in the order of categorical_columns.
+        """
+        # The encoders learned the missing values as NaN, None would be an unknown category
+        frame = pd.DataFrame(combinations, columns=self.categorical_columns, dtype=object).fillna(np.nan)
+        for column in self.numerical_columns:
+            frame[column] = 0.0
+        encoded = self.preprocessor.transform(frame)
+        encoded = encoded.toarray() if sparse.issparse(encoded) else np.asarray(encoded)
+        encoded[:, self.numerical_positions] = 0
+
+        self.dtype = encoded.dtype
+        first_index = len(self.templates)
+        self.templates = np.vstack([self.templates.astype(self.dtype, copy=False), encoded])
+        for offset, combination in enumerate(combinations):
+            self.template_index[combination] = first_index + offset
+
+    def transform(self, X: pd.DataFrame) -> object:
+        """
+        Encode the rows like preprocessor.transform does.
+
+        Args:
+            X (pd.DataFrame): The rows, with the columns of ShippingData.get_input_data_frame.
+
+        Returns:
+            object: The encoded rows, sparse when the preprocessor output is.
+        """
+        try:
+            # Column by column numpy arrays, selecting sub frames costs more than the encoding
+            keys = [
+                tuple(self.normalise(value) for value in row)
+                for row in zip(*[X[column].to_numpy() for column in self.categorical_columns])
+            ]
+            missing = list(dict.fromkeys(key for key in keys if key not in self.template_index))
+            if missing:
+                with self._lock:
+                    missing = [key for key in missing if key not in self.template_index]
+                    if len(self.template_index) + len(missing) > TEMPLATE_ENCODER_MAX_TEMPLATES:
+                        return self.preprocessor.transform(X)
+                    if missing:
+                        self.add_templates(missing)
+
+            rows = self.templates[[self.template_index[key] for key in keys]]
+            numerical = np.column_stack([X[column].to_numpy(dtype=np.float64) for column in self.numerical_columns])
+            if self.mean is not None:
+                numerical = numerical - self.mean
+            if self.scale is not None:
+                numerical = numerical / self.scale
+            rows[:, self.numerical_positions] = numerical
+
+            if self.preprocessor.sparse_output_:
+                return sparse.csr_matrix(rows)
+            return rows
+        except Exception as e:
+            raise ShipmentException(e, sys)
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+from from_root import from_root
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from shipment.components.cost_model import CostModel
+from shipment.constant import SCHEMA_FILE_PATH, SHIPPING_DATA_FIELDS
+from shipment.utils.main_utils import MainUtils
+
+
+@pytest.fixture(scope="session")
+def shipping_rows():
+    """Complete rows of the train set, in the object columns of ShippingData.get_input_data_frame, and their cost."""
+    df = pd.read_csv(from_root("data", "train.csv")).dropna(subset=list(SHIPPING_DATA_FIELDS.values()))
+    df = df.head(1000).reset_index(drop=True)
+    return df[list(SHIPPING_DATA_FIELDS.values())].astype(object), df["Cost"]
+
+
+@pytest.fixture(scope="session")
+def cost_model(shipping_rows):
+    """A CostModel of a small random forest, with a one hot and standard scaling preprocessor."""
+    X, y = shipping_rows
+    numerical_columns = MainUtils().read_yaml_file(filename=str(from_root(SCHEMA_FILE_PATH)))["numerical_columns"]
+    categorical_columns = [column for column in X if column not in numerical_columns]
+    preprocessor = ColumnTransformer([
+        ("OneHotEncoder", OneHotEncoder(handle_unknown="ignore"), categorical_columns),
+        ("StandardScaler", StandardScaler(), numerical_columns),
+    ])
+    features = preprocessor.fit_transform(X)
+    estimator = RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0).fit(features, y)
+    return CostModel(preprocessor, estimator)
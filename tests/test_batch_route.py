@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import numpy as np
+import pytest
+from from_root import from_root
+from numpy.testing import assert_allclose
+
+from shipment.components.model_predictor import CostPredictor
+from shipment.constant import ARROW_STREAM_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, SCHEMA_FILE_PATH, SHIPPING_DATA_FIELDS
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.schema_validator import RequestValidator
+from tests.test_model_predictor import FakeS3
+
+
+@pytest.fixture
+def request_validator():
+    return RequestValidator(MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH))
+
+
+def get_columns(rows):
+    return {column: rows[column].to_numpy() for column in rows.columns}
+
+
+def test_valid_columns_give_the_request_frame(request_validator, shipping_rows):
+    rows = shipping_rows[0].head(20)
+    columns = get_columns(rows)
+    for column in MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH)["numerical_columns"]:
+        columns[column] = columns[column].astype(np.float64)
+
+    cost_df, errors = request_validator.validate_columns(columns)
+
+    assert errors == []
+    assert list(cost_df.columns) == list(SHIPPING_DATA_FIELDS.values())
+    assert_allclose(cost_df["Height"].to_numpy(), rows["Height"].to_numpy(dtype=np.float64))
+    assert cost_df["Material"].tolist() == rows["Material"].tolist()
+
+
+def test_invalid_rows_listed_by_column(request_validator, shipping_rows):
+    columns = get_columns(shipping_rows[0].head(20))
+    columns["Height"] = columns["Height"].copy()
+    columns["Height"][[3, 7]] = ["tall", -1.0]
+    columns["Transport"] = columns["Transport"].copy()
+    columns["Transport"][5] = "Railways"
+
+    cost_df, errors = request_validator.validate_columns(columns)
+
+    assert cost_df is None
+    assert {(error["column"], tuple(error["rows"])) for error in errors} == {
+        ("Height", (3,)), ("Height", (7,)), ("Transport", (5,)),
+    }
+
+
+def test_columns_of_different_lengths_are_rejected(request_validator, shipping_rows):
+    columns = get_columns(shipping_rows[0].head(20))
+    columns["Height"] = columns["Height"][:10]
+
+    cost_df, errors = request_validator.validate_columns(columns)
+
+    assert cost_df is None
+    assert errors[0]["error"] == "columns of different lengths [10, 20]"
+
+
+@pytest.fixture
+def serving_app(monkeypatch):
+    import app
+
+    # The app serves its static files from the project root
+    monkeypatch.chdir(from_root())
+    CostPredictor._served = None
+    serving_app = app.create_app(include_training=False)
+    app.cost_predictor.s3 = FakeS3()
+    yield serving_app
+    CostPredictor._served = None
+
+
+def post_batch(serving_app, body, media_type):
+    async def send_request():
+        transport = httpx.ASGITransport(app=serving_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/predict/batch", content=body, headers={"content-type": media_type})
+
+    return asyncio.run(send_request())
+
+
+def test_unsupported_media_type_answered_with_415(serving_app):
+    assert post_batch(serving_app, b"{}", "application/json").status_code == 415
+
+
+def encode_columns(rows, media_type):
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        pa = pytest.importorskip("pyarrow")
+        table = pa.Table.from_pandas(rows, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    msgpack = pytest.importorskip("msgpack")
+    return msgpack.packb({column: rows[column].tolist() for column in rows.columns})
+
+
+def decode_predictions(body, media_type):
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        import pyarrow as pa
+
+        return pa.ipc.open_stream(pa.py_buffer(body)).read_all().column(0).to_numpy()
+    import msgpack
+
+    return np.asarray(next(iter(msgpack.unpackb(body).values())))
+
+
+@pytest.mark.parametrize("media_type", [ARROW_STREAM_MEDIA_TYPE, MSGPACK_MEDIA_TYPE])
+def test_batch_answered_in_the_request_format(serving_app, shipping_rows, media_type):
+    rows = shipping_rows[0].head(20).infer_objects()
+    body = encode_columns(rows, media_type)
+
+    response = post_batch(serving_app, body, media_type)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    # FakeS3 serves a model predicting 1.0 for every row
+    assert_allclose(decode_predictions(response.content, media_type), np.ones(len(rows)))
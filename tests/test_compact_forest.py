@@ -0,0 +1,62 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy import sparse
+from sklearn.ensemble import RandomForestRegressor
+
+from shipment.utils.compact_forest import CompactForest, compact_forest_with_report, select_trees
+
+
+def test_predictions_equal_the_forest(cost_model, shipping_rows):
+    forest = cost_model.trained_model_object
+    features = cost_model.preprocessing_object.transform(shipping_rows[0])
+    compact_forest = CompactForest.from_forest(forest)
+    dense_features = features.toarray() if sparse.issparse(features) else features
+
+    assert compact_forest.n_trees == len(forest.estimators_)
+    assert_allclose(compact_forest.predict(dense_features), forest.predict(dense_features), rtol=1e-5)
+    assert_allclose(compact_forest.predict(sparse.csr_matrix(dense_features)), forest.predict(dense_features), rtol=1e-5)
+
+
+def test_missing_values_follow_the_forest():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 4))
+    y = X[:, 0] + 2 * X[:, 1] + rng.normal(scale=0.1, size=500)
+    X[rng.random(X.shape) < 0.2] = np.nan
+    forest = RandomForestRegressor(n_estimators=5, max_depth=5, random_state=0).fit(X, y)
+
+    assert_allclose(CompactForest.from_forest(forest).predict(X), forest.predict(X), rtol=1e-5, atol=1e-6)
+
+
+def test_kept_trees_average_their_predictions(cost_model, shipping_rows):
+    forest = cost_model.trained_model_object
+    features = cost_model.preprocessing_object.transform(shipping_rows[0])
+    tree_indices = [1, 4, 7]
+
+    expected = np.mean([forest.estimators_[index].predict(features) for index in tree_indices], axis=0)
+    assert_allclose(CompactForest.from_forest(forest, tree_indices).predict(features), expected, rtol=1e-5)
+
+
+def test_select_trees_stops_within_tolerance():
+    rng = np.random.default_rng(0)
+    # Ten noisy copies of the same tree, a few of them are enough
+    tree_predictions = rng.normal(size=(200, 1)) + rng.normal(scale=0.01, size=(200, 10))
+
+    selected = select_trees(tree_predictions, tolerance=0.05)
+
+    assert 1 <= len(selected) < 10
+    assert len(set(selected)) == len(selected)
+    deviation = tree_predictions[:, selected].mean(axis=1) - tree_predictions.mean(axis=1)
+    assert np.sqrt((deviation ** 2).mean()) <= 0.05 * tree_predictions.mean(axis=1).std()
+
+
+def test_pruned_forest_report(cost_model, shipping_rows):
+    X, y = shipping_rows
+    features = cost_model.preprocessing_object.transform(X)
+
+    compact_forest, report = compact_forest_with_report(cost_model.trained_model_object, features, y, prune_tolerance=0.2)
+
+    assert report["n_trees_kept"] == compact_forest.n_trees <= report["n_trees"]
+    assert report["compact_node_bytes"] < report["forest_node_bytes"]
+    assert_allclose(report["max_abs_prediction_delta"], np.abs(
+        compact_forest.predict(features) - cost_model.trained_model_object.predict(features)
+    ).max())
@@ -0,0 +1,115 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from benchmarks.stand_ins import LocalMongoOperation
+from shipment.components.data_ingestion import DataIngestion
+from shipment.configuration.mongo_operations import MongoDBOperation
+from shipment.entity.config_entity import DataIngestionConfig
+from shipment.exception import ShipmentException
+
+FAKE_DB_URL = "mongodb://fake-host"
+
+WINDOW_CONFIG = {
+    "window": {"date_column": "Scheduled Date", "months": 12, "end": date(2019, 1, 1)},
+    "filters": {"Transport": ["Airways", "Roadways"]},
+    "ensure_indexes": True,
+    "require_index": True,
+}
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def batch_size(self, size):
+        return iter(self.documents)
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.indexes = []
+        self.queries = []
+
+    def create_index(self, keys):
+        self.indexes.append(keys)
+        return "_".join(f"{key}_{direction}" for key, direction in keys)
+
+    def find(self, query, projection):
+        self.queries.append(query)
+        return FakeCursor(self.documents)
+
+
+class FakeDatabase:
+    def __init__(self, collection, winning_plan):
+        self.collection = collection
+        self.winning_plan = winning_plan
+
+    def __getitem__(self, collection_name):
+        return self.collection
+
+    def command(self, command):
+        return {"queryPlanner": {"winningPlan": self.winning_plan}}
+
+
+class FakeClient:
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, db_name):
+        return self.database
+
+
+@pytest.fixture
+def ship_df():
+    return pd.read_csv("data/train.csv")
+
+
+def get_data_ingestion(mongo_op):
+    data_ingestion_config = DataIngestionConfig()
+    data_ingestion_config.INGESTION_CONFIG = WINDOW_CONFIG
+    return DataIngestion(data_ingestion_config, mongo_op)
+
+
+def get_window_df(ship_df):
+    scheduled_dates = pd.to_datetime(ship_df["Scheduled Date"], format="%m/%d/%y")
+    in_window = (scheduled_dates >= datetime(2018, 1, 1)) & (scheduled_dates < datetime(2019, 1, 1))
+    return ship_df[in_window & ship_df["Transport"].isin(["Airways", "Roadways"])]
+
+
+def get_fake_collection(monkeypatch, documents, winning_plan):
+    collection = FakeCollection(documents)
+    monkeypatch.setitem(MongoDBOperation._clients, FAKE_DB_URL, FakeClient(FakeDatabase(collection, winning_plan)))
+    return collection
+
+
+def test_window_pulled_through_index(monkeypatch, ship_df):
+    window_df = get_window_df(ship_df)
+    winning_plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    collection = get_fake_collection(monkeypatch, window_df.to_dict("records"), winning_plan)
+
+    df = get_data_ingestion(MongoDBOperation(FAKE_DB_URL)).get_data_from_mongodb()
+
+    assert collection.indexes == [[("Transport", 1), ("Scheduled Date", 1)]]
+    assert collection.queries == [{
+        "Scheduled Date": {"$gte": datetime(2018, 1, 1), "$lt": datetime(2019, 1, 1)},
+        "Transport": {"$in": ["Airways", "Roadways"]},
+    }]
+    assert len(df) == len(window_df)
+
+
+def test_collection_scan_stops_before_the_pull(monkeypatch, ship_df):
+    collection = get_fake_collection(monkeypatch, ship_df.to_dict("records"), {"stage": "COLLSCAN"})
+
+    with pytest.raises(ShipmentException, match="not served by an index"):
+        get_data_ingestion(MongoDBOperation(FAKE_DB_URL)).get_data_from_mongodb()
+    assert collection.queries == []
+
+
+def test_stand_in_applies_the_query(ship_df):
+    df = get_data_ingestion(LocalMongoOperation(ship_df)).get_data_from_mongodb()
+
+    assert len(df) == len(get_window_df(ship_df))
+    assert set(df["Transport"].dropna()) <= {"Airways", "Roadways"}
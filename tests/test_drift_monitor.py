@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from shipment.monitoring.drift_monitor import DriftMonitor, build_reference_profile
+
+NUMERICAL_COLUMNS = ["Weight"]
+CATEGORICAL_COLUMNS = ["Transport"]
+
+
+def get_reference_profile():
+    rng = np.random.default_rng(0)
+    reference_df = pd.DataFrame({
+        "Weight": rng.normal(100, 10, 5000),
+        "Transport": rng.choice(["Airways", "Roadways", "Waterways"], 5000),
+    })
+    return build_reference_profile(reference_df, NUMERICAL_COLUMNS, CATEGORICAL_COLUMNS)
+
+
+def get_columns(n_rows, weight_mean, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        "Weight": rng.normal(weight_mean, 10, n_rows),
+        "Transport": rng.choice(["Airways", "Roadways", "Waterways"], n_rows),
+    }
+
+
+def test_same_distribution_does_not_drift():
+    drift_monitor = DriftMonitor(get_reference_profile(), check_interval=500, min_samples=200)
+    drift_monitor.update_columns(get_columns(1000, 100, seed=1))
+
+    status = drift_monitor.check()
+    assert status["psi"]["Weight"] < drift_monitor.psi_threshold
+    assert not status["dataset_drift"]
+
+
+def test_shifted_sample_crosses_the_threshold():
+    drift_monitor = DriftMonitor(get_reference_profile(), check_interval=500, min_samples=200)
+    drift_monitor.update_columns(get_columns(1000, 130, seed=1))
+
+    status = drift_monitor.check()
+    assert status["psi"]["Weight"] > drift_monitor.psi_threshold
+    assert status["drifted_columns"] == ["Weight"]
+
+
+def test_recent_drift_shows_after_a_long_history():
+    drift_monitor = DriftMonitor(get_reference_profile(), check_interval=500, min_samples=200)
+    for seed in range(40):
+        drift_monitor.update_columns(get_columns(500, 100, seed=seed))
+    assert not drift_monitor.check()["dataset_drift"]
+
+    for seed in range(3):
+        drift_monitor.update_columns(get_columns(500, 130, seed=100 + seed))
+    assert drift_monitor.check()["drifted_columns"] == ["Weight"]
+
+
+def test_single_records_feed_the_sketches():
+    drift_monitor = DriftMonitor(get_reference_profile(), check_interval=10 ** 6, min_samples=1)
+    drift_monitor.update({"Weight": [95.0, None, "x"], "Transport": ["Airways", "", None]})
+
+    assert drift_monitor.numeric_sketches["Weight"].count == 1
+    assert drift_monitor.numeric_sketches["Weight"].invalid == 2
+    assert drift_monitor.categorical_sketches["Transport"].count == 1
@@ -0,0 +1,82 @@
+from itertools import combinations
+from math import factorial
+
+import numpy as np
+from numpy.testing import assert_allclose
+from sklearn.ensemble import RandomForestRegressor
+
+from shipment.constant import SHIPPING_DATA_FIELDS
+from shipment.utils.compact_forest import CompactForest
+from shipment.utils.explainer import CostExplainer, ForestTreeShap
+
+
+def get_conditional_expectation(tree, x, known_features, node=0):
+    """Prediction of a tree given the known features only, the others averaged by the node covers."""
+    left, right = tree.children_left[node], tree.children_right[node]
+    if left == -1:
+        return tree.value[node, 0, 0]
+    if tree.feature[node] in known_features:
+        child = left if x[tree.feature[node]] <= tree.threshold[node] else right
+        return get_conditional_expectation(tree, x, known_features, child)
+    return (
+        tree.weighted_n_node_samples[left] * get_conditional_expectation(tree, x, known_features, left)
+        + tree.weighted_n_node_samples[right] * get_conditional_expectation(tree, x, known_features, right)
+    ) / tree.weighted_n_node_samples[node]
+
+
+def get_exact_shap_values(forest, x):
+    """Shapley values of the forest's conditional expectations, summed over every subset of features."""
+    n_features = forest.n_features_in_
+
+    def value(known_features):
+        return np.mean([get_conditional_expectation(tree.tree_, x, known_features) for tree in forest.estimators_])
+
+    shap_values = np.zeros(n_features)
+    for feature in range(n_features):
+        others = [other for other in range(n_features) if other != feature]
+        for size in range(n_features):
+            weight = factorial(size) * factorial(n_features - size - 1) / factorial(n_features)
+            for subset in combinations(others, size):
+                shap_values[feature] += weight * (value(set(subset) | {feature}) - value(set(subset)))
+    return shap_values
+
+
+def test_forest_tree_shap_equals_the_exact_shapley_values():
+    rng = np.random.default_rng(0)
+    # float32 values, compared with the thresholds like the trees compare them
+    X = rng.normal(size=(300, 4)).astype(np.float32).astype(np.float64)
+    y = X[:, 0] * X[:, 1] + X[:, 2] + rng.normal(scale=0.1, size=300)
+    forest = RandomForestRegressor(n_estimators=3, max_depth=4, random_state=0).fit(X, y)
+
+    shap_values, expected_value = ForestTreeShap(CompactForest.from_forest(forest)).shap_values(X[:5])
+
+    assert_allclose(
+        expected_value,
+        np.mean([get_conditional_expectation(tree.tree_, X[0], set()) for tree in forest.estimators_]),
+        rtol=1e-5,
+    )
+    for row, x in enumerate(X[:5]):
+        assert_allclose(shap_values[row], get_exact_shap_values(forest, x), atol=1e-5)
+
+
+def test_contributions_and_base_value_sum_to_the_prediction(cost_model, shipping_rows):
+    X = shipping_rows[0].head(50)
+
+    explanations = CostExplainer(cost_model, model_version="v1").explain(X)
+
+    predictions = cost_model.predict(X)
+    for explanation, prediction in zip(explanations, predictions):
+        assert list(explanation["contributions"]) == list(SHIPPING_DATA_FIELDS)
+        assert_allclose(explanation["base_value"] + sum(explanation["contributions"].values()), prediction, rtol=1e-5)
+        assert_allclose(explanation["prediction"], prediction, rtol=1e-5)
+
+
+def test_cached_explanations_are_reused(cost_model, shipping_rows):
+    X = shipping_rows[0].head(5)
+    explainer = CostExplainer(cost_model, model_version="v1")
+    first = explainer.explain(X)
+
+    def transform(rows):
+        raise AssertionError("A cached row was encoded again")
+
+    assert explainer.explain(X, transform=transform) == first
@@ -0,0 +1,74 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from shipment.logger import (
+    PACKAGE_PARENT_DIR,
+    AsyncQueueHandler,
+    JsonFormatter,
+    LazyFileHandler,
+    ModuleLevelFilter,
+    SamplingFilter,
+    parse_module_levels,
+)
+
+
+def make_record(level, module="shipment.components.model_predictor", message="Predicted %d rows", args=(3,)):
+    pathname = os.path.join(PACKAGE_PARENT_DIR, *module.split(".")) + ".py"
+    return logging.LogRecord("root", level, pathname, 1, message, args, None)
+
+
+def test_parse_module_levels():
+    assert parse_module_levels(" shipment.utils=warning, shipment.components.model_predictor=DEBUG,") == {
+        "shipment.utils": logging.WARNING,
+        "shipment.components.model_predictor": logging.DEBUG,
+    }
+
+
+def test_most_specific_module_level_applies():
+    module_filter = ModuleLevelFilter(
+        {"shipment.components": logging.DEBUG, "shipment.components.model_predictor": logging.WARNING},
+        default_level=logging.INFO,
+    )
+
+    assert not module_filter.filter(make_record(logging.INFO))
+    assert module_filter.filter(make_record(logging.WARNING))
+    assert module_filter.filter(make_record(logging.DEBUG, module="shipment.components.model_trainer"))
+    assert not module_filter.filter(make_record(logging.DEBUG, module="shipment.utils.sweep"))
+
+
+def test_sampling_keeps_the_warnings():
+    sampling_filter = SamplingFilter(sample_rate=0.0)
+
+    assert not sampling_filter.filter(make_record(logging.INFO))
+    assert sampling_filter.filter(make_record(logging.WARNING))
+    assert sampling_filter.filter(make_record(logging.ERROR))
+
+
+def test_queued_records_written_as_json_lines(tmp_path):
+    log_file_path = tmp_path / "log" / "shipment.log"
+    file_handler = LazyFileHandler(str(log_file_path))
+    file_handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    assert not log_file_path.parent.exists()
+
+    listener.start()
+    queue_handler = AsyncQueueHandler(log_queue)
+    queue_handler.handle(make_record(logging.INFO))
+    try:
+        raise ValueError("bad row")
+    except ValueError:
+        record = make_record(logging.ERROR, message="Prediction failed", args=())
+        record.exc_info = sys.exc_info()
+        queue_handler.handle(record)
+    listener.stop()
+    file_handler.close()
+
+    records = [json.loads(line) for line in log_file_path.read_text().splitlines()]
+    assert [record["message"] for record in records] == ["Predicted 3 rows", "Prediction failed"]
+    assert records[0]["level"] == "INFO"
+    assert "ValueError: bad row" in records[1]["exc_info"]
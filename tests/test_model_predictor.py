@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+
+from shipment.components.model_predictor import CostPredictor
+
+
+class ConstantModel:
+    preprocessing_object = None
+    reference_profile = None
+
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, X):
+        return [self.value] * len(X)
+
+
+class FakeFileObject:
+    def __init__(self, e_tag):
+        self.e_tag = f'"{e_tag}"'
+        self.size = 1
+
+
+class FakeS3:
+    def __init__(self):
+        self.e_tag = "v1"
+        self.model = ConstantModel(1.0)
+        self.n_loads = 0
+
+    def push(self, e_tag, model):
+        self.e_tag = e_tag
+        self.model = model
+
+    def get_file_object(self, filename, bucket_name):
+        return FakeFileObject(self.e_tag)
+
+    def load_model(self, model_name, bucket_name):
+        self.n_loads += 1
+        return self.model
+
+
+@pytest.fixture
+def fake_s3():
+    CostPredictor._served = None
+    CostPredictor._next_refresh_time = 0.0
+    yield FakeS3()
+    CostPredictor._served = None
+    CostPredictor._next_refresh_time = 0.0
+
+
+def get_cost_predictor(fake_s3, refresh_interval):
+    cost_predictor = CostPredictor(refresh_interval=refresh_interval)
+    cost_predictor.s3 = fake_s3
+    return cost_predictor
+
+
+def test_pushed_model_served_after_invalidation(fake_s3):
+    cost_predictor = get_cost_predictor(fake_s3, refresh_interval=3600)
+    X = pd.DataFrame({"Height": [1.0]})
+    assert cost_predictor.predict(X) == [1.0]
+
+    fake_s3.push("v2", ConstantModel(2.0))
+    assert cost_predictor.predict(X) == [1.0]
+
+    CostPredictor.invalidate_model()
+    assert cost_predictor.predict(X) == [2.0]
+    assert cost_predictor.model_version == "v2"
+
+
+def test_model_reloaded_only_when_etag_changes(fake_s3):
+    cost_predictor = get_cost_predictor(fake_s3, refresh_interval=0)
+    X = pd.DataFrame({"Height": [1.0]})
+    for _ in range(3):
+        cost_predictor.predict(X)
+    assert fake_s3.n_loads == 1
+
+    served = CostPredictor._served
+    fake_s3.push("v2", ConstantModel(2.0))
+    assert cost_predictor.predict(X) == [2.0]
+    assert fake_s3.n_loads == 2
+    assert CostPredictor._served is not served
@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import pytest
+from from_root import from_root
+
+from shipment.components.model_predictor import CostPredictor
+from shipment.constant import SCHEMA_FILE_PATH
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.schema_validator import RequestValidator
+from tests.test_model_predictor import FakeS3
+
+BASE_REQUEST = {
+    "artist": "0.26",
+    "height": "17.0",
+    "width": "6.0",
+    "weight": "4128.0",
+    "material": "Brass",
+    "priceOfSculpture": "13.91",
+    "baseShippingPrice": "16.27",
+    "international": "Yes",
+    "expressShipment": "Yes",
+    "installationIncluded": "No",
+    "transport": "Airways",
+    "fragile": "No",
+    "customerInformation": "Working Class",
+    "remoteLocation": "No",
+}
+
+
+@pytest.fixture
+def request_validator():
+    return RequestValidator(MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH))
+
+
+def get_failing_fields(errors):
+    return [error["field"] for error in errors]
+
+
+def test_valid_request_is_converted(request_validator):
+    input_data, errors = request_validator.validate(BASE_REQUEST)
+
+    assert errors == []
+    assert input_data["height"] == 17.0
+    assert input_data["material"] == "Brass"
+
+
+@pytest.mark.parametrize("field, value", [
+    ("height", "tall"),
+    ("height", "-1"),
+    ("artist", "inf"),
+    ("weight", ""),
+    ("material", "Paper"),
+    ("transport", None),
+])
+def test_invalid_value_names_its_field(request_validator, field, value):
+    input_data, errors = request_validator.validate({**BASE_REQUEST, field: value})
+
+    assert get_failing_fields(errors) == [field]
+    assert field not in input_data
+
+
+@pytest.mark.parametrize("value", [[1.0], {"value": 1.0}])
+def test_non_scalar_values_are_rejected(request_validator, value):
+    _, errors = request_validator.validate({**BASE_REQUEST, "height": value, "material": value})
+
+    assert get_failing_fields(errors) == ["height", "material"]
+    assert {error["error"] for error in errors} == {"value must be a scalar"}
+
+
+@pytest.fixture
+def serving_app(monkeypatch):
+    import app
+
+    # The app serves its static files from the project root
+    monkeypatch.chdir(from_root())
+    CostPredictor._served = None
+    serving_app = app.create_app(include_training=False)
+    app.cost_predictor.s3 = FakeS3()
+    yield serving_app
+    CostPredictor._served = None
+
+
+def post_json(serving_app, url, body):
+    async def send_request():
+        transport = httpx.ASGITransport(app=serving_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(url, json=body)
+
+    return asyncio.run(send_request())
+
+
+def test_invalid_request_answered_with_422(serving_app):
+    body = {"base": {**BASE_REQUEST, "height": [17.0]}, "sweep": {"weight": [100, 200]}}
+
+    response = post_json(serving_app, "/predict/sweep", body)
+
+    assert response.status_code == 422
+    assert get_failing_fields(response.json()["errors"]) == ["height"]
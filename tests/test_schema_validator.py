@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+from from_root import from_root
+
+from shipment.constant import SCHEMA_FILE_PATH
+from shipment.utils.main_utils import MainUtils
+from shipment.utils.schema_validator import SchemaValidator
+
+
+@pytest.fixture
+def schema_validator():
+    return SchemaValidator(MainUtils().read_yaml_file(filename=SCHEMA_FILE_PATH))
+
+
+@pytest.fixture
+def train_set():
+    return pd.read_csv(from_root("data", "train.csv"))
+
+
+def test_train_set_is_valid(schema_validator, train_set):
+    report = schema_validator.validate(train_set)
+
+    assert report.validation_status is True
+    assert report.failed_columns == []
+    assert report.n_rows == len(train_set)
+
+
+def test_invalid_values_fail_their_column(schema_validator, train_set):
+    df = train_set.copy()
+    df.loc[:9, "Artist Reputation"] = 5.0
+    df.loc[:4, "Transport"] = "Railways"
+    df["Height"] = df["Height"].astype(object)
+    df.loc[0, "Height"] = "tall"
+
+    report = schema_validator.validate(df)
+
+    assert report.validation_status is False
+    assert report.failed_columns == ["Artist Reputation", "Height", "Transport"]
+    assert report.columns["Artist Reputation"].n_out_of_range == 10
+    assert report.columns["Transport"].n_out_of_domain == 5
+    assert report.columns["Height"].n_invalid_type == 1
+
+
+def test_missing_column_fails_the_validation(schema_validator, train_set):
+    report = schema_validator.validate(train_set.drop(columns=["Weight"]))
+
+    assert report.failed_columns == ["Weight"]
+    assert report.columns["Weight"].errors == ["column is missing"]
+
+
+def test_chunks_validated_like_the_whole_frame(schema_validator, train_set):
+    chunked_report = schema_validator.validate(train_set.iloc[:2000], train_set.iloc[2000:])
+    whole_report = schema_validator.validate(train_set)
+
+    assert chunked_report.n_chunks == 2
+    assert chunked_report.to_dict()["columns"] == whole_report.to_dict()["columns"]
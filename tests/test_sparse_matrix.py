@@ -0,0 +1,44 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy import sparse
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+
+from shipment.constant import FEATURE_DTYPE
+from shipment.utils.compact_forest import CompactForest
+from shipment.utils.sparse_matrix import estimator_input, to_feature_matrix
+
+FEATURES = np.array([[0.0, 1.5, 0.0], [2.0, 0.0, np.nan], [0.0, 0.0, 3.0]])
+
+
+def test_feature_matrix_from_dense_and_sparse():
+    for features in (FEATURES, sparse.csc_matrix(FEATURES)):
+        matrix = to_feature_matrix(features)
+
+        assert sparse.isspmatrix_csr(matrix)
+        assert matrix.dtype == FEATURE_DTYPE
+        assert matrix.nnz == 4
+        assert_allclose(matrix.toarray(), FEATURES.astype(FEATURE_DTYPE))
+
+
+def test_feature_matrix_drops_explicit_zeros():
+    matrix = sparse.csr_matrix(([0.0, 1.0], ([0, 1], [0, 1])), shape=(2, 2))
+
+    assert to_feature_matrix(matrix).nnz == 1
+
+
+def test_sparse_features_kept_for_the_estimators_reading_them():
+    X = to_feature_matrix(np.nan_to_num(FEATURES))
+    forest = RandomForestRegressor(n_estimators=2, random_state=0).fit(X, [1.0, 2.0, 3.0])
+
+    assert estimator_input(forest, X) is X
+    assert estimator_input(CompactForest.from_forest(forest), X) is X
+
+
+def test_dense_features_for_the_other_estimators():
+    X = to_feature_matrix(FEATURES)
+    forest = RandomForestRegressor(n_estimators=2, random_state=0).fit(np.nan_to_num(FEATURES), [1.0, 2.0, 3.0])
+
+    # The sklearn trees only handle missing values in dense input
+    assert isinstance(estimator_input(forest, X), np.ndarray)
+    assert isinstance(estimator_input(HistGradientBoostingRegressor(), X), np.ndarray)
+    assert estimator_input(forest, FEATURES) is FEATURES
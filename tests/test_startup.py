@@ -0,0 +1,64 @@
+import pickle
+
+import pandas as pd
+from from_root import from_root
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from benchmarks.bench_startup import (
+    get_training_only_modules,
+    measure_import,
+    measure_model_load,
+    measure_startup,
+    run_script,
+)
+from shipment.components.cost_model import CostModel
+
+# Seconds the import of the serving entry point may take on a cold interpreter
+SERVE_IMPORT_SECONDS_BUDGET = 5.0
+
+
+def test_serve_import_leaves_out_training_modules():
+    result = measure_import("serve", str(from_root()))
+
+    assert get_training_only_modules(result["modules"]) == []
+    assert result["seconds"] < SERVE_IMPORT_SECONDS_BUDGET
+
+
+def test_import_leaves_app_and_logging_to_startup():
+    result = run_script(
+        "import json, app, serve\n"
+        "from shipment import logger\n"
+        "print(json.dumps({'app_created': app.cost_predictor is not None, "
+        "'logging_configured': logger.log_listener is not None}))",
+        str(from_root()),
+    )
+
+    assert result["app_created"] is False
+    assert result["logging_configured"] is False
+
+
+def test_serving_app_leaves_out_training_modules():
+    result = measure_startup("serve", "create_serving_app", str(from_root()))
+
+    assert get_training_only_modules(result["modules"]) == []
+
+
+def test_model_load_leaves_out_training_modules(tmp_path):
+    df = pd.read_csv(from_root("data", "train.csv")).head(200).dropna(subset=["Height", "Width", "Transport"])
+    numerical_columns, onehot_columns = ["Height", "Width"], ["Transport"]
+    preprocessor = ColumnTransformer([
+        ("OneHotEncoder", OneHotEncoder(handle_unknown="ignore"), onehot_columns),
+        ("StandardScaler", StandardScaler(), numerical_columns),
+    ])
+    X = preprocessor.fit_transform(df[onehot_columns + numerical_columns])
+    estimator = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, df["Cost"])
+    model_file_path = tmp_path / "model.pkl"
+    model_file_path.write_bytes(pickle.dumps(CostModel(preprocessor, estimator)))
+
+    result = measure_model_load(str(model_file_path), str(from_root()))
+
+    assert "shipment.components.cost_model" in result["modules"]
+    assert get_training_only_modules(result["modules"]) == []
+    assert "shipment.components.model_trainer" not in result["modules"]
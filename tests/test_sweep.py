@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from shipment.components.model_predictor import CostPredictor, ShippingData
+from shipment.constant import SHIPPING_DATA_FIELDS
+from shipment.utils.sweep import SweepEncoder, get_grid_frame
+from tests.test_model_predictor import FakeS3
+
+SWEEP = {"Weight": [100.0, 500.0, 2000.0], "Transport": ["Airways", "Roadways", "Waterways"]}
+
+
+def get_axes(base, sweep):
+    axes = {}
+    for column, values in sweep.items():
+        axis = base.iloc[np.zeros(len(values), dtype=np.intp)].reset_index(drop=True)
+        axis[column] = values
+        axes[column] = axis
+    return axes
+
+
+def get_individual_predictions(cost_model, base, sweep):
+    predictions = np.empty([len(values) for values in sweep.values()])
+    for weight_index, weight in enumerate(sweep["Weight"]):
+        for transport_index, transport in enumerate(sweep["Transport"]):
+            row = base.copy()
+            row["Weight"], row["Transport"] = weight, transport
+            predictions[weight_index, transport_index] = cost_model.predict(row)[0]
+    return predictions
+
+
+def test_grid_frame_sets_every_combination(shipping_rows):
+    base = shipping_rows[0].head(1)
+
+    grid = get_grid_frame(base, get_axes(base, SWEEP))
+
+    assert list(zip(grid["Weight"], grid["Transport"])) == [
+        (weight, transport) for weight in SWEEP["Weight"] for transport in SWEEP["Transport"]
+    ]
+    assert (grid["Material"] == base["Material"].iloc[0]).all()
+
+
+def test_sweep_encoder_equals_the_individual_predictions(cost_model, shipping_rows):
+    base = shipping_rows[0].head(1)
+
+    transformed_feature = SweepEncoder(cost_model.preprocessing_object).transform(base, get_axes(base, SWEEP))
+
+    predictions = np.asarray(cost_model.predict_transformed(transformed_feature)).reshape(3, 3)
+    assert_allclose(predictions, get_individual_predictions(cost_model, base, SWEEP))
+
+
+@pytest.fixture
+def cost_predictor(cost_model):
+    CostPredictor._served = None
+    fake_s3 = FakeS3()
+    fake_s3.model = cost_model
+    cost_predictor = CostPredictor()
+    cost_predictor.s3 = fake_s3
+    yield cost_predictor
+    CostPredictor._served = None
+
+
+def test_predictor_sweep_equals_the_individual_predictions(cost_predictor, cost_model, shipping_rows):
+    base = shipping_rows[0].head(1)
+    form_data = {field: str(base[column].iloc[0]) for field, column in SHIPPING_DATA_FIELDS.items()}
+    input_data, errors = cost_predictor.validate_request(form_data)
+    assert errors == []
+
+    axes, errors = cost_predictor.validate_sweep(input_data, {"weight": SWEEP["Weight"], "transport": SWEEP["Transport"]})
+    assert errors == []
+
+    predictions = cost_predictor.sweep(ShippingData(**input_data).get_input_data_frame(), axes)
+    assert_allclose(predictions, get_individual_predictions(cost_model, base, SWEEP))
@@ -0,0 +1,29 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy import sparse
+
+from shipment.utils.template_encoder import TemplateEncoder
+
+
+def to_dense(features):
+    return features.toarray() if sparse.issparse(features) else np.asarray(features)
+
+
+def test_transform_equals_the_preprocessor(cost_model, shipping_rows):
+    X = shipping_rows[0].head(200)
+    preprocessor = cost_model.preprocessing_object
+
+    assert TemplateEncoder.supports(preprocessor)
+    assert_allclose(to_dense(TemplateEncoder(preprocessor).transform(X)), to_dense(preprocessor.transform(X)))
+
+
+def test_unseen_combinations_equal_the_preprocessor(cost_model, shipping_rows):
+    X = shipping_rows[0].head(3).copy()
+    X.loc[0, "Material"] = None
+    X.loc[1, "Transport"] = "Railways"
+    preprocessor = cost_model.preprocessing_object
+    encoder = TemplateEncoder(preprocessor)
+    n_templates = len(encoder.template_index)
+
+    assert_allclose(to_dense(encoder.transform(X)), to_dense(preprocessor.transform(X)))
+    assert len(encoder.template_index) == n_templates + 2